@@ -8,22 +8,64 @@
 
 #define SERVICE_UUID        "4fafc201-1fb5-459e-8fcc-c5c9c331914b"
 #define CHARACTERISTIC_UUID "beb5483e-36e1-4688-b7f5-ea07361b26a8"
+// Reporting config written by the hub (sensor_frame.encode_config)
+#define CONFIG_CHARACTERISTIC_UUID "beb5483f-36e1-4688-b7f5-ea07361b26a8"
 
 #define GREEN_LED 42
 #define YELLOW_LED 41
 #define RED_LED 40
 #define BUZZER 9
 
+// 1 = compact binary frames (decoded by sensor_frame.py on the hub), 0 = legacy JSON
+#define USE_BINARY_FRAME 1
+// Readings buffered per notification when sending binary frames
+#define READINGS_PER_NOTIFY 1
+
+#define FRAME_MAGIC 0xA5
+#define FRAME_VERSION 1
+#define FRAME_HEADER_SIZE 4
+#define FRAME_READING_SIZE 20
+#define FIELD_COUNT 8
+
+// Config layout: magic, version, interval (ms, uint16), heartbeat (s, uint16),
+// one uint8 deadband per field in frame units, in frame order
+#define CONFIG_MAGIC 0xC5
+#define CONFIG_VERSION 1
+#define CONFIG_SIZE (6 + FIELD_COUNT)
+
+#define SAMPLE_INTERVAL_MS 1000
+
 SensirionI2CSen5x sen5x;
 BLEServer* pServer = nullptr;
 BLEService* pService = nullptr;
 BLECharacteristic* pCharacteristic = nullptr;
+BLECharacteristic* pConfigCharacteristic = nullptr;
 BLEAdvertising* pAdvertising = nullptr;
 bool deviceConnected = false;
 
 unsigned long badStartTime = 0;
 bool buzzerOn = false;
 
+uint8_t frame[FRAME_HEADER_SIZE + READINGS_PER_NOTIFY * FRAME_READING_SIZE];
+uint8_t frameReadings = 0;
+
+// A reading is sent once reportIntervalMs has passed since the last one sent and a field
+// moved by at least its deadband, or once heartbeatSeconds have passed regardless.
+// The defaults send every reading, as before the hub could configure reporting.
+uint16_t reportIntervalMs = 0;
+uint16_t heartbeatSeconds = 0;
+uint8_t deadbands[FIELD_COUNT] = {0};
+
+uint16_t lastSent[FIELD_COUNT];
+bool haveLastSent = false;
+unsigned long lastSentAt = 0;
+
+// Written from the BLE task, applied in loop()
+uint8_t pendingConfig[CONFIG_SIZE];
+volatile bool configPending = false;
+volatile bool configReset = false;
+volatile bool configRepublish = false;
+
 class MyServerCallbacks: public BLEServerCallbacks {
     void onConnect(BLEServer* pServer) {
       deviceConnected = true;
@@ -32,6 +74,7 @@ class MyServerCallbacks: public BLEServerCallbacks {
 
     void onDisconnect(BLEServer* pServer) {
       deviceConnected = false;
+      configReset = true;
       Serial.println("Client disconnected from sensor");
       delay(500);
       pServer->getAdvertising()->start();
@@ -39,6 +82,19 @@ class MyServerCallbacks: public BLEServerCallbacks {
     }
 };
 
+class ConfigCallbacks: public BLECharacteristicCallbacks {
+    void onWrite(BLECharacteristic* characteristic) {
+      uint8_t* data = characteristic->getData();
+      if (characteristic->getLength() != CONFIG_SIZE || data[0] != CONFIG_MAGIC || data[1] != CONFIG_VERSION) {
+        Serial.println("Ignoring malformed reporting config");
+        configRepublish = true;
+        return;
+      }
+      memcpy(pendingConfig, data, CONFIG_SIZE);
+      configPending = true;
+    }
+};
+
 void setup() {
   Serial.begin(115200);
 
@@ -79,6 +135,13 @@ void setup() {
 
   pCharacteristic->addDescriptor(new BLE2902());
   pCharacteristic->setValue("Waiting...");
+
+  pConfigCharacteristic = pService->createCharacteristic(
+    CONFIG_CHARACTERISTIC_UUID,
+    BLECharacteristic::PROPERTY_WRITE | BLECharacteristic::PROPERTY_READ
+  );
+  pConfigCharacteristic->setCallbacks(new ConfigCallbacks());
+  publishConfig();
   pService->start();
 
   pAdvertising = BLEDevice::getAdvertising();
@@ -142,6 +205,130 @@ void updateIndicators(float pm2_5, float humidity) {
   }
 }
 
+void putU16(uint8_t* out, uint16_t value) {
+  out[0] = value & 0xFF;
+  out[1] = value >> 8;
+}
+
+void putU32(uint8_t* out, uint32_t value) {
+  for (int i = 0; i < 4; i++) {
+    out[i] = (value >> (8 * i)) & 0xFF;
+  }
+}
+
+// PM values: uint16 x10, 0xFFFF when unavailable
+uint16_t scalePm(float value) {
+  if (isnan(value)) return 0xFFFF;
+  float scaled = value * 10.0f + 0.5f;
+  if (scaled < 0) return 0;
+  if (scaled > 65534) return 65534;
+  return (uint16_t)scaled;
+}
+
+// Signed values: int16 x scale, 0x7FFF when unavailable
+uint16_t scaleSigned(float value, float scale) {
+  if (isnan(value)) return 0x7FFF;
+  float scaled = value * scale;
+  scaled += scaled < 0 ? -0.5f : 0.5f;
+  if (scaled < -32767) scaled = -32767;
+  if (scaled > 32766) scaled = 32766;
+  return (uint16_t)(int16_t)scaled;
+}
+
+// One reading in frame units and frame order
+void encodeReading(uint16_t* out, float pm1, float pm2p5, float pm4, float pm10,
+                   float hum, float temp, float voc, float nox) {
+  out[0] = scalePm(pm1);
+  out[1] = scalePm(pm2p5);
+  out[2] = scalePm(pm4);
+  out[3] = scalePm(pm10);
+  out[4] = scaleSigned(hum, 100.0f);
+  out[5] = scaleSigned(temp, 200.0f);
+  out[6] = scaleSigned(voc, 10.0f);
+  out[7] = scaleSigned(nox, 10.0f);
+}
+
+// Appends one encoded reading to the frame; returns true once the frame is full
+bool appendReading(const uint16_t* encoded) {
+  uint8_t* out = frame + FRAME_HEADER_SIZE + frameReadings * FRAME_READING_SIZE;
+  putU32(out, millis());
+  for (int i = 0; i < FIELD_COUNT; i++) {
+    putU16(out + 4 + 2 * i, encoded[i]);
+  }
+  frameReadings++;
+  return frameReadings >= READINGS_PER_NOTIFY;
+}
+
+// PM fields are unsigned, the rest signed; missing values compare as far from anything
+int32_t fieldValue(int field, uint16_t raw) {
+  return field < 4 ? (int32_t)raw : (int32_t)(int16_t)raw;
+}
+
+// Whether a reading is due under the reporting config (see the globals above)
+bool shouldReport(const uint16_t* encoded, unsigned long now) {
+  if (!haveLastSent) return true;
+  unsigned long since = now - lastSentAt;
+  if (heartbeatSeconds && since >= heartbeatSeconds * 1000UL) return true;
+  // Half a sample of slack so an interval that is a multiple of the sample period is kept
+  if (since + SAMPLE_INTERVAL_MS / 2 < reportIntervalMs) return false;
+  for (int i = 0; i < FIELD_COUNT; i++) {
+    if (abs(fieldValue(i, encoded[i]) - fieldValue(i, lastSent[i])) >= deadbands[i]) return true;
+  }
+  return false;
+}
+
+void markSent(const uint16_t* encoded, unsigned long now) {
+  memcpy(lastSent, encoded, sizeof(lastSent));
+  haveLastSent = true;
+  lastSentAt = now;
+}
+
+// Makes the config in force readable on the config characteristic
+void publishConfig() {
+  uint8_t config[CONFIG_SIZE];
+  config[0] = CONFIG_MAGIC;
+  config[1] = CONFIG_VERSION;
+  putU16(config + 2, reportIntervalMs);
+  putU16(config + 4, heartbeatSeconds);
+  memcpy(config + 6, deadbands, FIELD_COUNT);
+  pConfigCharacteristic->setValue(config, CONFIG_SIZE);
+}
+
+// Applies config writes and disconnects flagged by the BLE callbacks
+void updateConfig() {
+  if (configReset) {
+    configReset = false;
+    configPending = false;
+    reportIntervalMs = 0;
+    heartbeatSeconds = 0;
+    memset(deadbands, 0, sizeof(deadbands));
+    haveLastSent = false;
+    publishConfig();
+  }
+  if (configPending) {
+    configPending = false;
+    reportIntervalMs = pendingConfig[2] | (pendingConfig[3] << 8);
+    heartbeatSeconds = pendingConfig[4] | (pendingConfig[5] << 8);
+    memcpy(deadbands, pendingConfig + 6, FIELD_COUNT);
+    publishConfig();
+    Serial.printf("Reporting config: interval %u ms, heartbeat %u s\n", reportIntervalMs, heartbeatSeconds);
+  }
+  if (configRepublish) {
+    configRepublish = false;
+    publishConfig();
+  }
+}
+
+void sendFrame() {
+  frame[0] = FRAME_MAGIC;
+  frame[1] = FRAME_VERSION;
+  frame[2] = frameReadings;
+  frame[3] = 0;
+  pCharacteristic->setValue(frame, FRAME_HEADER_SIZE + frameReadings * FRAME_READING_SIZE);
+  pCharacteristic->notify();
+  frameReadings = 0;
+}
+
 void loop() {
   static bool lastConnectionState = false;
   if (deviceConnected != lastConnectionState) {
@@ -152,23 +339,41 @@ void loop() {
     }
     lastConnectionState = deviceConnected;
   }
+  updateConfig();
 
   float pm1, pm2p5, pm4, pm10, hum, temp, voc, nox;
   uint16_t err = sen5x.readMeasuredValues(pm1, pm2p5, pm4, pm10, hum, temp, voc, nox);
 
   if (!err && !isnan(temp) && !isnan(hum) && !isnan(pm2p5)) {
+    uint16_t encoded[FIELD_COUNT];
+    encodeReading(encoded, pm1, pm2p5, pm4, pm10, hum, temp, voc, nox);
+    unsigned long now = millis();
+    bool report = deviceConnected && shouldReport(encoded, now);
+    if (report) {
+      markSent(encoded, now);
+    }
+#if USE_BINARY_FRAME
+    if (report) {
+      if (appendReading(encoded)) {
+        sendFrame();
+      }
+    } else if (!deviceConnected) {
+      frameReadings = 0;
+    }
+#else
     String msg = "{\"T\":" + String(temp, 1) +
                  ",\"H\":" + String(hum, 1) +
                  ",\"P\":" + String(pm2p5, 1) + 
                  ",\"V\":" + String(voc, 2) + "}";
     
-    if (deviceConnected) {
+    if (report) {
       Serial.println("BLE: " + msg);
       pCharacteristic->setValue(msg.c_str());
       pCharacteristic->notify();
-    } else {
+    } else if (!deviceConnected) {
       Serial.println("Data ready but not connected: " + msg);
     }
+#endif
     
     updateIndicators(pm2p5, hum);
   } else {
@@ -176,5 +381,13 @@ void loop() {
     updateIndicators(999.0, 0.0);
   }
 
-  delay(1000);
+  // Sample on a fixed schedule, however long the read and notify took
+  static unsigned long nextSampleAt = millis();
+  nextSampleAt += SAMPLE_INTERVAL_MS;
+  long wait = (long)(nextSampleAt - millis());
+  if (wait > 0) {
+    delay(wait);
+  } else {
+    nextSampleAt = millis();
+  }
 }
\ No newline at end of file
@@ -1,10 +1,14 @@
 import asyncio
 import threading
-from flask import Flask, render_template_string, request
+from collections import deque
+from flask import Flask, Response, jsonify, request
 import json
 import os
 import signal
 
+from fetch_chart_js import CHART_JS_VERSION
+from sensor_frame import decode_payload
+
 # === CONFIGURATION ===
 SENSOR_NAME = "ESP32_SEN5x"
 SENSOR_CHAR_UUID = "beb5483e-36e1-4688-b7f5-ea07361b26a8"
@@ -13,14 +17,59 @@ ACTUATOR_CHAR_UUID = "a16beeb4-bf06-4c17-9cec-fbc82db1a016"
 
 target_humidity = 35  # HYSTERESIS VALUE
 dehumidifier_on = False
+HISTORY_SIZE = 100
+STREAM_KEEPALIVE = 15  # seconds between SSE comments on a quiet stream
+
+# Served from ./static (vendored by fetch_chart_js.py) so offline kiosks never need the
+# CDN; the CDN fallback is pinned to the same version
+CHART_JS_FILE = "chart.umd.min.js"
+CHART_JS_CDN = f"https://cdn.jsdelivr.net/npm/chart.js@{CHART_JS_VERSION}/dist/chart.umd.js"
 
-latest_data = {"T": 0.0, "H": 0.0, "P": 0.0, "history": []}
+# "seq" numbers samples; "version" also moves on control changes. Both only
+# change under data_changed, which wakes the control loop and the SSE streams.
+latest_data = {"T": 0.0, "H": 0.0, "P": 0.0, "seq": 0, "version": 0}
+history = deque(maxlen=HISTORY_SIZE)
 control_status = {"command": "NONE", "success": False}
+data_changed = threading.Condition()
 
 app = Flask(__name__)
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 24 * 60 * 60
+
+def record_sample(payload):
+    with data_changed:
+        latest_data["T"] = payload.get("T", 0.0)
+        latest_data["H"] = payload.get("H", 0.0)
+        latest_data["P"] = payload.get("P", 0.0)
+        latest_data["seq"] += 1
+        latest_data["version"] += 1
+        history.append({"seq": latest_data["seq"], "T": latest_data["T"], "H": latest_data["H"], "P": latest_data["P"]})
+        data_changed.notify_all()
+
+def set_control_status(command, success):
+    with data_changed:
+        control_status["command"] = command
+        control_status["success"] = success
+        latest_data["version"] += 1
+        data_changed.notify_all()
+
+def delta_since(seq):
+    """Readings, samples newer than seq and control status, for the page to apply in place"""
+    with data_changed:
+        return {
+            "seq": latest_data["seq"],
+            "version": latest_data["version"],
+            "T": latest_data["T"],
+            "H": latest_data["H"],
+            "P": latest_data["P"],
+            "samples": [sample for sample in history if sample["seq"] > seq],
+            "control": dict(control_status)
+        }
 
 try:
-    from bleak import BleakClient, BleakScanner
+    if os.environ.get("HUB_BLE_BACKEND") == "sim":
+        from sim_ble import BleakClient, BleakScanner
+    else:
+        from bleak import BleakClient, BleakScanner
 
     async def ble_sensor_loop():
         print("Scanning for sensor...")
@@ -33,18 +82,15 @@ try:
             print(f"Connected to {SENSOR_NAME}")
 
             def notification_handler(_, data):
+                # Binary frames (the firmware default) or legacy JSON, as in hub_bluetooth.py
                 try:
-                    decoded = data.decode()
-                    payload = json.loads(decoded)
-                    print("Data:", payload)
-                    latest_data["T"] = payload.get("T", 0.0)
-                    latest_data["H"] = payload.get("H", 0.0)
-                    latest_data["P"] = payload.get("P", 0.0)
-                    latest_data["history"].append(payload)
-                    if len(latest_data["history"]) > 100:
-                        latest_data["history"].pop(0)
+                    readings = decode_payload(data)
                 except Exception as e:
                     print("Error decoding data:", e)
+                    return
+                for _age, payload in readings:
+                    print("Data:", payload)
+                    record_sample(payload)
 
             await client.start_notify(SENSOR_CHAR_UUID, notification_handler)
             while True:
@@ -71,25 +117,25 @@ try:
     
     #HYSTERESIS
     def hysteresis():
+        """Re-evaluate on every new sample: sleeps on data_changed instead of polling"""
         global dehumidifier_on, target_humidity
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
 
-        async def control_logic():
-            global dehumidifier_on
-            while True:
-                humidity = latest_data.get("H", 0.0)
-                if humidity > target_humidity + 3 and not dehumidifier_on:
-                    success = await send_command_to_actuator("ON")
-                    if success:
-                        dehumidifier_on = True
-                elif humidity < target_humidity - 3 and dehumidifier_on:
-                    success = await send_command_to_actuator("OFF")
-                    if success:
-                        dehumidifier_on = False
-                await asyncio.sleep(5)
-
-        loop.run_until_complete(control_logic())
+        seen = 0
+        while True:
+            with data_changed:
+                data_changed.wait_for(lambda: latest_data["seq"] != seen)
+                seen = latest_data["seq"]
+                humidity = latest_data["H"]
+            if humidity > target_humidity + 3 and not dehumidifier_on:
+                success = loop.run_until_complete(send_command_to_actuator("ON"))
+                if success:
+                    dehumidifier_on = True
+            elif humidity < target_humidity - 3 and dehumidifier_on:
+                success = loop.run_until_complete(send_command_to_actuator("OFF"))
+                if success:
+                    dehumidifier_on = False
 
     
 
@@ -104,18 +150,16 @@ try:
 except ImportError:
     print("BLE functionality disabled or not available. Dashboard running without BLE support.")
 
-@app.route("/")
-def dashboard():
-    return render_template_string("""
+# Compiled once at import; each request only renders it
+DASHBOARD_TEMPLATE = app.jinja_env.from_string("""
     <html><head><title>Air Quality Dashboard</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <meta http-equiv="refresh" content="2">
+    <script src="{{ chart_js }}"></script>
     </head>
     <body>
     <h2>Real-Time Sensor Data</h2>
-    <p><b>Temperature:</b> {{ T }} °C</p>
-    <p><b>Humidity:</b> {{ H }} %</p>
-    <p><b>PM2.5:</b> {{ P }} µg/m³</p>
+    <p><b>Temperature:</b> <span id="T">{{ T }}</span> °C</p>
+    <p><b>Humidity:</b> <span id="H">{{ H }}</span> %</p>
+    <p><b>PM2.5:</b> <span id="P">{{ P }}</span> µg/m³</p>
 
     <h3>Temperature (°C)</h3>
     <canvas id="tempChart" width="800" height="250"></canvas>
@@ -133,65 +177,125 @@ def dashboard():
     <form action="/shutdown" method="post">
         <button type="submit">Shutdown Server</button>
     </form>
-    <p><i>Last command:</i> {{ command }} | <i>Success:</i> {{ success }}</p>
+    <p><i>Last command:</i> <span id="command">{{ command }}</span> | <i>Success:</i> <span id="success">{{ success }}</span></p>
 
     <script>
-        const labels = [...Array({{ history|length }}).keys()];
-        const tempData = {{ history | map(attribute='T') | list }};
-        const humData = {{ history | map(attribute='H') | list }};
-        const pmData = {{ history | map(attribute='P') | list }};
-
-        new Chart(document.getElementById('tempChart'), {
-            type: 'line',
-            data: {
-                labels: labels,
-                datasets: [{
-                    label: 'Temperature (°C)',
-                    data: tempData,
-                    borderColor: 'green',
-                    fill: false
-                }]
-            },
-            options: { animation: false, responsive: true }
-        });
-
-        new Chart(document.getElementById('humChart'), {
-            type: 'line',
-            data: {
-                labels: labels,
-                datasets: [{
-                    label: 'Humidity (%)',
-                    data: humData,
-                    borderColor: 'blue',
-                    fill: false
-                }]
-            },
-            options: { animation: false, responsive: true }
-        });
-
-        new Chart(document.getElementById('pmChart'), {
-            type: 'line',
-            data: {
-                labels: labels,
-                datasets: [{
-                    label: 'PM2.5 (µg/m³)',
-                    data: pmData,
-                    borderColor: 'red',
-                    fill: false
-                }]
-            },
-            options: { animation: false, responsive: true }
-        });
+        const maxPoints = {{ max_points }};
+        const initial = {{ history | tojson }};
+        let seq = {{ seq }};
+
+        // Without Chart.js (offline, nothing vendored) the readings still update live
+        function makeChart(id, label, color, key) {
+            if (!window.Chart) {
+                document.getElementById(id).replaceWith('Chart unavailable: Chart.js did not load');
+                return null;
+            }
+            return new Chart(document.getElementById(id), {
+                type: 'line',
+                data: {
+                    labels: initial.map(s => s.seq),
+                    datasets: [{
+                        label: label,
+                        data: initial.map(s => s[key]),
+                        borderColor: color,
+                        fill: false
+                    }]
+                },
+                options: { animation: false, responsive: true }
+            });
+        }
+
+        const charts = {
+            T: makeChart('tempChart', 'Temperature (°C)', 'green', 'T'),
+            H: makeChart('humChart', 'Humidity (%)', 'blue', 'H'),
+            P: makeChart('pmChart', 'PM2.5 (µg/m³)', 'red', 'P')
+        };
+
+        // Append new points in place; no page reloads
+        function applyDelta(delta) {
+            for (const key of ['T', 'H', 'P']) {
+                document.getElementById(key).textContent = delta[key];
+            }
+            document.getElementById('command').textContent = delta.control.command;
+            document.getElementById('success').textContent = delta.control.success ? 'True' : 'False';
+            const samples = delta.samples.filter(s => s.seq > seq);
+            if (samples.length) {
+                for (const [key, chart] of Object.entries(charts)) {
+                    if (!chart) continue;
+                    for (const s of samples) {
+                        chart.data.labels.push(s.seq);
+                        chart.data.datasets[0].data.push(s[key]);
+                    }
+                    const extra = chart.data.labels.length - maxPoints;
+                    if (extra > 0) {
+                        chart.data.labels.splice(0, extra);
+                        chart.data.datasets[0].data.splice(0, extra);
+                    }
+                    chart.update('none');
+                }
+            }
+            seq = Math.max(seq, delta.seq);
+        }
+
+        if (window.EventSource) {
+            const source = new EventSource('/stream?since=' + seq);
+            source.onmessage = event => applyDelta(JSON.parse(event.data));
+        } else {
+            setInterval(() => fetch('/api/delta?since=' + seq).then(r => r.json()).then(applyDelta), 2000);
+        }
     </script>
     </body></html>
-    """, T=latest_data["T"], H=latest_data["H"], P=latest_data["P"],
-         history=latest_data["history"], command=control_status["command"], success=control_status["success"])
+    """)
+
+def chart_js_url():
+    if os.path.exists(os.path.join(app.static_folder, CHART_JS_FILE)):
+        return f"{app.static_url_path}/{CHART_JS_FILE}"
+    return CHART_JS_CDN
+
+CHART_JS_URL = chart_js_url()
+if CHART_JS_URL == CHART_JS_CDN:
+    print(f"static/{CHART_JS_FILE} not found (run fetch_chart_js.py), dashboard will load Chart.js from {CHART_JS_CDN}")
+
+@app.route("/")
+def dashboard():
+    with data_changed:
+        values = {key: latest_data[key] for key in ("T", "H", "P", "seq")}
+        samples = list(history)
+        command, success = control_status["command"], control_status["success"]
+    return DASHBOARD_TEMPLATE.render(
+        chart_js=CHART_JS_URL, max_points=HISTORY_SIZE, history=samples,
+        command=command, success=success, **values
+    )
+
+@app.route("/api/delta")
+def delta():
+    """Everything the page needs to catch up from sample number ?since="""
+    return jsonify(delta_since(request.args.get("since", 0, type=int)))
+
+@app.route("/stream")
+def stream():
+    """Server-sent events: one delta per change, resuming from Last-Event-ID or ?since="""
+    last_event_id = request.headers.get("Last-Event-ID")
+    seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else request.args.get("since", 0, type=int)
+
+    def events(seq):
+        version = None
+        while True:
+            with data_changed:
+                changed = data_changed.wait_for(lambda: latest_data["version"] != version, STREAM_KEEPALIVE)
+            if not changed:
+                yield ": keepalive\n\n"
+                continue
+            delta = delta_since(seq)
+            version, seq = delta["version"], delta["seq"]
+            yield f"id: {seq}\ndata: {json.dumps(delta)}\n\n"
+
+    return Response(events(seq), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.route("/control", methods=["POST"])
 def control():
     cmd = request.form.get("command")
-    control_status["command"] = cmd
-    control_status["success"] = True
+    set_control_status(cmd, True)
     return dashboard()
 
 @app.route("/shutdown", methods=["POST"])
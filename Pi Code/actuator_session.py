@@ -0,0 +1,172 @@
+import asyncio
+import time
+from datetime import datetime
+
+from metrics import ACTUATOR_RETRIES, BLE_CONNECT_SECONDS
+
+class ActuatorSession:
+    """Long-lived BLE connection to the actuator: caches the device address, keeps
+    the link alive, reconnects in the background and serializes writes over it"""
+
+    def __init__(self, name, char_uuid, scanner, client_cls,
+                 scan_timeout=10.0, connect_timeout=15.0, keepalive_interval=10.0,
+                 reconnect_delay=2.0, max_reconnect_delay=30.0):
+        self.name = name
+        self.char_uuid = char_uuid
+        self.scanner = scanner
+        self.client_cls = client_cls
+        self.scan_timeout = scan_timeout
+        self.connect_timeout = connect_timeout
+        self.keepalive_interval = keepalive_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+
+        self.address = None
+        self.client = None
+        self.last_seen = None
+        self.write_lock = asyncio.Lock()
+        self.connected = asyncio.Event()
+        self.wake = asyncio.Event()
+        self.task = None
+
+    @property
+    def is_connected(self):
+        return self.client is not None and self.client.is_connected
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self._drop_client()
+
+    def _on_disconnect(self, _client):
+        print(f"Actuator {self.name} disconnected")
+        self.connected.clear()
+        self.wake.set()
+
+    async def _drop_client(self):
+        client, self.client = self.client, None
+        self.connected.clear()
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+    async def _connect(self):
+        if self.address is None:
+            self.address = await self.scanner.resolve(self.name, self.scan_timeout, role="actuator")
+            if self.address is None:
+                print(f"Actuator {self.name} not found")
+                return False
+
+        client = self.client_cls(self.address, timeout=self.connect_timeout,
+                                 disconnected_callback=self._on_disconnect)
+        started = time.perf_counter()
+        try:
+            await client.connect()
+        except Exception as e:
+            BLE_CONNECT_SECONDS.labels(self.name, "error").observe(time.perf_counter() - started)
+            print(f"Actuator connect to {self.address} failed: {e}")
+            # The cached address may be stale; rescan on the next attempt
+            self.address = None
+            self.scanner.forget(self.name)
+            return False
+        BLE_CONNECT_SECONDS.labels(self.name, "ok").observe(time.perf_counter() - started)
+
+        self.client = client
+        self.last_seen = datetime.now().isoformat()
+        self.connected.set()
+        print(f"Actuator {self.name} connected at {self.address}")
+        return True
+
+    async def _run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                if not self.is_connected:
+                    await self._drop_client()
+                    if not await self._connect():
+                        await self._pause(delay)
+                        delay = min(delay * 2, self.max_reconnect_delay)
+                        continue
+                    delay = self.reconnect_delay
+
+                self.wake.clear()
+                try:
+                    await asyncio.wait_for(self.wake.wait(), timeout=self.keepalive_interval)
+                except asyncio.TimeoutError:
+                    await self._keepalive()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Actuator session error: {e}")
+                await self._drop_client()
+                await self._pause(delay)
+
+    async def _pause(self, delay):
+        """Sleep between reconnect attempts, cut short when a command is waiting"""
+        self.wake.clear()
+        try:
+            await asyncio.wait_for(self.wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _keepalive(self):
+        if not self.is_connected or self.write_lock.locked():
+            return
+        async with self.write_lock:
+            try:
+                await self.client.read_gatt_char(self.char_uuid)
+                self.last_seen = datetime.now().isoformat()
+            except Exception as e:
+                print(f"Actuator keepalive failed: {e}")
+                await self._drop_client()
+
+    async def read_state(self):
+        """Current characteristic value ("System ON", "Ready", ...) or None if unreadable"""
+        async with self.write_lock:
+            if not self.is_connected:
+                return None
+            try:
+                value = await self.client.read_gatt_char(self.char_uuid)
+            except Exception as e:
+                print(f"Actuator state read failed: {e}")
+                return None
+            self.last_seen = datetime.now().isoformat()
+            return bytes(value).decode(errors="replace").strip()
+
+    async def send(self, command, timeout=20.0, attempts=2):
+        """Write a command over the held connection, waiting up to timeout for the link"""
+        self.start()
+        deadline = time.monotonic() + timeout
+        for attempt in range(attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if attempt:
+                ACTUATOR_RETRIES.inc()
+            if not self.connected.is_set():
+                self.wake.set()
+                try:
+                    await asyncio.wait_for(self.connected.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            async with self.write_lock:
+                client = self.client
+                if client is None or not client.is_connected:
+                    continue
+                try:
+                    await client.write_gatt_char(self.char_uuid, command.encode(), response=True)
+                    self.last_seen = datetime.now().isoformat()
+                    return True
+                except Exception as e:
+                    print(f"Actuator write '{command}' failed (attempt {attempt + 1}/{attempts}): {e}")
+                    await self._drop_client()
+                    self.wake.set()
+        return False
@@ -0,0 +1,135 @@
+"""EPA AQI from a 12-hour PM2.5 NowCast, plus a matching index over the VOC stream.
+
+Each device keeps one running (hour, sum, count) bucket per hour for the last
+twelve hours, so a sample costs O(1) and the NowCast is a fixed 12-term sum.
+The current, still-filling hour counts as the most recent hour, as live
+monitors (PurpleAir, AirNow's sensor map) do."""
+import math
+
+NOWCAST_HOURS = 12
+HOUR = 3600
+
+# EPA PM2.5 breakpoints as revised in 2024: (C_lo, C_hi, I_lo, I_hi, category)
+PM25_BREAKPOINTS = (
+    (0.0, 9.0, 0, 50, "Good"),
+    (9.1, 35.4, 51, 100, "Moderate"),
+    (35.5, 55.4, 101, 150, "Unhealthy for Sensitive Groups"),
+    (55.5, 125.4, 151, 200, "Unhealthy"),
+    (125.5, 225.4, 201, 300, "Very Unhealthy"),
+    (225.5, 325.4, 301, 500, "Hazardous")
+)
+
+# Sensirion VOC Index: 100 is the sensor's learned average, higher means more VOCs
+# than usual (upper bound of each band, category)
+VOC_BANDS = (
+    (100, "Excellent"),
+    (150, "Good"),
+    (250, "Moderate"),
+    (400, "Poor"),
+    (500, "Unhealthy")
+)
+
+def pm25_aqi(concentration):
+    """(AQI, category) for a PM2.5 concentration in µg/m³; truncated to 0.1 first as EPA specifies"""
+    c = math.floor(max(concentration, 0.0) * 10) / 10
+    for c_lo, c_hi, i_lo, i_hi, category in PM25_BREAKPOINTS:
+        if c <= c_hi:
+            return round((i_hi - i_lo) / (c_hi - c_lo) * (c - c_lo) + i_lo), category
+    return 500, "Hazardous"
+
+def voc_category(index):
+    for upper, category in VOC_BANDS:
+        if index <= upper:
+            return category
+    return VOC_BANDS[-1][1]
+
+def nowcast(hourly, min_weight=0.5):
+    """EPA NowCast of hourly averages, most recent first (None = no data that hour).
+    Needs two of the three most recent hours; None otherwise."""
+    if sum(value is not None for value in hourly[:3]) < 2:
+        return None
+    values = [value for value in hourly if value is not None]
+    high = max(values)
+    weight = max(min(values) / high, min_weight) if high > 0 else 1.0
+    numerator = denominator = 0.0
+    factor = 1.0
+    for value in hourly:
+        if value is not None:
+            numerator += factor * value
+            denominator += factor
+        factor *= weight
+    return numerator / denominator
+
+class HourlyAverages:
+    """Per-hour sum and count for the last `hours` hours in a ring indexed by hour number"""
+
+    def __init__(self, hours=NOWCAST_HOURS):
+        self.hours = hours
+        self.hour = [None] * hours
+        self.sum = [0.0] * hours
+        self.count = [0] * hours
+        self.newest = None
+
+    def add(self, timestamp, value, count=1):
+        """Fold one reading (or count readings summing to value) into its hour"""
+        hour = int(timestamp // HOUR)
+        if self.newest is not None and hour <= self.newest - self.hours:
+            return
+        slot = hour % self.hours
+        if self.hour[slot] != hour:
+            if self.hour[slot] is not None and self.hour[slot] > hour:
+                return
+            self.hour[slot] = hour
+            self.sum[slot] = 0.0
+            self.count[slot] = 0
+        self.sum[slot] += value
+        self.count[slot] += count
+        if self.newest is None or hour > self.newest:
+            self.newest = hour
+
+    def averages(self, timestamp=None):
+        """Hourly averages ending at timestamp's hour (or the newest hour), most recent first"""
+        if self.newest is None:
+            return [None] * self.hours
+        current = self.newest if timestamp is None else max(int(timestamp // HOUR), self.newest)
+        result = []
+        for hour in range(current, current - self.hours, -1):
+            slot = hour % self.hours
+            if self.hour[slot] == hour and self.count[slot]:
+                result.append(self.sum[slot] / self.count[slot])
+            else:
+                result.append(None)
+        return result
+
+class AirQualityIndex:
+    """Incremental AQI/NowCast state for one sensor, fed P (PM2.5) and V (VOC Index) readings"""
+
+    def __init__(self):
+        self.pm25 = HourlyAverages()
+        self.voc = HourlyAverages()
+
+    def add(self, timestamp, payload):
+        if payload.get("P") is not None:
+            self.pm25.add(timestamp, payload["P"])
+        if payload.get("V") is not None:
+            self.voc.add(timestamp, payload["V"])
+
+    def seed(self, hour_start, pm25=None, voc=None):
+        """Load an hourly (sum, count) total, e.g. from the store's hourly rollups"""
+        if pm25 is not None and pm25[1]:
+            self.pm25.add(hour_start, pm25[0], pm25[1])
+        if voc is not None and voc[1]:
+            self.voc.add(hour_start, voc[0], voc[1])
+
+    def current(self, timestamp=None):
+        """{"AQI", "PNC", "VOCI"} numbers for history plus categories; None where not enough data"""
+        result = {"AQI": None, "PNC": None, "aqi_category": None, "VOCI": None, "voc_category": None}
+        pm = nowcast(self.pm25.averages(timestamp))
+        if pm is not None:
+            result["PNC"] = round(pm, 1)
+            result["AQI"], result["aqi_category"] = pm25_aqi(pm)
+        voc = nowcast(self.voc.averages(timestamp))
+        if voc is not None:
+            result["VOCI"] = round(voc)
+            result["voc_category"] = voc_category(voc)
+        return result
@@ -0,0 +1,261 @@
+"""Streaming alert rules compiled into per-device state machines.
+
+One rule per line, '#' starts a comment:
+
+    humid:      H > 70 for 10m
+    pm_rising:  rate(P, 5m) > 2/min for 1m
+    silent:     silent > 60s
+
+A value or rate condition must hold on every sample for the whole duration
+(default 0) before the alert fires, and it resolves on the first sample that
+breaks it. "silent" fires when a sensor has sent nothing for that long and
+resolves on its next sample. Rules are indexed by field, so a sample only
+advances the state machines of rules on the fields it carries."""
+import operator
+import re
+import time
+
+from humidity_controller import SlopeEstimator
+
+OPERATORS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+DURATION_UNITS = {"": 1, "s": 1, "m": 60, "min": 60, "h": 3600}
+RATE_UNITS = {"": 1, "/s": 1, "/min": 60, "/h": 3600}
+DEFAULT_RATE_WINDOW = 60.0
+
+NUMBER = r"-?\d+(?:\.\d+)?"
+DURATION = rf"{NUMBER}\s*(?:s|min|m|h)?"
+RULE_LINE = re.compile(rf"^(?P<name>[\w.-]+)\s*:\s*(?P<condition>.+?)(?:\s+for\s+(?P<duration>{DURATION}))?$")
+VALUE_CONDITION = re.compile(rf"^(?P<field>\w+)\s*(?P<op>>=|<=|>|<)\s*(?P<threshold>{NUMBER})$")
+RATE_CONDITION = re.compile(
+    rf"^rate\(\s*(?P<field>\w+)\s*(?:,\s*(?P<window>{DURATION}))?\s*\)\s*(?P<op>>=|<=|>|<)\s*"
+    rf"(?P<threshold>{NUMBER})\s*(?P<unit>/s|/min|/h)?$"
+)
+SILENT_CONDITION = re.compile(rf"^silent\s*>\s*(?P<threshold>{DURATION})$")
+
+def parse_duration(text):
+    match = re.fullmatch(rf"({NUMBER})\s*(s|min|m|h)?", text.strip())
+    if match is None:
+        raise ValueError(f"bad duration '{text}'")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or ""]
+
+class Rule:
+    __slots__ = ("name", "kind", "field", "op", "compare", "threshold", "duration", "window", "source")
+
+    def __init__(self, name, kind, field, op, threshold, duration=0.0, window=None, source=""):
+        self.name = name
+        self.kind = kind
+        self.field = field
+        self.op = op
+        self.compare = OPERATORS[op]
+        self.threshold = threshold
+        self.duration = duration
+        self.window = window
+        self.source = source
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "field": self.field,
+            "rule": self.source
+        }
+
+def parse_rules(text, fields):
+    """Compile rule text into Rules; raises ValueError naming the offending line"""
+    rules = []
+    names = set()
+    for number, line in enumerate(text.splitlines(), start=1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        try:
+            rules.append(_parse_rule(line, fields))
+        except ValueError as e:
+            raise ValueError(f"line {number}: {e}") from None
+        if rules[-1].name in names:
+            raise ValueError(f"line {number}: duplicate rule name '{rules[-1].name}'")
+        names.add(rules[-1].name)
+    return rules
+
+def _parse_rule(line, fields):
+    match = RULE_LINE.match(line)
+    if match is None:
+        raise ValueError(f"expected '<name>: <condition> [for <duration>]', got '{line}'")
+    name, condition = match.group("name"), match.group("condition").strip()
+    duration = parse_duration(match.group("duration")) if match.group("duration") else 0.0
+
+    silent = SILENT_CONDITION.match(condition)
+    if silent:
+        return Rule(name, "silent", None, ">", parse_duration(silent.group("threshold")), source=line)
+
+    rate = RATE_CONDITION.match(condition)
+    value = VALUE_CONDITION.match(condition)
+    match = rate or value
+    if match is None:
+        raise ValueError(f"cannot parse condition '{condition}'")
+    if match.group("field") not in fields:
+        raise ValueError(f"unknown field '{match.group('field')}' (expected one of {', '.join(fields)})")
+    threshold = float(match.group("threshold"))
+    if rate:
+        # Thresholds are per unit of time; slopes are per second
+        threshold /= RATE_UNITS[rate.group("unit") or ""]
+        window = parse_duration(rate.group("window")) if rate.group("window") else DEFAULT_RATE_WINDOW
+        return Rule(name, "rate", rate.group("field"), rate.group("op"), threshold, duration, window, line)
+    return Rule(name, "value", value.group("field"), value.group("op"), threshold, duration, source=line)
+
+class RuleState:
+    """One rule's state machine on one device: ok -> pending (since) -> firing"""
+    __slots__ = ("rule", "pending_since", "firing", "fired_at", "value", "slope")
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.pending_since = None
+        self.firing = False
+        self.fired_at = None
+        self.value = None
+        self.slope = SlopeEstimator(rule.window) if rule.kind == "rate" else None
+
+class DeviceRules:
+    """A device's rule states, grouped by the field that drives them"""
+
+    def __init__(self, rules, now):
+        self.last_sample = now
+        self.by_field = {}
+        self.silent = []
+        for rule in rules:
+            state = RuleState(rule)
+            if rule.kind == "silent":
+                self.silent.append(state)
+            else:
+                self.by_field.setdefault(rule.field, []).append(state)
+
+    def states(self):
+        for states in self.by_field.values():
+            yield from states
+        yield from self.silent
+
+class AlertEngine:
+    """Evaluates compiled rules against the sample stream. on_event(event) hears every
+    alert that fires or resolves; active() lists what is currently firing."""
+
+    def __init__(self, fields, on_event=None):
+        self.fields = tuple(fields)
+        self.on_event = on_event
+        self.rules = []
+        self.text = ""
+        self.devices = {}
+        self.fired = 0
+
+    def load(self, text, now=None):
+        """Swap in a new rule set; raises ValueError (keeping the old one) if it does not parse.
+        Unchanged rules keep their state; alerts of removed or edited rules resolve."""
+        rules = parse_rules(text, self.fields)
+        now = time.time() if now is None else now
+        kept = {rule.source: rule for rule in rules}
+        for device_id, device in self.devices.items():
+            previous = {state.rule.source: state for state in device.states()}
+            replacement = DeviceRules(rules, device.last_sample)
+            for field, states in replacement.by_field.items():
+                replacement.by_field[field] = [previous.get(state.rule.source, state) for state in states]
+            replacement.silent = [previous.get(state.rule.source, state) for state in replacement.silent]
+            for source, state in previous.items():
+                if state.firing and source not in kept:
+                    self._resolve(device_id, state, now, "rule removed")
+            for state in replacement.states():
+                state.rule = kept[state.rule.source]
+            self.devices[device_id] = replacement
+        self.rules = rules
+        self.text = text
+
+    def track(self, device_id, now=None):
+        """Start watching a device before its first sample, so "silent" rules cover it"""
+        if device_id not in self.devices:
+            self.devices[device_id] = DeviceRules(self.rules, time.time() if now is None else now)
+
+    def observe(self, device_id, timestamp, payload):
+        """Advance the device's state machines for the fields in one sample"""
+        device = self.devices.get(device_id)
+        if device is None:
+            device = self.devices[device_id] = DeviceRules(self.rules, timestamp)
+        device.last_sample = timestamp
+        for state in device.silent:
+            if state.firing:
+                self._resolve(device_id, state, timestamp, "sample received")
+        for field, states in device.by_field.items():
+            value = payload.get(field)
+            if value is None or value != value:
+                continue
+            for state in states:
+                self._advance(device_id, state, timestamp, value)
+
+    def _advance(self, device_id, state, timestamp, value):
+        rule = state.rule
+        if rule.kind == "rate":
+            state.slope.add(timestamp, value)
+            value = state.slope.slope()
+            if value is None:
+                return
+        state.value = value
+        if rule.compare(value, rule.threshold):
+            if state.pending_since is None:
+                state.pending_since = timestamp
+            if not state.firing and timestamp - state.pending_since >= rule.duration:
+                self._fire(device_id, state, timestamp)
+        else:
+            state.pending_since = None
+            if state.firing:
+                self._resolve(device_id, state, timestamp, "condition cleared")
+
+    def check_silence(self, now=None):
+        """Fire "silent" rules for devices that have gone quiet; call periodically"""
+        now = time.time() if now is None else now
+        for device_id, device in self.devices.items():
+            quiet = now - device.last_sample
+            for state in device.silent:
+                state.value = quiet
+                if not state.firing and quiet > state.rule.threshold:
+                    self._fire(device_id, state, now)
+
+    def _event(self, device_id, state, status, at, reason=None):
+        rule = state.rule
+        value = state.value
+        if rule.kind == "rate" and value is not None:
+            value *= 60  # rates are reported per minute
+        return {
+            "rule": rule.name,
+            "device": device_id,
+            "status": status,
+            "condition": rule.source,
+            "value": None if value is None else round(value, 3),
+            "since": state.fired_at,
+            "at": at,
+            "reason": reason
+        }
+
+    def _fire(self, device_id, state, at):
+        state.firing = True
+        state.fired_at = at
+        self.fired += 1
+        self._emit(self._event(device_id, state, "firing", at))
+
+    def _resolve(self, device_id, state, at, reason):
+        state.firing = False
+        state.pending_since = None
+        self._emit(self._event(device_id, state, "resolved", at, reason))
+        state.fired_at = None
+
+    def _emit(self, event):
+        print(f"Alert {event['rule']} on {event['device']} {event['status']}")
+        if self.on_event is not None:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                print(f"Alert event handler failed: {e}")
+
+    def active(self):
+        return [
+            self._event(device_id, state, "firing", state.fired_at)
+            for device_id, device in self.devices.items()
+            for state in device.states()
+            if state.firing
+        ]
@@ -0,0 +1,335 @@
+"""Load and latency benchmark for hub_bluetooth.py on the simulated BLE backend (sim_ble.py).
+
+Runs on any Linux box, no Bluetooth needed:
+
+    python bench_hub.py --sensors 1,10,100,1000 --clients 1,50,500 --duration 15
+    python bench_hub.py --ingest-only --samples 200000
+    python bench_hub.py --reporting
+
+Each (sensors, clients) scenario starts a fresh hub process and measures
+notification->WebSocket latency percentiles, delivered message rate, and
+/api/history response times. --ingest-only measures the hub's raw ingest rate
+(decode + state update + history + store queue + fan-out) in-process.
+--reporting checks adaptive reporting end to end on a simulated node: the config
+written over GATT reads back intact, the notification rate follows its interval,
+heartbeat and deadbands, and every notification decodes to the sampled values.
+Exits non-zero when a check fails.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LATENCY_PROBES = 10
+
+# --reporting: samples per second, and samples per segment of the scripted signal
+REPORTING_RATE = 20.0
+REPORTING_SEGMENT = 120
+
+def percentiles(values, points=(50, 95, 99)):
+    if len(values) < 2:
+        return {p: (values[0] if values else float("nan")) for p in points}
+    cuts = statistics.quantiles(values, n=100, method="inclusive")
+    return {p: cuts[p - 1] for p in points}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def http_get(url, timeout=10.0):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read()
+
+def hub_env(sensors, rate, payload_format, db_path, extra=None):
+    """Environment for a hub whose database, state snapshots and alert rules all live next
+    to db_path, so scenarios never warm-start from each other or write into this directory"""
+    work_dir = os.path.dirname(db_path)
+    rules_path = os.path.join(work_dir, "alert_rules.txt")
+    shutil.copyfile(os.path.join(HERE, "alert_rules.txt"), rules_path)
+    env = dict(os.environ)
+    env.update({
+        "HUB_BLE_BACKEND": "sim",
+        "HUB_HISTORY_DB": db_path,
+        "HUB_STATE_PATH": os.path.join(work_dir, "hub_state"),
+        "HUB_ALERT_RULES": rules_path,
+        "HUB_SENSORS": ",".join(f"room{i}=SimSensor{i}" for i in range(sensors)),
+        "SIM_SENSORS": str(sensors),
+        "SIM_RATE": str(rate),
+        "SIM_FORMAT": payload_format,
+        "SIM_SCAN_LATENCY": "0.01",
+        "SIM_CONNECT_LATENCY": "0.01",
+    })
+    env.update(extra or {})
+    return env
+
+def start_hub(port, env, verbose=False):
+    code = (
+        "import uvicorn, hub_bluetooth; "
+        f"uvicorn.run(hub_bluetooth.app, host='127.0.0.1', port={port}, log_level='warning')"
+    )
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen([sys.executable, "-c", code], cwd=HERE, env=env, stdout=output, stderr=output)
+
+async def wait_for_hub(base_url, sensors, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            devices = json.loads(await asyncio.to_thread(http_get, f"{base_url}/api/devices", 2.0))["devices"]
+            if sum(1 for d in devices if d["connected"]) >= sensors:
+                return True
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    return False
+
+async def ws_client(url, probe, stop, latencies, counts, index):
+    import websockets
+
+    async with websockets.connect(url, max_size=None) as ws:
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            counts[index] += 1
+            if probe:
+                received = time.time()
+                data = json.loads(message)
+                if data.get("type") == "sensor_data":
+                    sent = datetime.fromisoformat(data["data"]["timestamp"]).timestamp()
+                    latencies.append(received - sent)
+
+async def history_probe(base_url, stop, timings):
+    queries = [
+        "/api/history?limit=600",
+        "/api/history?limit=20",
+        f"/api/history?from={time.time() - 300:.0f}",
+    ]
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.to_thread(http_get, base_url + queries[i % len(queries)])
+        timings.append(time.perf_counter() - start)
+        i += 1
+        await asyncio.sleep(0.05)
+
+async def run_scenario(sensors, clients, args):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = hub_env(sensors, args.rate, args.format, os.path.join(tmp, "bench.db"))
+        hub = start_hub(port, env, args.verbose)
+        try:
+            if not await wait_for_hub(base_url, sensors):
+                print(f"{sensors:>7} {clients:>7}  hub did not connect all sensors in time")
+                return None
+
+            stop = asyncio.Event()
+            latencies, history_timings = [], []
+            counts = [0] * clients
+            tasks = [
+                asyncio.create_task(ws_client(f"ws://127.0.0.1:{port}/ws", i < LATENCY_PROBES, stop, latencies, counts, i))
+                for i in range(clients)
+            ]
+            await asyncio.sleep(args.warmup)
+            latencies.clear()
+            for i in range(clients):
+                counts[i] = 0
+            tasks.append(asyncio.create_task(history_probe(base_url, stop, history_timings)))
+
+            await asyncio.sleep(args.duration)
+            stop.set()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            hub.terminate()
+            hub.wait(timeout=10)
+
+    offered = sensors * args.rate
+    delivered = statistics.mean(counts) / args.duration if counts else 0.0
+    lat = percentiles([x * 1000 for x in latencies])
+    hist = percentiles([x * 1000 for x in history_timings])
+    result = {
+        "sensors": sensors, "clients": clients, "offered_per_s": offered,
+        "delivered_per_client_per_s": delivered,
+        "latency_ms": lat, "history_ms": hist, "history_requests": len(history_timings)
+    }
+    print(f"{sensors:>7} {clients:>7} {offered:>9.0f} {delivered:>11.1f} "
+          f"{lat[50]:>8.1f} {lat[95]:>8.1f} {lat[99]:>8.1f} {hist[50]:>8.1f} {hist[95]:>8.1f}")
+    return result
+
+def run_ingest_only(args):
+    """Push decoded samples through ingest_sample as fast as possible"""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(hub_env(args.ingest_sensors, 1.0, args.format, os.path.join(tmp, "bench.db")))
+        sys.path.insert(0, HERE)
+        import hub_bluetooth as hub
+        from sensor_frame import decode_payload
+        from sim_ble import SimSensor
+
+        async def main():
+            hub.history_store.start()
+            hub.ingest_bridge.bind(asyncio.get_running_loop())
+            node = SimSensor("bench", "00", payload_format=args.format)
+            frames = [node.encode([(i, node.reading(i))]) for i in range(1000)]
+            devices = list(hub.sensors)
+
+            start = time.perf_counter()
+            for i in range(args.samples):
+                device = devices[i % len(devices)]
+                for age, payload in decode_payload(frames[i % len(frames)]):
+                    hub.ingest_sample(device, payload, age)
+                if i % 1000 == 0:
+                    await asyncio.sleep(0)
+            elapsed = time.perf_counter() - start
+            hub.history_store.close()
+            print(f"ingested {args.samples} {args.format} samples across {len(devices)} sensors "
+                  f"in {elapsed:.2f}s: {args.samples / elapsed:,.0f} samples/s "
+                  f"({elapsed / args.samples * 1e6:.1f} us/sample), store dropped {hub.history_store.dropped}")
+
+        asyncio.run(main())
+
+def reporting_signal(index):
+    """Scripted reading for sample index after the config write: flat (only heartbeats
+    are due), then a slow humidity ramp (deadband-bound), then a fast one (interval-bound)"""
+    segment, step = divmod(index, REPORTING_SEGMENT)
+    humidity = 45.0
+    if segment >= 1:
+        humidity += 0.05 * (step if segment == 1 else REPORTING_SEGMENT)
+    if segment >= 2:
+        humidity += 0.5 * step
+    return {"T": 22.0, "H": round(humidity, 2), "P": 8.0, "V": 100.0, "P1": 5.0, "P4": 9.0, "P10": 10.0, "N": 1.0}
+
+def run_reporting_check(args):
+    """Drive a simulated node through a config write and check what it reports"""
+    sys.path.insert(0, HERE)
+    import sim_ble
+    from report_policy import PROFILES
+    from sensor_frame import DEFAULT_REPORT_CONFIG, FIELD_SCALES, decode_config, decode_payload, encode_config
+
+    sample = 1.0 / REPORTING_RATE
+    # The hub's slow profile, with interval and heartbeat in samples rather than seconds
+    config = {"interval": 5 * sample, "heartbeat": 20 * sample, "deadbands": PROFILES["slow"]["deadbands"]}
+    expected_config = decode_config(encode_config(config))
+    failures = []
+
+    def check(name, ok, detail):
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+        if not ok:
+            failures.append(name)
+
+    async def main():
+        node = sim_ble.world.add(sim_ble.SimSensor("reporting", "SI:M0:FF:FF:FF:FF", rate=REPORTING_RATE,
+                                                   payload_format=args.format))
+        base = None
+        readings = []
+        notifications = []
+
+        def reading(now):
+            value = reporting_signal(node.sampled - base) if base is not None else reporting_signal(0)
+            readings.append(value)
+            return value
+
+        def on_notify(_, data):
+            _, decoded = decode_payload(data)[-1]
+            index = None if base is None else node.sampled - base - 1
+            notifications.append((time.monotonic(), index, decoded, readings[-1]))
+
+        node.reading = reading
+        client = sim_ble.BleakClient(node)
+        await client.connect()
+        await client.start_notify(sim_ble.SENSOR_CHAR_UUID, on_notify)
+
+        await asyncio.sleep(40 * sample)
+        check("default config", node.emitted >= node.sampled - 1,
+              f"{node.emitted} notifications for {node.sampled} samples")
+
+        await client.write_gatt_char(sim_ble.SENSOR_CONFIG_UUID, encode_config(config), response=True)
+        readback = decode_config(await client.read_gatt_char(sim_ble.SENSOR_CONFIG_UUID))
+        check("config round trip", readback == expected_config, f"wrote {expected_config}, read {readback}")
+
+        base = node.sampled
+        notifications.clear()
+        await asyncio.sleep((3 * REPORTING_SEGMENT + 1) * sample)
+        await client.disconnect()
+        check("config reset on disconnect", node.config == DEFAULT_REPORT_CONFIG, f"{node.config}")
+
+        reported = [entry for entry in notifications if entry[1] is not None and entry[1] < 3 * REPORTING_SEGMENT]
+        # Each segment's expected report period in samples: heartbeat, deadband, interval
+        deadband = config["deadbands"]["H"]
+        for segment, (name, period) in enumerate((
+            ("heartbeat", config["heartbeat"] / sample),
+            ("deadband", deadband / 0.05),
+            ("interval", config["interval"] / sample),
+        )):
+            count = sum(1 for _, index, _, _ in reported if index // REPORTING_SEGMENT == segment)
+            expected = REPORTING_SEGMENT / period
+            check(f"{name} rate", abs(count - expected) <= 1 + 0.1 * expected,
+                  f"{count} notifications in {REPORTING_SEGMENT} samples, expected {expected:.0f}")
+
+        gaps = [later[0] - earlier[0] for earlier, later in zip(reported, reported[1:])]
+        check("interval respected", min(gaps) >= config["interval"] - sample,
+              f"shortest gap {min(gaps):.3f}s, interval {config['interval']:.3f}s")
+        check("heartbeat respected", max(gaps) <= config["heartbeat"] + 1.5 * sample,
+              f"longest gap {max(gaps):.3f}s, heartbeat {config['heartbeat']:.3f}s")
+
+        fields = ("T", "H", "P") if args.format == "json" else tuple(FIELD_SCALES)
+        mismatched = [
+            (decoded, sent) for _, _, decoded, sent in notifications
+            if any(abs(decoded[field] - sent[field]) > 0.5 / FIELD_SCALES[field] for field in fields)
+        ]
+        check("decoded values", not mismatched,
+              f"{len(notifications) - len(mismatched)} of {len(notifications)} notifications match the sampled reading"
+              + (f", first mismatch {mismatched[0]}" if mismatched else ""))
+
+    asyncio.run(main())
+    if failures:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sensors", default="1,10,100", help="comma-separated simulated sensor counts")
+    parser.add_argument("--clients", default="1,10,50", help="comma-separated WebSocket client counts")
+    parser.add_argument("--rate", type=float, default=1.0, help="notifications per second per sensor")
+    parser.add_argument("--format", choices=("json", "binary"), default="json")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--json", dest="json_out", help="also write results to this file")
+    parser.add_argument("--verbose", action="store_true", help="show hub output")
+    parser.add_argument("--ingest-only", action="store_true")
+    parser.add_argument("--ingest-sensors", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=100000)
+    parser.add_argument("--reporting", action="store_true", help="check adaptive reporting on a simulated node")
+    args = parser.parse_args()
+
+    if args.ingest_only:
+        run_ingest_only(args)
+        return
+    if args.reporting:
+        run_reporting_check(args)
+        return
+
+    print(f"{'sensors':>7} {'clients':>7} {'offered/s':>9} {'recv/s/cli':>11} "
+          f"{'lat p50':>8} {'lat p95':>8} {'lat p99':>8} {'hist p50':>8} {'hist p95':>8}  (ms)")
+    results = []
+    for sensors in (int(x) for x in args.sensors.split(",")):
+        for clients in (int(x) for x in args.clients.split(",")):
+            result = asyncio.run(run_scenario(sensors, clients, args))
+            if result:
+                results.append(result)
+    if args.json_out:
+        with open(args.json_out, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
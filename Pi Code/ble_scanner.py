@@ -0,0 +1,134 @@
+import asyncio
+import time
+from datetime import datetime
+
+from metrics import BLE_SCAN_SECONDS, registry
+
+SCAN_CACHE = registry.counter("hub_ble_scan_cache_total", "Address lookups answered by the scan registry", ("result",))
+
+class DeviceScanner:
+    """One continuous BLE scan shared by every connect path.
+
+    Advertisements update a registry of name -> address, RSSI and last-seen time.
+    resolve() answers from that registry while an entry is younger than ttl; on a
+    miss it waits for the running scan to see the device, and only runs its own
+    targeted scan when the background scan is not available. Entries older than
+    retention are dropped entirely."""
+
+    def __init__(self, scanner_cls, ttl=60.0, retention=3600.0, poll_interval=0.2, restart_delay=10.0):
+        self.scanner_cls = scanner_cls
+        self.ttl = ttl
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.restart_delay = restart_delay
+        self.entries = {}
+        self.scanner = None
+        self.active = False
+        self.task = None
+
+    def _on_detect(self, device, advertisement):
+        name = getattr(advertisement, "local_name", None) or device.name
+        if not name:
+            return
+        entry = self.entries.get(name)
+        if entry is None:
+            entry = self.entries[name] = {"name": name, "adverts": 0}
+        entry["address"] = device.address
+        entry["rssi"] = getattr(advertisement, "rssi", None)
+        entry["seen"] = time.monotonic()
+        entry["last_seen"] = time.time()
+        entry["adverts"] += 1
+
+    def start(self):
+        """Start the background scan; detections begin arriving shortly after"""
+        if self.task is None:
+            self.active = True
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        await self._stop_scanner()
+        self.active = False
+
+    async def _stop_scanner(self):
+        scanner, self.scanner = self.scanner, None
+        if scanner is not None:
+            try:
+                await scanner.stop()
+            except Exception:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                if self.scanner is None:
+                    scanner = self.scanner_cls(detection_callback=self._on_detect)
+                    await scanner.start()
+                    self.scanner = scanner
+                    self.active = True
+                    print("Background BLE scan started")
+                await asyncio.sleep(self.ttl)
+                self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Background BLE scan failed, using targeted scans: {e}")
+                self.active = False
+                await self._stop_scanner()
+                await asyncio.sleep(self.restart_delay)
+
+    def prune(self):
+        cutoff = time.monotonic() - self.retention
+        for name in [name for name, entry in self.entries.items() if entry["seen"] < cutoff]:
+            del self.entries[name]
+
+    def lookup(self, name):
+        """Cached address for name, or None when unknown or older than ttl"""
+        entry = self.entries.get(name)
+        if entry is None or time.monotonic() - entry["seen"] > self.ttl:
+            return None
+        return entry["address"]
+
+    def forget(self, name):
+        """Drop a cached address that failed to connect so the next resolve rescans"""
+        self.entries.pop(name, None)
+
+    async def resolve(self, name, timeout=10.0, role="sensor"):
+        """Address for the device advertising name, or None if it is not seen in time"""
+        address = self.lookup(name)
+        if address is not None:
+            SCAN_CACHE.labels("hit").inc()
+            return address
+        SCAN_CACHE.labels("miss").inc()
+
+        started = time.perf_counter()
+        if self.active:
+            deadline = time.monotonic() + timeout
+            while address is None and time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                address = self.lookup(name)
+        else:
+            device = await self.scanner_cls.find_device_by_filter(lambda d, _: d.name == name, timeout=timeout)
+            if device is not None:
+                self._on_detect(device, None)
+                address = device.address
+        BLE_SCAN_SECONDS.labels(role, "true" if address else "false").observe(time.perf_counter() - started)
+        return address
+
+    def devices(self):
+        """Registry contents for the API, most recently seen first"""
+        now = time.monotonic()
+        return [
+            {
+                "name": entry["name"],
+                "address": entry["address"],
+                "rssi": entry["rssi"],
+                "last_seen": datetime.fromtimestamp(entry["last_seen"]).isoformat(),
+                "age": round(now - entry["seen"], 1),
+                "stale": now - entry["seen"] > self.ttl,
+                "adverts": entry["adverts"]
+            }
+            for entry in sorted(self.entries.values(), key=lambda e: e["seen"], reverse=True)
+        ]
@@ -0,0 +1,141 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+
+class CommandJob:
+    __slots__ = ("id", "command", "source", "status", "created", "started", "finished",
+                 "error", "superseded_by", "done")
+
+    def __init__(self, command, source):
+        self.id = uuid.uuid4().hex[:12]
+        self.command = command
+        self.source = source
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.superseded_by = None
+        self.done = asyncio.get_running_loop().create_future()
+
+    @property
+    def pending(self):
+        return self.status in ("queued", "running")
+
+    def info(self):
+        return {
+            "id": self.id,
+            "command": self.command,
+            "source": self.source,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+            "superseded_by": self.superseded_by
+        }
+
+class CommandQueue:
+    """The one path to the actuator: jobs run one at a time by a single consumer.
+
+    Commands are desired states ("on"/"off"), so there is a single queued slot. A
+    new job replaces a job still waiting in it (marked "superseded"), collapsing
+    ON-then-OFF clicks into the latest desired state; a job that matches the last
+    command the actuator accepted completes without touching the radio. execute(job)
+    does the work and returns True/False; on_update(job) hears every status change."""
+
+    def __init__(self, execute, on_update=None, keep=100):
+        self.execute = execute
+        self.on_update = on_update
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.queued = None
+        self.running = None
+        self.applied = None
+        self.wake = asyncio.Event()
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def desired(self, current):
+        """The command the actuator will end up with once pending jobs finish"""
+        for job in (self.queued, self.running):
+            if job is not None:
+                return job.command
+        return current
+
+    def submit(self, command, source="manual"):
+        job = CommandJob(command, source)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.keep:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.pending:
+                break
+            self.jobs.popitem(last=False)
+        replaced, self.queued = self.queued, job
+        if replaced is not None:
+            replaced.superseded_by = job.id
+            self._finish(replaced, "superseded", None)
+        self._notify(job)
+        self.wake.set()
+        return job
+
+    async def run_command(self, command, source):
+        """Submit and wait: True/False once sent or failed, None if superseded first"""
+        return await asyncio.shield(self.submit(command, source).done)
+
+    def _notify(self, job):
+        if self.on_update is not None:
+            try:
+                self.on_update(job)
+            except Exception as e:
+                print(f"Command job update failed: {e}")
+
+    def _finish(self, job, status, result, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        if not job.done.done():
+            job.done.set_result(result)
+        self._notify(job)
+
+    async def run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while self.queued is not None:
+                job, self.queued = self.queued, None
+                self.running = job
+                job.status = "running"
+                job.started = time.time()
+                self._notify(job)
+                try:
+                    if job.command == self.applied:
+                        success = True
+                    else:
+                        success = await self.execute(job)
+                        self.applied = job.command if success else None
+                except asyncio.CancelledError:
+                    self._finish(job, "failed", False, "Hub shutting down")
+                    raise
+                except Exception as e:
+                    print(f"Actuator job {job.id} failed: {e}")
+                    self.applied = None
+                    success = False
+                finally:
+                    self.running = None
+                if success:
+                    self._finish(job, "succeeded", True)
+                else:
+                    self._finish(job, "failed", False, "Failed to send command to actuator")
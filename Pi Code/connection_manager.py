@@ -0,0 +1,185 @@
+import asyncio
+import json
+import math
+import time
+from typing import Dict
+
+from fastapi import WebSocket
+
+class Subscription:
+    """What one WebSocket client wants: devices (None = all), latest-reading fields
+    (None = all) and the minimum seconds between sensor updates"""
+
+    def __init__(self, devices=None, fields=None, interval=0.0):
+        self.devices = None if devices is None else frozenset(devices)
+        self.fields = None if fields is None else tuple(sorted(set(fields) | {"timestamp"}))
+        self.interval = interval
+
+    @classmethod
+    def parse(cls, message, known_devices, known_fields):
+        """Build from a {"type": "subscribe", "devices": [...], "fields": [...],
+        "max_rate": updates_per_second} message; raises ValueError if invalid"""
+        devices = cls._names(message, "devices", known_devices)
+        fields = cls._names(message, "fields", known_fields)
+        max_rate = message.get("max_rate")
+        if max_rate is not None and not (isinstance(max_rate, (int, float)) and max_rate > 0):
+            raise ValueError("max_rate must be a positive number of updates per second")
+        return cls(devices, fields, 1.0 / max_rate if max_rate else 0.0)
+
+    @staticmethod
+    def _names(message, key, known):
+        """The message's list of strings under key (None if absent), all of them in known"""
+        names = message.get(key)
+        if names is None:
+            return None
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            raise ValueError(f"{key} must be a list of strings")
+        unknown = set(names) - set(known)
+        if unknown:
+            raise ValueError(f"Unknown {key}: {', '.join(sorted(unknown))}")
+        return names
+
+    def wants(self, device_id):
+        return self.devices is None or device_id in self.devices
+
+    def describe(self):
+        return {
+            "devices": None if self.devices is None else sorted(self.devices),
+            "fields": None if self.fields is None else list(self.fields),
+            "max_rate": 1.0 / self.interval if self.interval else None
+        }
+
+class Client:
+    __slots__ = ("websocket", "queue", "task", "subscription", "pending", "last_flush", "timer")
+
+    def __init__(self, websocket, queue_size):
+        self.websocket = websocket
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.subscription = Subscription()
+        self.pending = {}
+        self.last_flush = -math.inf
+        self.timer = None
+
+class ConnectionManager:
+    """Fans messages out to WebSocket clients, each with its own bounded send queue.
+
+    Sensor updates go through each client's subscription. Rate-limited clients keep
+    one pending state per device, overwritten by newer samples, and are flushed when
+    their interval elapses. A sensor message is serialized once per device version
+    and field selection and shared by every client that wants that view."""
+
+    def __init__(self, queue_size=32):
+        self.queue_size = queue_size
+        self.clients: Dict[WebSocket, Client] = {}
+        self.rendered = {}
+        self.dropped_messages = 0
+        self.renders = 0
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        client = Client(websocket, self.queue_size)
+        self.clients[websocket] = client
+        client.task = asyncio.create_task(self._sender(client))
+
+    def disconnect(self, websocket: WebSocket):
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+        if client.timer is not None:
+            client.timer.cancel()
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+
+    async def _sender(self, client: Client):
+        try:
+            while True:
+                message = await client.queue.get()
+                await client.websocket.send_text(message)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(f"WebSocket send failed: {e}")
+            self.disconnect(client.websocket)
+
+    def _enqueue(self, client: Client, message: str):
+        if client.queue.full():
+            # Slow client: drop its oldest pending message rather than stall everyone
+            client.queue.get_nowait()
+            self.dropped_messages += 1
+        client.queue.put_nowait(message)
+
+    def send(self, websocket: WebSocket, message: str):
+        client = self.clients.get(websocket)
+        if client is not None:
+            self._enqueue(client, message)
+
+    def publish(self, message: str, device_id=None):
+        """Queue an already-serialized message for every client (or every client
+        subscribed to device_id) without waiting"""
+        for client in list(self.clients.values()):
+            if device_id is None or client.subscription.wants(device_id):
+                self._enqueue(client, message)
+
+    async def broadcast(self, message: str):
+        self.publish(message)
+
+    def subscribe(self, websocket: WebSocket, subscription: Subscription):
+        client = self.clients.get(websocket)
+        if client is None:
+            return
+        if client.timer is not None:
+            client.timer.cancel()
+            client.timer = None
+        client.subscription = subscription
+        client.pending.clear()
+        client.last_flush = -math.inf
+
+    def _render(self, device_id, state, fields):
+        key = (device_id, fields)
+        version = getattr(state, "version", None)
+        cached = self.rendered.get(key)
+        if cached is not None and version is not None and cached[0] == version:
+            return cached[1]
+        data = state if fields is None else {field: state[field] for field in fields if field in state}
+        message = json.dumps({"type": "sensor_data", "device": device_id, "data": data})
+        self.rendered[key] = (version, message)
+        self.renders += 1
+        return message
+
+    def send_sensor(self, websocket: WebSocket, device_id, state):
+        """Queue one client's view of a device's state right away; it counts
+        against the client's rate limit like a flush"""
+        client = self.clients.get(websocket)
+        if client is not None and client.subscription.wants(device_id):
+            client.last_flush = time.monotonic()
+            self._enqueue(client, self._render(device_id, state, client.subscription.fields))
+
+    def publish_sensor(self, device_id, state):
+        """Offer a device's latest state to every subscribed client, conflating for
+        clients whose max_rate has not yet allowed another update"""
+        now = time.monotonic()
+        for client in list(self.clients.values()):
+            subscription = client.subscription
+            if not subscription.wants(device_id):
+                continue
+            if not subscription.interval:
+                self._enqueue(client, self._render(device_id, state, subscription.fields))
+                continue
+            client.pending[device_id] = state
+            if client.timer is None:
+                delay = client.last_flush + subscription.interval - now
+                if delay <= 0:
+                    self._flush(client)
+                else:
+                    client.timer = asyncio.get_running_loop().call_later(delay, self._flush, client)
+
+    def _flush(self, client: Client):
+        client.timer = None
+        if client.websocket not in self.clients:
+            return
+        client.last_flush = time.monotonic()
+        fields = client.subscription.fields
+        for device_id, state in client.pending.items():
+            self._enqueue(client, self._render(device_id, state, fields))
+        client.pending.clear()
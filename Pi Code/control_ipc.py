@@ -0,0 +1,85 @@
+import asyncio
+import json
+import os
+
+class ControlServer:
+    """Unix-socket endpoint in the ingest process. API workers send one JSON line
+    per control request, {"action": ..., "args": {...}}, and get one JSON line back."""
+
+    def __init__(self, path, handler):
+        self.path = path
+        self.handler = handler
+        self.server = None
+        self.connections = set()
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._serve, path=self.path)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for writer in list(self.connections):
+            writer.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    async def _serve(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    result = await self.handler(request["action"], request.get("args") or {})
+                except Exception as e:
+                    print(f"Control request failed: {e}")
+                    result = {"error": str(e), "success": False}
+                writer.write(json.dumps(result).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+class ControlClient:
+    """Worker side of ControlServer: one connection, one request in flight at a time"""
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.reader = self.writer = None
+        self.lock = asyncio.Lock()
+
+    async def _close(self):
+        writer, self.writer, self.reader = self.writer, None, None
+        if writer is not None:
+            writer.close()
+
+    async def request(self, action, args=None):
+        async with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.writer is None:
+                        self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+                    self.writer.write(json.dumps({"action": action, "args": args or {}}).encode() + b"\n")
+                    await self.writer.drain()
+                    line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+                    if not line:
+                        raise ConnectionError("ingest process closed the connection")
+                    return json.loads(line)
+                except asyncio.TimeoutError:
+                    # Not retried: the ingest process may still be carrying it out
+                    await self._close()
+                    return {"error": "Ingest process did not answer in time", "success": False}
+                except (OSError, ConnectionError) as e:
+                    # A stale connection from before an ingest restart; reconnect once
+                    await self._close()
+                    if attempt:
+                        return {"error": f"Ingest process unavailable: {e}", "success": False}
@@ -0,0 +1,110 @@
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import datetime
+import math
+
+def lttb_indices(timestamps, values, threshold):
+    """Largest-Triangle-Three-Buckets: indices of at most threshold points that keep
+    the visual shape of values over timestamps. NaN values are never selected
+    as bucket representatives unless a bucket has nothing else."""
+    n = len(timestamps)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    selected = [0]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        count = 0
+        avg_x = avg_y = 0.0
+        for j in range(next_start, next_end):
+            y = values[j]
+            if y == y:
+                avg_x += timestamps[j]
+                avg_y += y
+                count += 1
+        if count:
+            avg_x /= count
+            avg_y /= count
+        else:
+            avg_x, avg_y = timestamps[min(next_start, n - 1)], values[a]
+
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = timestamps[a], values[a]
+        if ay != ay:
+            ay = avg_y
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            y = values[j]
+            if y != y:
+                continue
+            area = abs((ax - avg_x) * (y - ay) - (ax - timestamps[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+def bucket_aggregate(timestamps, columns, width, origin):
+    """Per-bucket mean/min/max of each column; buckets are [origin + k*width, ...).
+    timestamps must be sorted. Returns history entries with field, field_min, field_max."""
+    entries = []
+    n = len(timestamps)
+    lo = 0
+    while lo < n:
+        bucket = origin + math.floor((timestamps[lo] - origin) / width) * width
+        hi = bisect_left(timestamps, bucket + width, lo, n)
+        entry = {}
+        for field, column in columns.items():
+            values = [v for v in column[lo:hi] if v == v]
+            if values:
+                entry[field] = sum(values) / len(values)
+                entry[f"{field}_min"] = min(values)
+                entry[f"{field}_max"] = max(values)
+        entry["count"] = hi - lo
+        entry["timestamp"] = datetime.fromtimestamp(bucket).isoformat()
+        entries.append(entry)
+        lo = hi
+    return entries
+
+def entries_at(timestamps, columns, indices):
+    """History entries for the selected row indices of column data"""
+    entries = []
+    for i in indices:
+        entry = {}
+        for field, column in columns.items():
+            value = column[i]
+            if value == value:
+                entry[field] = value
+        entry["timestamp"] = datetime.fromtimestamp(timestamps[i]).isoformat()
+        entries.append(entry)
+    return entries
+
+class ResponseCache:
+    """Small LRU of computed history responses, keyed by request parameters"""
+
+    def __init__(self, size=128):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
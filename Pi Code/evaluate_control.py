@@ -0,0 +1,121 @@
+"""Offline comparison of the hysteresis and predictive humidity control modes.
+
+Replays recorded humidity through a simple dehumidifier model and scores each mode:
+
+    python evaluate_control.py --db history.db --device SensorDevice --from 2025-06-01
+    python evaluate_control.py --recording session.ndjson --target 45
+
+The recording is treated as the room's uncontrolled humidity. While the dehumidifier
+runs it removes humidity at up to --rate %/min, ramping up and down with a first-order
+thermal lag (--lag seconds); removed humidity leaks back with time constant --leak.
+"""
+import argparse
+
+from history_buffer import parse_time_param
+from humidity_controller import SlopeEstimator, decide_hysteresis, decide_predictive
+
+def load_series(args):
+    """[(timestamp, humidity)] from a history database or an NDJSON recording"""
+    if args.recording:
+        from sim_ble import load_recording
+        return [(offset, reading["H"]) for offset, reading in load_recording(args.recording) if "H" in reading]
+
+    from history_store import HistoryStore
+    from datetime import datetime
+    store = HistoryStore(args.db)
+    _, entries = store.query(args.device, parse_time_param(args.start), parse_time_param(args.end), resolution="raw")
+    return [(datetime.fromisoformat(e["timestamp"]).timestamp(), e["H"]) for e in entries if "H" in e]
+
+def simulate(series, mode, args):
+    target, hysteresis = args.target, args.hysteresis
+    upper, lower = target + hysteresis, target - hysteresis
+    slope = SlopeEstimator(args.window)
+    running = False
+    effect = removed = 0.0
+    last_change = last_command = None
+    cycles = 0
+    on_time = out_of_band = abs_error = 0.0
+    worst_high = worst_low = 0.0
+    previous_t = series[0][0]
+
+    for t, ambient in series:
+        dt = max(0.0, t - previous_t)
+        previous_t = t
+        # Plant: lagged removal rate, leaking back toward ambient
+        goal = args.rate / 60.0 if running else 0.0
+        effect += (goal - effect) * min(1.0, dt / args.lag)
+        removed = max(0.0, removed + (effect - removed / args.leak) * dt)
+        humidity = ambient - removed
+
+        if running:
+            on_time += dt
+        if humidity > upper or humidity < lower:
+            out_of_band += dt
+        abs_error += abs(humidity - target) * dt
+        worst_high = max(worst_high, humidity - upper)
+        worst_low = max(worst_low, lower - humidity)
+
+        slope.add(t, humidity)
+        if mode == "predictive":
+            should_run, _ = decide_predictive(humidity, running, target, hysteresis, slope.slope(), args.horizon)
+        else:
+            should_run, _ = decide_hysteresis(humidity, running, target, hysteresis)
+        if should_run == running:
+            continue
+        dwell = args.min_on if running else args.min_off
+        if last_change is not None and t - last_change < dwell:
+            continue
+        if last_command is not None and t - last_command < args.min_interval:
+            continue
+        running = should_run
+        last_change = last_command = t
+        if running:
+            cycles += 1
+
+    duration = max(1e-9, series[-1][0] - series[0][0])
+    return {
+        "mode": mode,
+        "cycles": cycles,
+        "on_hours": on_time / 3600,
+        "energy_wh": on_time / 3600 * args.power,
+        "out_of_band_pct": 100 * out_of_band / duration,
+        "mean_abs_error": abs_error / duration,
+        "max_overshoot": worst_high,
+        "max_undershoot": worst_low
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--db", help="history database written by hub_bluetooth.py")
+    source.add_argument("--recording", help="NDJSON recording (sim_ble format)")
+    parser.add_argument("--device", default="SensorDevice")
+    parser.add_argument("--from", dest="start")
+    parser.add_argument("--to", dest="end")
+    parser.add_argument("--target", type=float, default=45.0)
+    parser.add_argument("--hysteresis", type=float, default=3.0)
+    parser.add_argument("--horizon", type=float, default=180.0, help="predictive look-ahead, seconds")
+    parser.add_argument("--window", type=float, default=300.0, help="slope fit window, seconds")
+    parser.add_argument("--min-on", type=float, default=120.0)
+    parser.add_argument("--min-off", type=float, default=120.0)
+    parser.add_argument("--min-interval", type=float, default=10.0)
+    parser.add_argument("--rate", type=float, default=0.5, help="max humidity removal, %%/min")
+    parser.add_argument("--lag", type=float, default=120.0, help="thermal lag time constant, seconds")
+    parser.add_argument("--leak", type=float, default=1800.0, help="re-humidification time constant, seconds")
+    parser.add_argument("--power", type=float, default=60.0, help="dehumidifier power draw, watts")
+    args = parser.parse_args()
+
+    series = load_series(args)
+    if len(series) < 2:
+        parser.error("need at least two humidity samples")
+
+    print(f"{len(series)} samples over {(series[-1][0] - series[0][0]) / 3600:.1f} h, "
+          f"target {args.target}% +/- {args.hysteresis}%")
+    print(f"{'mode':<11} {'cycles':>6} {'on h':>6} {'Wh':>7} {'out %':>6} {'MAE':>6} {'over':>6} {'under':>6}")
+    for mode in ("hysteresis", "predictive"):
+        r = simulate(series, mode, args)
+        print(f"{r['mode']:<11} {r['cycles']:>6} {r['on_hours']:>6.2f} {r['energy_wh']:>7.1f} "
+              f"{r['out_of_band_pct']:>6.1f} {r['mean_abs_error']:>6.2f} {r['max_overshoot']:>6.2f} {r['max_undershoot']:>6.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Vendor Chart.js into ./static for BLE_hub_v5.py, so the dashboard never needs the CDN:
+
+    python fetch_chart_js.py
+
+Downloads the pinned CHART_JS_VERSION package from the npm registry, checks the
+tarball against the registry's sha512 integrity, and writes its minified UMD build
+to static/chart.umd.min.js next to the package's MIT license. Run it once on a
+machine with network access and copy static/ to offline kiosks.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+import urllib.request
+
+CHART_JS_VERSION = "4.4.1"
+REGISTRY_URL = f"https://registry.npmjs.org/chart.js/{CHART_JS_VERSION}"
+# Tarball member -> file written under ./static
+FILES = {
+    "package/dist/chart.umd.js": "chart.umd.min.js",
+    "package/LICENSE.md": "chart.js-LICENSE.md"
+}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(HERE, "static")
+
+def fetch(url):
+    with urllib.request.urlopen(url, timeout=60) as response:
+        return response.read()
+
+def check_integrity(data, integrity):
+    """Verify data against an SRI string such as "sha512-<base64>"""
+    algorithm, _, expected = integrity.partition("-")
+    actual = base64.b64encode(hashlib.new(algorithm, data).digest()).decode()
+    if actual != expected:
+        raise ValueError(f"tarball {algorithm} is {actual}, registry says {expected}")
+
+def main():
+    dist = json.loads(fetch(REGISTRY_URL))["dist"]
+    tarball = fetch(dist["tarball"])
+    check_integrity(tarball, dist["integrity"])
+
+    os.makedirs(STATIC_DIR, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(tarball), mode="r:gz") as archive:
+        for member, name in FILES.items():
+            data = archive.extractfile(member).read()
+            with open(os.path.join(STATIC_DIR, name), "wb") as f:
+                f.write(data)
+            print(f"Wrote static/{name} ({len(data)} bytes) from chart.js {CHART_JS_VERSION}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Could not vendor Chart.js {CHART_JS_VERSION}: {e}")
+        sys.exit(1)
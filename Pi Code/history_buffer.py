@@ -0,0 +1,158 @@
+from array import array
+from datetime import datetime
+import math
+
+from downsample import bucket_aggregate, lttb_indices
+
+# T/H/P(M2.5)/V(OC) as in the original JSON frames, plus PM1/PM4/PM10 and N(Ox)
+SENSOR_FIELDS = ("T", "H", "P", "V", "P1", "P4", "P10", "N")
+# Computed at ingest by air_quality: PM2.5 AQI, PM2.5 NowCast and VOC Index NowCast
+DERIVED_FIELDS = ("AQI", "PNC", "VOCI")
+HISTORY_FIELDS = SENSOR_FIELDS + DERIVED_FIELDS
+
+class HistoryBuffer:
+    """Fixed-capacity columnar ring buffer of sensor samples, ordered by timestamp"""
+
+    def __init__(self, capacity, fields=HISTORY_FIELDS):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.columns = {field: array('d', bytes(8 * capacity)) for field in self.fields}
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, index):
+        return (self.start + index) % self.capacity
+
+    def append(self, timestamp, values):
+        """Store one sample in O(1); missing fields are kept as NaN"""
+        if self.count:
+            # Keep the buffer sorted even if the wall clock steps backwards
+            timestamp = max(timestamp, self.timestamps[self._slot(self.count - 1)])
+
+        if self.count < self.capacity:
+            slot = self._slot(self.count)
+            self.count += 1
+        else:
+            slot = self.start
+            self.start = (self.start + 1) % self.capacity
+
+        self.timestamps[slot] = timestamp
+        for field in self.fields:
+            value = values.get(field)
+            self.columns[field][slot] = math.nan if value is None else value
+
+    def export(self, limit=None):
+        """Time-ordered copies of (timestamps, {field: values}) of the newest limit samples
+        (all of them by default), e.g. for snapshots"""
+        lo, hi = self.index_range(limit=limit)
+        return (
+            self.column_slice("timestamp", lo, hi),
+            {field: self.column_slice(field, lo, hi) for field in self.fields}
+        )
+
+    def load(self, timestamps, columns):
+        """Replace the contents with time-ordered samples, keeping the newest if they overflow"""
+        n = min(len(timestamps), self.capacity)
+        skip = len(timestamps) - n
+        self.timestamps[0:n] = timestamps[skip:]
+        for field in self.fields:
+            column = columns.get(field)
+            self.columns[field][0:n] = column[skip:] if column is not None else array('d', [math.nan]) * n
+        self.start = 0
+        self.count = n
+
+    def first_timestamp(self):
+        return self.timestamps[self.start] if self.count else None
+
+    def last_timestamp(self):
+        return self.timestamps[self._slot(self.count - 1)] if self.count else None
+
+    def bisect_left(self, timestamp):
+        """Index of the first sample at or after timestamp, O(log n)"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[self._slot(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, timestamp):
+        """Index just past the last sample at or before timestamp, O(log n)"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[self._slot(mid)] <= timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def index_range(self, start=None, end=None, limit=None):
+        """Logical [lo, hi) covering start..end, trimmed to the newest limit samples"""
+        lo = 0 if start is None else self.bisect_left(start)
+        hi = self.count if end is None else self.bisect_right(end)
+        if limit is not None and limit >= 0 and hi - lo > limit:
+            lo = hi - limit
+        return lo, max(lo, hi)
+
+    def column_slice(self, name, lo, hi):
+        """Copy of one column ("timestamp" or a field) for logical indices [lo, hi)"""
+        column = self.timestamps if name == "timestamp" else self.columns[name]
+        first, last = self._slot(lo), self._slot(hi)
+        if hi - lo <= 0:
+            return column[0:0]
+        if first < last:
+            return column[first:last]
+        return column[first:] + column[:last]
+
+    def entries(self, lo, hi, indices=None):
+        """Materialize logical indices [lo, hi) (or just lo + each of indices) as history dicts"""
+        timestamps = self.column_slice("timestamp", lo, hi)
+        columns = [(field, self.column_slice(field, lo, hi)) for field in self.fields]
+        result = []
+        for i in range(len(timestamps)) if indices is None else indices:
+            entry = {}
+            for field, column in columns:
+                value = column[i]
+                if not math.isnan(value):
+                    entry[field] = value
+            entry["timestamp"] = datetime.fromtimestamp(timestamps[i]).isoformat()
+            result.append(entry)
+        return result
+
+    def query(self, start=None, end=None, limit=None):
+        """History dicts between start and end (epoch seconds), newest limit only"""
+        lo, hi = self.index_range(start, end, limit)
+        return self.entries(lo, hi)
+
+    def downsample(self, start, end, points, field):
+        """At most points samples between start and end, picked by LTTB on field"""
+        lo, hi = self.index_range(start, end)
+        timestamps = self.column_slice("timestamp", lo, hi)
+        indices = lttb_indices(timestamps, self.column_slice(field, lo, hi), points)
+        return self.entries(lo, hi, indices)
+
+    def aggregate(self, start, end, width):
+        """Mean/min/max per width-second bucket (aligned to the epoch) in [start, end)"""
+        lo = 0 if start is None else self.bisect_left(start)
+        hi = self.count if end is None else max(lo, self.bisect_left(end))
+        columns = {field: self.column_slice(field, lo, hi) for field in self.fields}
+        return bucket_aggregate(self.column_slice("timestamp", lo, hi), columns, width, 0.0)
+
+    def latest(self, limit):
+        return self.entries(max(0, self.count - limit), self.count)
+
+def parse_time_param(value):
+    """Accept epoch seconds or an ISO-8601 string from a query parameter"""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+
+def format_cursor(ts, rowid):
+    return f"{ts!r}:{rowid}"
+
+def parse_cursor(value):
+    """(ts, rowid) from a cursor column value; raises ValueError if malformed"""
+    ts, _, rowid = value.partition(":")
+    return float(ts), int(rowid)
+
+def _csv_chunk(device, fields, resolution, rows, header):
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    if header:
+        writer.writerow(["cursor", "device", "ts", "timestamp", "resolution", *fields])
+    for rowid, ts, *values in rows:
+        writer.writerow([
+            format_cursor(ts, rowid), device, ts, datetime.fromtimestamp(ts).isoformat(), resolution,
+            *("" if value is None else value for value in values)
+        ])
+    return out.getvalue()
+
+def _ndjson_chunk(device, fields, resolution, rows):
+    lines = []
+    for rowid, ts, *values in rows:
+        entry = {"cursor": format_cursor(ts, rowid), "device": device, "ts": ts,
+                 "timestamp": datetime.fromtimestamp(ts).isoformat(), "resolution": resolution}
+        for field, value in zip(fields, values):
+            if value is not None:
+                entry[field] = value
+        lines.append(json.dumps(entry))
+    lines.append("")
+    return "\n".join(lines)
+
+def export_stream(chunks, device, fields, fmt="csv", compress=False, header=True):
+    """Encode HistoryStore.export (resolution, rows) chunks as CSV or NDJSON bytes, one piece
+    per chunk. Every row carries its resolution ("raw" or "1m" for ranges older than raw
+    retention) and a cursor; passing the last cursor received back resumes the export.
+    With compress the output is a single gzip stream, sync-flushed after each chunk so
+    an interrupted download still decompresses up to its last complete chunk."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    first = True
+    for resolution, rows in chunks:
+        if fmt == "csv":
+            text = _csv_chunk(device, fields, resolution, rows, header and first)
+        else:
+            text = _ndjson_chunk(device, fields, resolution, rows)
+        first = False
+        data = text.encode()
+        if compressor is not None:
+            data = compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield data
+    if fmt == "csv" and header and first:
+        data = _csv_chunk(device, fields, None, (), True).encode()
+        yield compressor.compress(data) if compressor is not None else data
+    if compressor is not None:
+        yield compressor.flush()
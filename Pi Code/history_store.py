@@ -0,0 +1,361 @@
+import math
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from history_buffer import DERIVED_FIELDS, HISTORY_FIELDS
+
+ROLLUP_TIERS = (("1m", 60), ("1h", 3600))
+RAW_MAX_SPAN = 6 * 60 * 60          # raw rows for spans up to 6 hours
+MINUTE_MAX_SPAN = 7 * 24 * 60 * 60  # 1-minute rollups up to a week, hourly beyond
+RAW_RETENTION = 30 * 24 * 60 * 60   # raw rows are pruned after this; rollups are kept forever
+PRUNE_INTERVAL = 60 * 60
+# Distinct devices by seeking the (device, ts) index once per device instead of scanning it
+DEVICES_SQL = (
+    "WITH RECURSIVE devices(device) AS ("
+    "SELECT min(device) FROM samples UNION ALL "
+    "SELECT (SELECT min(device) FROM samples WHERE device > devices.device) FROM devices WHERE device IS NOT NULL) "
+    "SELECT device FROM devices WHERE device IS NOT NULL"
+)
+
+class HistoryStore:
+    """SQLite (WAL) sample store fed by a background writer that commits in batches
+    and maintains 1-minute and 1-hour min/max/mean rollups. With keep_raw, samples
+    also carry the unfiltered sensor readings in <field>_raw columns (not rolled up)."""
+
+    def __init__(self, path, fields=HISTORY_FIELDS, batch_size=100, flush_interval=5.0, max_pending=10000,
+                 keep_raw=False, raw_retention=RAW_RETENTION):
+        self.path = path
+        self.raw_retention = raw_retention
+        self.fields = tuple(fields)
+        self.raw_fields = tuple(f"{field}_raw" for field in self.fields if field not in DERIVED_FIELDS) if keep_raw else ()
+        self.sample_fields = self.fields + self.raw_fields
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.writer_thread = None
+        self.dropped = 0
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self, conn):
+        columns = ", ".join(f"{field} REAL" for field in self.sample_fields)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS samples (device TEXT NOT NULL, ts REAL NOT NULL, {columns})")
+        conn.execute("CREATE INDEX IF NOT EXISTS samples_device_ts ON samples (device, ts)")
+        aggregates = ", ".join(self._aggregate_columns(field) for field in self.fields)
+        for tier, _ in ROLLUP_TIERS:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS rollup_{tier} "
+                f"(device TEXT NOT NULL, bucket REAL NOT NULL, {aggregates}, PRIMARY KEY (device, bucket))"
+            )
+        self._add_missing_columns(conn)
+        conn.commit()
+
+    @staticmethod
+    def _aggregate_columns(field):
+        return f"{field}_n INTEGER NOT NULL DEFAULT 0, {field}_sum REAL, {field}_min REAL, {field}_max REAL"
+
+    def _add_missing_columns(self, conn):
+        """Upgrade databases created before a field was added"""
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(samples)")}
+        for field in self.sample_fields:
+            if field not in existing:
+                conn.execute(f"ALTER TABLE samples ADD COLUMN {field} REAL")
+        for tier, _ in ROLLUP_TIERS:
+            existing = {row[1] for row in conn.execute(f"PRAGMA table_info(rollup_{tier})")}
+            for field in self.fields:
+                if f"{field}_n" not in existing:
+                    for column in self._aggregate_columns(field).split(", "):
+                        conn.execute(f"ALTER TABLE rollup_{tier} ADD COLUMN {column}")
+
+    def start(self):
+        conn = self._connect()
+        self._create_schema(conn)
+        conn.close()
+        self.writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer_thread.start()
+
+    def close(self):
+        """Flush anything still queued and stop the writer"""
+        if self.writer_thread is None:
+            return
+        self.pending.put(None)
+        self.writer_thread.join(timeout=30.0)
+        self.writer_thread = None
+
+    def add(self, device, timestamp, values):
+        """Queue one sample for the writer; never blocks the caller"""
+        try:
+            self.pending.put_nowait((device, timestamp, values))
+        except queue.Full:
+            self.dropped += 1
+
+    def _writer_loop(self):
+        conn = self._connect()
+        last_prune = 0.0
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.pending.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+
+            if batch:
+                try:
+                    self._write_batch(conn, batch)
+                except sqlite3.Error as e:
+                    print(f"History store write failed ({len(batch)} samples): {e}")
+                    conn.rollback()
+
+            if time.time() - last_prune > PRUNE_INTERVAL:
+                last_prune = time.time()
+                try:
+                    self._prune(conn, last_prune - self.raw_retention)
+                except sqlite3.Error as e:
+                    print(f"History store prune failed: {e}")
+                    conn.rollback()
+        conn.close()
+
+    def _prune(self, conn, cutoff):
+        """Delete raw samples older than cutoff, one (device, ts) index range per device
+        rather than a full table scan"""
+        devices = [row[0] for row in conn.execute(DEVICES_SQL)]
+        conn.execute("BEGIN")
+        for device in devices:
+            conn.execute("DELETE FROM samples WHERE device = ? AND ts < ?", (device, cutoff))
+        conn.commit()
+
+    def _write_batch(self, conn, batch):
+        rows = []
+        for device, timestamp, values in batch:
+            rows.append((device, timestamp, *(values.get(field) for field in self.sample_fields)))
+        placeholders = ", ".join("?" for _ in range(len(self.sample_fields) + 2))
+        conn.execute("BEGIN")
+        conn.executemany(
+            f"INSERT INTO samples (device, ts, {', '.join(self.sample_fields)}) VALUES ({placeholders})", rows
+        )
+        for tier, width in ROLLUP_TIERS:
+            self._upsert_rollup(conn, tier, self._aggregate(batch, width))
+        conn.commit()
+
+    def _aggregate(self, batch, width):
+        """Pre-aggregate a batch per (device, bucket) so each bucket is upserted once"""
+        buckets = {}
+        for device, timestamp, values in batch:
+            key = (device, timestamp - timestamp % width)
+            aggregate = buckets.get(key)
+            if aggregate is None:
+                aggregate = buckets[key] = {field: [0, 0.0, None, None] for field in self.fields}
+            for field in self.fields:
+                value = values.get(field)
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    continue
+                stats = aggregate[field]
+                stats[0] += 1
+                stats[1] += value
+                stats[2] = value if stats[2] is None else min(stats[2], value)
+                stats[3] = value if stats[3] is None else max(stats[3], value)
+        return buckets
+
+    def _upsert_rollup(self, conn, tier, buckets):
+        if not buckets:
+            return
+        columns = ["device", "bucket"]
+        updates = []
+        for field in self.fields:
+            columns += [f"{field}_n", f"{field}_sum", f"{field}_min", f"{field}_max"]
+            updates += [
+                f"{field}_n = {field}_n + excluded.{field}_n",
+                f"{field}_sum = coalesce({field}_sum, 0) + coalesce(excluded.{field}_sum, 0)",
+                f"{field}_min = min(coalesce({field}_min, excluded.{field}_min), coalesce(excluded.{field}_min, {field}_min))",
+                f"{field}_max = max(coalesce({field}_max, excluded.{field}_max), coalesce(excluded.{field}_max, {field}_max))",
+            ]
+        rows = []
+        for (device, bucket), aggregate in buckets.items():
+            row = [device, bucket]
+            for field in self.fields:
+                n, total, low, high = aggregate[field]
+                row += [n, total if n else None, low, high]
+            rows.append(row)
+        conn.executemany(
+            f"INSERT INTO rollup_{tier} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (device, bucket) DO UPDATE SET {', '.join(updates)}",
+            rows
+        )
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10.0)
+        return conn
+
+    @staticmethod
+    def resolution_for_span(span):
+        if span <= RAW_MAX_SPAN:
+            return "raw"
+        if span <= MINUTE_MAX_SPAN:
+            return "1m"
+        return "1h"
+
+    def _fetch(self, device, start, end, limit, resolution, fields=None):
+        end = time.time() if end is None else end
+        start = 0.0 if start is None else start
+        resolution = resolution or self.resolution_for_span(end - start)
+
+        if resolution == "raw":
+            sql = f"SELECT ts, {', '.join(fields or self.fields)} FROM samples WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts DESC"
+        else:
+            selected = ", ".join(f"{field}_n, {field}_sum, {field}_min, {field}_max" for field in self.fields)
+            sql = f"SELECT bucket, {selected} FROM rollup_{resolution} WHERE device = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket DESC"
+        params = [device, start, end]
+        if limit is not None and limit >= 0:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = self._reader().execute(sql, params).fetchall()
+        rows.reverse()
+        return resolution, rows
+
+    def query(self, device, start=None, end=None, limit=None, resolution=None, raw=False):
+        """Samples between start and end (epoch seconds) from the tier that suits the span.
+        Returns (resolution, entries); rollup entries carry the mean plus _min/_max.
+        raw adds the unfiltered <field>_raw values to raw-tier entries."""
+        fields = self.sample_fields if raw else self.fields
+        resolution, rows = self._fetch(device, start, end, limit, resolution, fields)
+        entries = []
+        for row in rows:
+            entry = {}
+            if resolution == "raw":
+                for field, value in zip(fields, row[1:]):
+                    if value is not None:
+                        entry[field] = value
+            else:
+                for i, field in enumerate(self.fields):
+                    n, total, low, high = row[1 + 4 * i: 5 + 4 * i]
+                    if n:
+                        entry[field] = total / n
+                        entry[f"{field}_min"] = low
+                        entry[f"{field}_max"] = high
+            entry["timestamp"] = datetime.fromtimestamp(row[0]).isoformat()
+            entries.append(entry)
+        return resolution, entries
+
+    def raw_boundary(self):
+        """Start of the minute from which raw rows are still retained"""
+        cutoff = time.time() - self.raw_retention
+        return cutoff - cutoff % 60 + 60
+
+    def export(self, device, start=None, end=None, after=None, chunk_size=2000):
+        """Yield every sample between start and end, oldest first, as (resolution, rows)
+        chunks of up to chunk_size (rowid, ts, *sample_fields) rows. Time older than the raw
+        retention comes from the 1-minute rollups ("1m": per-minute means, no _raw values),
+        the rest from raw rows ("raw"). Each chunk is its own short query, keyset-paginated
+        on (ts, rowid), so memory stays flat and no read transaction is held open between
+        chunks. after=(ts, rowid) resumes just past that row."""
+        end = time.time() if end is None else end
+        start = 0.0 if start is None else start
+        after_ts, after_id = after if after is not None else (start, -1)
+        boundary = self.raw_boundary()
+        if after_ts < boundary and start < boundary:
+            means = ", ".join(f"{field}_sum / {field}_n" for field in self.fields)
+            nulls = "".join(", NULL" for _ in self.raw_fields)
+            sql = (f"SELECT rowid, bucket, {means}{nulls} FROM rollup_1m "
+                   f"WHERE device = ? AND bucket <= ? AND bucket >= ? AND (bucket > ? OR rowid > ?) "
+                   f"ORDER BY bucket, rowid LIMIT ?")
+            for rows in self._export_chunks(sql, device, min(end, boundary - 60), start, after_ts, after_id, chunk_size):
+                yield "1m", rows
+            after_ts, after_id = boundary, -1
+        sql = (f"SELECT rowid, ts, {', '.join(self.sample_fields)} FROM samples "
+               f"WHERE device = ? AND ts <= ? AND ts >= ? AND (ts > ? OR rowid > ?) "
+               f"ORDER BY ts, rowid LIMIT ?")
+        for rows in self._export_chunks(sql, device, end, start, after_ts, after_id, chunk_size):
+            yield "raw", rows
+
+    def _export_chunks(self, sql, device, end, start, after_ts, after_id, chunk_size):
+        while True:
+            rows = self._reader().execute(
+                sql, (device, end, max(start, after_ts), after_ts, after_id, chunk_size)
+            ).fetchall()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < chunk_size:
+                return
+            after_id, after_ts = rows[-1][0], rows[-1][1]
+
+    def hourly_totals(self, device, fields, start):
+        """[(hour_start, {field: (sum, count)})] from the hourly rollups since start"""
+        selected = ", ".join(f"{field}_sum, {field}_n" for field in fields)
+        rows = self._reader().execute(
+            f"SELECT bucket, {selected} FROM rollup_1h WHERE device = ? AND bucket >= ? ORDER BY bucket",
+            (device, start - start % 3600)
+        ).fetchall()
+        return [
+            (row[0], {field: (row[1 + 2 * i] or 0.0, row[2 + 2 * i]) for i, field in enumerate(fields)})
+            for row in rows
+        ]
+
+    def columns(self, device, start=None, end=None, resolution=None):
+        """Like query, but as (resolution, timestamps, {field: values}) with NaN for gaps"""
+        resolution, rows = self._fetch(device, start, end, None, resolution)
+        timestamps = [row[0] for row in rows]
+        columns = {}
+        for i, field in enumerate(self.fields):
+            if resolution == "raw":
+                columns[field] = [math.nan if row[1 + i] is None else row[1 + i] for row in rows]
+            else:
+                columns[field] = [row[2 + 4 * i] / row[1 + 4 * i] if row[1 + 4 * i] else math.nan for row in rows]
+        return resolution, timestamps, columns
+
+    def aggregate(self, device, start, end, width):
+        """Mean/min/max per width-second bucket (aligned to the epoch) in [start, end),
+        computed in SQL from the coarsest tier that is still finer than the bucket"""
+        end = time.time() if end is None else end
+        start = 0.0 if start is None else start
+        if width >= 3600:
+            resolution = "1h"
+        elif width >= 60:
+            resolution = "1m"
+        else:
+            resolution = "raw"
+
+        if resolution == "raw":
+            selected = ", ".join(f"count({f}), sum({f}), min({f}), max({f})" for f in self.fields)
+            sql = (f"SELECT CAST(ts / ? AS INTEGER) AS b, count(*), {selected} FROM samples "
+                   f"WHERE device = ? AND ts >= ? AND ts < ? GROUP BY b ORDER BY b")
+        else:
+            selected = ", ".join(f"sum({f}_n), sum({f}_sum), min({f}_min), max({f}_max)" for f in self.fields)
+            counts = ", ".join(f"sum({f}_n)" for f in self.fields)
+            sql = (f"SELECT CAST(bucket / ? AS INTEGER) AS b, max({counts}), {selected} FROM rollup_{resolution} "
+                   f"WHERE device = ? AND bucket >= ? AND bucket < ? GROUP BY b ORDER BY b")
+        rows = self._reader().execute(sql, (width, device, start, end)).fetchall()
+
+        entries = []
+        for row in rows:
+            entry = {}
+            for i, field in enumerate(self.fields):
+                n, total, low, high = row[2 + 4 * i: 6 + 4 * i]
+                if n:
+                    entry[field] = total / n
+                    entry[f"{field}_min"] = low
+                    entry[f"{field}_max"] = high
+            entry["count"] = row[1]
+            entry["timestamp"] = datetime.fromtimestamp(row[0] * width).isoformat()
+            entries.append(entry)
+        return resolution, entries
@@ -1,7 +1,6 @@
 from multiprocessing import Process
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
@@ -9,8 +8,39 @@ import json
 import asyncio
 import threading
 import time
-from typing import List
+import os
+import math
+import random
+import signal
+import sys
+from array import array
 from datetime import datetime
+from history_buffer import DERIVED_FIELDS, HISTORY_FIELDS, parse_time_param
+from air_quality import HOUR, NOWCAST_HOURS
+from alert_rules import AlertEngine
+from downsample import ResponseCache, entries_at, lttb_indices
+from history_store import ROLLUP_TIERS, HistoryStore
+from history_export import EXPORT_FORMATS, export_stream, parse_cursor
+from actuator_session import ActuatorSession
+from command_queue import CommandQueue
+from sensor_registry import SensorRegistry, parse_sensor_config
+from ingest_bridge import IngestBridge
+from versioned_state import BOOT_ID, VersionedState
+from humidity_controller import CONTROL_MODES, HumidityController
+from sensor_frame import decode_payload, encode_config
+from signal_filters import parse_filter_spec
+from metrics import registry, monitor_loop_lag, ACTUATOR_RTT_SECONDS, BLE_CONNECT_SECONDS, BLE_RECONNECTS
+from ble_scanner import DeviceScanner
+from state_snapshot import SnapshotFile, decode_history, encode_history
+from static_cache import StaticBundle
+from connection_manager import ConnectionManager, Subscription
+from shared_state import CONTROL_RECORD, SharedState
+from control_ipc import ControlClient, ControlServer
+
+# Processes spawned by the multi-worker launcher run this file as __mp_main__; alias it so
+# uvicorn's "hub_bluetooth:app" import reuses it instead of executing it a second time
+if __name__ in ("__main__", "__mp_main__"):
+    sys.modules.setdefault("hub_bluetooth", sys.modules[__name__])
 
 '''
 import mysql.connector as mysql
@@ -26,258 +56,448 @@ db_base = os.environ['MYSQL_DATABASE']
 
 SENSOR_NAME = "SensorDevice"
 SENSOR_CHAR_UUID = "beb5483e-36e1-4688-b7f5-ea07361b26a8"
+SENSOR_CONFIG_UUID = "beb5483f-36e1-4688-b7f5-ea07361b26a8"
 ACTUATOR_NAME = "Dehumidify"
 ACTUATOR_CHAR_UUID = "a16beeb4-bf06-4c17-9cec-fbc82db1a016"
 
-latest_data = {
-    "temperature": 0,
-    "humidity": 0,
-    "pm_levels": 0,
-    "voc_levels": 0,
-    "timestamp": datetime.now().isoformat(),
-    "history": []
+HISTORY_CAPACITY = 6 * 60 * 60  # 6 hours of 1 Hz samples
+HISTORY_SNAPSHOT_SIZE = 600
+HISTORY_DB_PATH = os.environ.get("HUB_HISTORY_DB", "history.db")
+# Raw samples older than this are pruned; the 1-minute and 1-hour rollups are kept forever
+RAW_RETENTION_DAYS = float(os.environ.get("HUB_RAW_RETENTION_DAYS", 30))
+WS_SEND_QUEUE_SIZE = 32
+SENSOR_RECONNECT_DELAY = 5.0
+SENSOR_MAX_RECONNECT_DELAY = 60.0
+INGEST_QUEUE_SIZE = 1000
+HISTORY_CACHE_SIZE = 128
+LONG_POLL_MAX_TIMEOUT = 60.0
+MIN_ON_TIME = 120.0        # seconds the dehumidifier stays on before auto control may stop it
+MIN_OFF_TIME = 120.0       # seconds it stays off before auto control may restart it
+MIN_COMMAND_INTERVAL = 10.0
+PREDICT_WINDOW = 300.0     # seconds of humidity history the predictive mode fits a slope to
+PREDICT_HORIZON = 180.0    # how far ahead it extrapolates, roughly the Peltier's thermal lag
+SCAN_CACHE_TTL = 60.0      # how long an advertised address is trusted without a fresh advert
+STATE_SNAPSHOT_PATH = os.environ.get("HUB_STATE_PATH", "hub_state")  # .control/.history files
+CONTROL_SNAPSHOT_INTERVAL = 1.0
+HISTORY_SNAPSHOT_INTERVAL = 60.0
+# Newest samples per sensor kept in the history snapshot; warm starts rebuild the rest of
+# the in-memory history from the store, so the snapshot stays small on the SD card
+HISTORY_SNAPSHOT_TAIL = 120
+ALERT_RULES_PATH = os.environ.get("HUB_ALERT_RULES", "alert_rules.txt")
+ALERT_CHECK_INTERVAL = 1.0  # silence checks and rules-file reload polling
+REPORT_POLICY_INTERVAL = 5.0  # how often each connected sensor's reporting profile is re-evaluated
+# Set to 0 to leave sensors at their firmware default of reporting every reading
+ADAPTIVE_REPORTING = os.environ.get("HUB_ADAPTIVE_REPORTING", "1") != "0"
+# control_status keys that survive a restart
+PERSISTED_CONTROL_FIELDS = (
+    "dehumidifier_enabled", "auto_mode", "target_humidity", "hysteresis", "min_on_time",
+    "min_off_time", "control_mode", "predict_horizon", "last_command", "auto_control_active"
+)
+
+# "loop" runs BLE ingest as tasks on the server's event loop; "thread" keeps it on its
+# own thread and hands samples over through the ingest bridge
+BLE_RUNTIME = os.environ.get("HUB_BLE_RUNTIME", "loop")
+
+# HUB_WORKERS > 1 splits the hub: one ingest process owns BLE, control and storage and
+# publishes state to shared memory; that many uvicorn workers serve the API and /ws from it.
+# HUB_MODE is set by the launcher: "single" (default), "ingest" or "worker".
+WORKERS = int(os.environ.get("HUB_WORKERS", 1))
+HUB_MODE = os.environ.get("HUB_MODE", "single")
+SHARED_STATE_NAME = os.environ.get("HUB_SHM_NAME", "iot_hub_state")
+CONTROL_SOCKET_PATH = os.environ.get("HUB_CONTROL_SOCKET", "/tmp/iot_hub_control.sock")
+SHARED_STATE_INTERVAL = 0.02   # how often the ingest process publishes and workers poll
+HISTORY_FLUSH_INTERVAL = 5.0
+INGEST_FLUSH_INTERVAL = 1.0    # workers read history from the store, so the ingest process commits more often
+
+# HUB_SENSORS="living_room=SensorDevice,bedroom=SensorDevice2"; the first sensor drives humidity control
+SENSORS = parse_sensor_config(os.environ.get("HUB_SENSORS", SENSOR_NAME))
+
+# Per-field filter chains applied between decode and state update, "field=filter:args,...;..."
+# (ema:alpha, median:window, clamp:units_per_second, hampel:window:n_sigmas[:min_scale], with
+# min_scale in the field's units and defaulting to signal_filters.HAMPEL_MIN_SCALES). Dashboards,
+# history and auto control see the filtered values; the store keeps the raw ones too.
+SIGNAL_FILTERS = parse_filter_spec(os.environ.get(
+    "HUB_FILTERS",
+    "T=hampel:15:3;H=hampel:15:3,ema:0.5;P=hampel:15:4,median:5;V=hampel:15:3;"
+    "P1=hampel:15:4;P4=hampel:15:4;P10=hampel:15:4"
+))
+
+sensors = SensorRegistry(SENSORS, HISTORY_CAPACITY, SIGNAL_FILTERS)
+latest_data = sensors.primary.latest
+history_store = HistoryStore(HISTORY_DB_PATH, keep_raw=True, flush_interval=HISTORY_FLUSH_INTERVAL,
+                             raw_retention=RAW_RETENTION_DAYS * 24 * 60 * 60)
+ingest_bridge = IngestBridge(INGEST_QUEUE_SIZE)
+history_cache = ResponseCache(HISTORY_CACHE_SIZE)
+ble_tasks = []
+metrics_tasks = []
+frontend = StaticBundle("build")
+control_snapshot = SnapshotFile(f"{STATE_SNAPSHOT_PATH}.control")
+history_snapshot = SnapshotFile(f"{STATE_SNAPSHOT_PATH}.history")
+shared_state = None
+control_server = None
+control_client = ControlClient(CONTROL_SOCKET_PATH) if HUB_MODE == "worker" else None
+shared_device_info = {}
+control_events = {"sequence": 0, "reason": None, "job_sequence": 0, "jobs": [], "alert_sequence": 0, "alerts": []}
+JOB_UPDATES_SHARED = 8   # recent job and alert updates carried in the shared control record
+
+NOTIFICATIONS = registry.counter("hub_notifications_total", "Sensor notifications received", ("device",))
+DECODE_ERRORS = registry.counter("hub_decode_errors_total", "Sensor notifications that failed to decode", ("device",))
+DECODE_SECONDS = registry.histogram(
+    "hub_notify_decode_seconds", "Time to decode one sensor notification",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005)
+)
+NOTIFY_TO_BROADCAST_SECONDS = registry.histogram(
+    "hub_notify_to_broadcast_seconds", "Time from a sensor notification arriving to its update being queued for clients",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+)
+
+ALERT_EVENTS = registry.counter("hub_alert_events_total", "Alerts fired and resolved", ("rule", "status"))
+SENSOR_CONFIG_WRITES = registry.counter(
+    "hub_sensor_config_writes_total", "Reporting configs written to sensors", ("device", "profile", "result")
+)
+
+def publish_alert(event):
+    ALERT_EVENTS.labels(event["rule"], event["status"]).inc()
+    control_events["alert_sequence"] += 1
+    control_events["alerts"] = control_events["alerts"][-(JOB_UPDATES_SHARED - 1):] + [[control_events["alert_sequence"], event]]
+    manager.publish(json.dumps({"type": "alert", "alert": event}), event["device"])
+
+alert_engine = AlertEngine(HISTORY_FIELDS, publish_alert)
+alert_rules_signature = None
+registry.callback("hub_alerts_active", "Alerts currently firing", lambda: len(alert_engine.active()))
+
+async def sensor_snapshot(device=None):
+    """Latest readings plus the most recent history, as sent to dashboards"""
+    device = device or sensors.primary
+    if HUB_MODE == "worker":
+        _, history = await asyncio.to_thread(
+            history_store.query, device.id, None, None, HISTORY_SNAPSHOT_SIZE, "raw"
+        )
+    else:
+        history = device.history.latest(HISTORY_SNAPSHOT_SIZE)
+    return {
+        **device.latest,
+        "device": device.id,
+        "history": history
+    }
+
+# Payload field -> key in a device's latest readings
+LATEST_FIELDS = {
+    "H": "humidity",
+    "P": "pm_levels",
+    "V": "voc_levels",
+    "P1": "pm1_levels",
+    "P4": "pm4_levels",
+    "P10": "pm10_levels",
+    "N": "nox_levels",
+    "AQI": "aqi",
+    "PNC": "pm25_nowcast",
+    "VOCI": "voc_nowcast"
 }
 
-control_status = {
+def ingest_sample(device, payload, age=0.0, received=None):
+    """Apply one decoded sensor payload to a device's state, history and subscribers.
+    age is how many seconds before now the reading was taken (batched frames);
+    received is the perf_counter() time its notification arrived."""
+    timestamp = time.time() - age
+    raw = payload
+    payload = device.filters.apply(raw, timestamp)
+    device.air_quality.add(timestamp, payload)
+    quality = device.air_quality.current(timestamp)
+    for field in DERIVED_FIELDS:
+        payload[field] = quality[field]
+    alert_engine.observe(device.id, timestamp, payload)
+    
+    latest = device.latest
+    latest["aqi_category"] = quality["aqi_category"]
+    latest["voc_category"] = quality["voc_category"]
+    if "T" in payload:
+        latest["temperature"] = (payload["T"] * 9/5) + 32
+    for field, key in LATEST_FIELDS.items():
+        if field in payload:
+            latest[key] = payload[field]
+    latest["timestamp"] = datetime.fromtimestamp(timestamp).isoformat()
+    
+    device.history.append(timestamp, payload)
+    history_store.add(device.id, timestamp, {**payload, **{f"{field}_raw": value for field, value in raw.items()}})
+    
+    manager.publish_sensor(device.id, latest)
+    if received is not None:
+        NOTIFY_TO_BROADCAST_SECONDS.observe(time.perf_counter() - received)
+    
+    if device is sensors.primary:
+        humidity_controller.offer(latest["humidity"], timestamp)
+
+control_status = VersionedState({
     "dehumidifier_enabled": False,
     "auto_mode": True,
     "target_humidity": 20,
     "hysteresis": 3.0,
+    "min_on_time": MIN_ON_TIME,
+    "min_off_time": MIN_OFF_TIME,
+    "control_mode": "hysteresis",
+    "predict_horizon": PREDICT_HORIZON,
+    "prediction": None,
     "last_command": "NONE",
     "success": True,
     "auto_control_active": False,
     "sensor_connected": False,
     "actuator_last_seen": None
-}
+})
 
 class HumidityTarget(BaseModel):
     target: float
     hysteresis: float = None
+    min_on_time: float = None
+    min_off_time: float = None
+    predict_horizon: float = None
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+manager = ConnectionManager(WS_SEND_QUEUE_SIZE)
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+# Per-process WebSocket metrics; with HUB_WORKERS > 1 a worker serves these itself and
+# everything else from the ingest process
+WORKER_METRICS = ("hub_ws_clients", "hub_ws_send_queue_depth", "hub_ws_send_queue_depth_max",
+                  "hub_ws_dropped_messages_total", "hub_ws_sensor_renders_total")
+registry.callback("hub_ws_clients", "Connected WebSocket clients", lambda: len(manager.clients))
+registry.callback("hub_ws_send_queue_depth", "Messages waiting in all WebSocket send queues",
+                  lambda: sum(c.queue.qsize() for c in manager.clients.values()))
+registry.callback("hub_ws_send_queue_depth_max", "Deepest single WebSocket send queue",
+                  lambda: max((c.queue.qsize() for c in manager.clients.values()), default=0))
+registry.callback("hub_ws_dropped_messages_total", "Messages dropped for slow WebSocket clients",
+                  lambda: manager.dropped_messages, kind="counter")
+registry.callback("hub_ws_sensor_renders_total", "Sensor messages serialized (shared across clients with the same view)",
+                  lambda: manager.renders, kind="counter")
+registry.callback("hub_ingest_bridge_pending", "Samples waiting to be handed to the event loop",
+                  lambda: len(ingest_bridge.pending))
+registry.callback("hub_ingest_bridge_dropped_total", "Samples dropped by the ingest bridge",
+                  lambda: ingest_bridge.dropped, kind="counter")
+registry.callback("hub_history_store_pending", "Samples queued for the history writer",
+                  lambda: history_store.pending.qsize())
+registry.callback("hub_history_store_dropped_total", "Samples dropped because the history writer fell behind",
+                  lambda: history_store.dropped, kind="counter")
+registry.callback("hub_sensor_connected", "Whether each sensor is connected",
+                  lambda: {(device.id,): int(device.connected) for device in sensors}, labelnames=("device",))
+registry.callback("hub_sensor_fast_reporting", "Whether each sensor is set to report every reading",
+                  lambda: {(device.id,): int((device.reporting.applied or {}).get("profile", "fast") == "fast")
+                           for device in sensors}, labelnames=("device",))
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+def report_thresholds(device):
+    """Value thresholds [(field, threshold)] and rate rules a device's readings are watched
+    against, plus the shortest silence alert, for choosing its reporting profile"""
+    levels = [(rule.field, rule.threshold) for rule in alert_engine.rules if rule.kind == "value"]
+    rates = [rule for rule in alert_engine.rules if rule.kind == "rate"]
+    silent_after = min((rule.threshold for rule in alert_engine.rules if rule.kind == "silent"), default=None)
+    if device is sensors.primary and control_status["auto_mode"]:
+        target, band = control_status["target_humidity"], control_status["hysteresis"]
+        levels += [("H", target - band), ("H", target + band)]
+    return levels, rates, silent_after
 
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                self.active_connections.remove(connection)
+try:
+    if os.environ.get("HUB_BLE_BACKEND") == "sim":
+        from sim_ble import BleakClient, BleakScanner
+    else:
+        from bleak import BleakClient, BleakScanner
 
-manager = ConnectionManager()
+    def set_sensor_connected(device, connected):
+        device.connected = connected
+        ingest_bridge.submit(publish_connection_status, device, connected)
 
-try:
-    from bleak import BleakClient, BleakScanner
+    def publish_connection_status(device, connected):
+        device.latest.touch()
+        if device is sensors.primary:
+            control_status["sensor_connected"] = connected
+        manager.publish(json.dumps({
+            "type": "connection_status",
+            "device": device.id,
+            "sensor_connected": connected
+        }), device.id)
 
-    async def ble_sensor_loop():
+    async def ble_sensor_loop(device):
+        """Keep one sensor connected, reconnecting on its own backoff schedule"""
+        delay = SENSOR_RECONNECT_DELAY
         while True:
+            connect_started = None
             try:
-                print("Scanning for sensor...")
-                device = await BleakScanner.find_device_by_filter(
-                    lambda d, _: d.name == SENSOR_NAME,
-                    timeout=10.0
-                )
-                
-                if not device:
-                    print("Sensor not found, retrying in 5 seconds...")
-                    control_status["sensor_connected"] = False
-                    await asyncio.sleep(5)
-                    continue
+                target = await device_scanner.resolve(device.ble_name, timeout=10.0)
+                if target is None:
+                    print(f"Sensor {device.ble_name} not found")
+                    raise ConnectionError("not found")
+                device.address = target
 
-                async with BleakClient(device) as client:
-                    print(f"Connected to {SENSOR_NAME}")
-                    control_status["sensor_connected"] = True
-                    
-                    await manager.broadcast(json.dumps({
-                        "type": "connection_status",
-                        "sensor_connected": True
-                    }))
+                connect_started = time.perf_counter()
+                async with BleakClient(target) as client:
+                    BLE_CONNECT_SECONDS.labels(device.id, "ok").observe(time.perf_counter() - connect_started)
+                    connect_started = None
+                    print(f"Connected to {device.ble_name} ({device.id})")
+                    set_sensor_connected(device, True)
+                    delay = SENSOR_RECONNECT_DELAY
+                    notifications = NOTIFICATIONS.labels(device.id)
 
                     def notification_handler(_, data):
+                        received = time.perf_counter()
+                        notifications.inc()
                         try:
-                            decoded = data.decode()
-                            payload = json.loads(decoded)
-                            print("Sensor data:", payload)
-                            
-                            temperature_f = (payload.get("T", 0) * 9/5) + 32
-                            latest_data["temperature"] = temperature_f
-                            latest_data["humidity"] = payload.get("H", latest_data["humidity"])
-                            latest_data["pm_levels"] = payload.get("P", latest_data["pm_levels"])
-                            latest_data["voc_levels"] = payload.get("V", latest_data["voc_levels"])
-                            latest_data["timestamp"] = datetime.now().isoformat()
-                            
-                            history_entry = {
-                                **payload,
-                                "timestamp": latest_data["timestamp"]
-                            }
-                            latest_data["history"].append(history_entry)
-                            if len(latest_data["history"]) > 600:
-                                latest_data["history"].pop(0)
-                            
-                            asyncio.create_task(manager.broadcast(json.dumps({
-                                "type": "sensor_data",
-                                "data": latest_data
-                            })))
-                            
-                            asyncio.create_task(handle_auto_control())
-                            
+                            readings = decode_payload(data)
                         except Exception as e:
-                            print("Error decoding sensor data:", e)
+                            DECODE_ERRORS.labels(device.id).inc()
+                            print(f"Error decoding sensor data from {device.id}:", e)
+                            return
+                        DECODE_SECONDS.observe(time.perf_counter() - received)
+                        for age, payload in readings:
+                            ingest_bridge.submit(ingest_sample, device, payload, age, received)
 
                     await client.start_notify(SENSOR_CHAR_UUID, notification_handler)
+                    # Nodes drop back to reporting every reading when they disconnect
+                    device.reporting.applied = None
+                    device.reporting.supported = client.services.get_characteristic(SENSOR_CONFIG_UUID) is not None
+                    if ADAPTIVE_REPORTING and not device.reporting.supported:
+                        print(f"Sensor {device.id} has no config characteristic, it will report every reading")
                     
                     try:
                         while client.is_connected:
-                            await asyncio.sleep(5)
+                            if ADAPTIVE_REPORTING and device.reporting.supported:
+                                await update_reporting(device, client)
+                            await asyncio.sleep(REPORT_POLICY_INTERVAL)
                     except Exception as e:
-                        print(f"Sensor connection lost: {e}")
+                        print(f"Sensor {device.id} connection lost: {e}")
                         
             except Exception as e:
-                print(f"Sensor connection error: {e}")
-                control_status["sensor_connected"] = False
-                await manager.broadcast(json.dumps({
-                    "type": "connection_status",
-                    "sensor_connected": False
-                }))
-                
-            print("Sensor disconnected, attempting reconnection in 5 seconds...")
-            await asyncio.sleep(5)
-
-    async def send_command_to_actuator(command):
-        max_retries = 3
-        retry_delay = 2
-        
-        for attempt in range(max_retries):
-            try:
-                print(f"Attempting to send '{command}' to actuator (attempt {attempt + 1}/{max_retries})")
+                if connect_started is not None:
+                    BLE_CONNECT_SECONDS.labels(device.id, "error").observe(time.perf_counter() - connect_started)
+                print(f"Sensor {device.id} connection error: {e}")
+                # A cached address that no longer connects triggers a fresh scan
+                device_scanner.forget(device.ble_name)
                 
-                device = await BleakScanner.find_device_by_filter(
-                    lambda d, _: d.name == ACTUATOR_NAME,
-                    timeout=10.0
-                )
-                if not device:
-                    print(f"Actuator not found on attempt {attempt + 1}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(retry_delay)
-                        continue
-                    return False
-                
-                async with BleakClient(device, timeout=15.0) as client:
-                    if not client.is_connected:
-                        print("Failed to connect to actuator")
-                        if attempt < max_retries - 1:
-                            await asyncio.sleep(retry_delay)
-                            continue
-                        return False
-                    
-                    await asyncio.sleep(0.5)
-                    
-                    await client.write_gatt_char(ACTUATOR_CHAR_UUID, command.encode())
-                    print(f"Sent command '{command}' to actuator.")
-                    control_status["actuator_last_seen"] = datetime.now().isoformat()
-                    
-                    try:
-                        await asyncio.sleep(0.2)
-                        response = await client.read_gatt_char(ACTUATOR_CHAR_UUID)
-                        response_str = response.decode('utf-8')
-                        print(f"Actuator response: {response_str}")
-                    except Exception as e:
-                        print(f"Could not read actuator response: {e}")
-                    
-                    return True
-                    
-            except Exception as e:
-                print(f"Failed to send command to actuator (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    print(f"Retrying in {retry_delay} seconds...")
-                    await asyncio.sleep(retry_delay)
-                    retry_delay *= 1.5
-                else:
-                    print("All retry attempts failed")
-                    
-        return False
+            if device.connected:
+                set_sensor_connected(device, False)
+            device.reconnects += 1
+            BLE_RECONNECTS.labels(device.id).inc()
+            # Jitter keeps many sensors from hitting the radio in lockstep
+            wait = delay * random.uniform(0.8, 1.2)
+            print(f"Sensor {device.id} disconnected, reconnecting in {wait:.1f} seconds...")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, SENSOR_MAX_RECONNECT_DELAY)
 
-    actuator_lock = asyncio.Lock()
-    
-    async def handle_auto_control():
-        """Handle automatic humidity control with hysteresis"""
-        if not control_status["auto_mode"]:
+    async def update_reporting(device, client):
+        """Re-evaluate a sensor's reporting profile and write its config if that changed"""
+        levels, rates, silent_after = report_thresholds(device)
+        profile = device.reporting.update(device.history, time.time(), levels, rates)
+        config = device.reporting.config(silent_after)
+        applied = device.reporting.applied
+        if applied is not None and applied["profile"] == profile and applied["config"] == config:
             return
-        
-        if not control_status["sensor_connected"]:
+        try:
+            await client.write_gatt_char(SENSOR_CONFIG_UUID, encode_config(config), response=True)
+        except Exception as e:
+            SENSOR_CONFIG_WRITES.labels(device.id, profile, "error").inc()
+            print(f"Failed to set {device.id} reporting to {profile}: {e}")
             return
-            
-        current_humidity = latest_data["humidity"]
-        target = control_status["target_humidity"]
-        hysteresis = control_status["hysteresis"]
+        SENSOR_CONFIG_WRITES.labels(device.id, profile, "ok").inc()
+        device.reporting.applied = {"profile": profile, "config": config}
+        device.reporting.writes += 1
+        print(f"Sensor {device.id} reporting {profile} ({device.reporting.reason})")
 
-        should_run = False
-        
-        if current_humidity > target + hysteresis:
-            should_run = True
-            reason = f"Humidity {current_humidity:.1f}% > {target + hysteresis:.1f}%"
-        elif current_humidity <= target - hysteresis:
-            should_run = False
-            reason = f"Humidity {current_humidity:.1f}% <= {target - hysteresis:.1f}%"
+    async def run_sensor_loops():
+        await asyncio.gather(*(ble_sensor_loop(device) for device in sensors))
+
+    device_scanner = DeviceScanner(BleakScanner, ttl=SCAN_CACHE_TTL)
+    actuator_session = ActuatorSession(ACTUATOR_NAME, ACTUATOR_CHAR_UUID, device_scanner, BleakClient)
+
+    async def send_command_to_actuator(command):
+        """Send a command over the pooled actuator connection"""
+        print(f"Sending '{command}' to actuator")
+        started = time.perf_counter()
+        success = await actuator_session.send(command)
+        ACTUATOR_RTT_SECONDS.labels("ok" if success else "failed").observe(time.perf_counter() - started)
+        if success:
+            print(f"Sent command '{command}' to actuator.")
+            control_status["actuator_last_seen"] = actuator_session.last_seen
         else:
-            should_run = control_status["dehumidifier_enabled"]
-            reason = f"In hysteresis zone ({target:.1f}% - {target + hysteresis:.1f}%)"
-        
-        if should_run != control_status["dehumidifier_enabled"]:
-            if actuator_lock.locked():
-                print("Actuator busy, skipping command")
-                return
-                
-            async with actuator_lock:
-                command = "on" if should_run else "off"
-                print(f"Auto control: {command} - {reason}")
-                
-                success = await send_command_to_actuator(command)
-                if success:
-                    control_status["dehumidifier_enabled"] = should_run
-                    control_status["last_command"] = command.upper()
-                    control_status["auto_control_active"] = True
-                    control_status["success"] = True
-                    
-                    status_update = {
-                        "type": "control_update",
-                        "data": control_status,
-                        "reason": reason
-                    }
-                    await manager.broadcast(json.dumps(status_update))
-                else:
-                    control_status["success"] = False
-                    await manager.broadcast(json.dumps({
-                        "type": "control_update",
-                        "data": control_status,
-                        "reason": "Failed to send command to actuator"
-                    }))
+            print(f"Failed to send command '{command}' to actuator")
+        return success
+
+    def publish_control_update(reason):
+        control_events["sequence"] += 1
+        control_events["reason"] = reason
+        manager.publish(json.dumps({
+            "type": "control_update",
+            "data": control_status,
+            "reason": reason
+        }))
+
+    def publish_job_update(job):
+        info = job.info()
+        control_events["job_sequence"] += 1
+        control_events["jobs"] = control_events["jobs"][-(JOB_UPDATES_SHARED - 1):] + [[control_events["job_sequence"], info]]
+        manager.publish(json.dumps({"type": "control_job", "job": info}))
+
+    def apply_command_result(job, success):
+        """Record the outcome of a manual or restart command in control_status"""
+        if success:
+            enabled = job.command == "on"
+            if enabled != control_status["dehumidifier_enabled"]:
+                humidity_controller.state_changed()
+            control_status["dehumidifier_enabled"] = enabled
+            control_status["last_command"] = job.command.upper()
+            control_status["auto_control_active"] = False
+            reason = f"Actuator turned {job.command} ({job.source})"
         else:
-            if should_run:
-                print(f"Dehumidifier already ON - {reason}")
-            else:
-                print(f"Dehumidifier already OFF - {reason}")
+            reason = f"Failed to turn actuator {job.command} ({job.source})"
+        control_status["success"] = success
+        publish_control_update(reason)
+
+    async def run_actuator_job(job):
+        success = await send_command_to_actuator(job.command)
+        if job.source != "auto":
+            # The auto controller records its own outcome
+            apply_command_result(job, success)
+        return success
+
+    async def send_auto_command(command):
+        return await actuator_jobs.run_command(command, "auto")
+
+    actuator_jobs = CommandQueue(run_actuator_job, publish_job_update)
+    humidity_controller = HumidityController(
+        control_status, send_auto_command, publish_control_update, MIN_COMMAND_INTERVAL, PREDICT_WINDOW
+    )
+
+    async def reconcile_actuator(timeout=60.0):
+        """After a restart, align the restored dehumidifier state with what the actuator reports"""
+        try:
+            await asyncio.wait_for(actuator_session.connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            print("Actuator not reachable, keeping restored state")
+            return
+        reported = await actuator_session.read_state()
+        restored = control_status["dehumidifier_enabled"]
+        # The actuator boots with everything off and reports "Ready"
+        actual = {"SYSTEM ON": True, "SYSTEM OFF": False, "READY": False}.get((reported or "").upper())
+        if actual == restored:
+            print(f"Actuator state matches restored state ({reported})")
+            return
+
+        if actual is not None and control_status["auto_mode"]:
+            # Trust the hardware and let the controller decide from there
+            control_status["dehumidifier_enabled"] = actual
+            humidity_controller.poke()
+            publish_control_update(f"Actuator reported '{reported}' after restart")
+            return
+
+        # Manual mode, or a state we cannot interpret: re-assert what the dashboards show
+        command = "on" if restored else "off"
+        print(f"Re-applying '{command}' after restart (actuator reported '{reported}')")
+        await actuator_jobs.run_command(command, "restart")
 
     def start_ble_thread():
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        loop.run_until_complete(ble_sensor_loop())
+        loop.run_until_complete(run_sensor_loops())
 
 except ImportError:
     print("BLE functionality disabled")
 
 app = FastAPI(title="IoT Hub Dashboard", version="1.0.0")
 
-import os
-
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -286,74 +506,311 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-if os.path.exists("build/static"):
-    app.mount("/static", StaticFiles(directory="build/static"), name="static")
+def device_not_found(device_id):
+    return {"error": f"Unknown device '{device_id}'", "success": False}
 
-@app.get("/api/data")
-async def get_current_data():
-    """Get current sensor readings"""
+def current_data(device):
+    latest = device.latest
     return {
-        "temperature": round(latest_data["temperature"], 1),
-        "humidity": round(latest_data["humidity"], 1),
-        "pm_levels": round(latest_data["pm_levels"], 2),
-        "voc_levels": round(latest_data["voc_levels"], 0),
-        "timestamp": latest_data["timestamp"],
-        "sensor_connected": control_status["sensor_connected"]
+        "device": device.id,
+        "temperature": round(latest["temperature"], 1),
+        "humidity": round(latest["humidity"], 1),
+        "pm_levels": round(latest["pm_levels"], 2),
+        "voc_levels": round(latest["voc_levels"], 0),
+        "pm1_levels": round(latest["pm1_levels"], 2),
+        "pm4_levels": round(latest["pm4_levels"], 2),
+        "pm10_levels": round(latest["pm10_levels"], 2),
+        "nox_levels": round(latest["nox_levels"], 0),
+        "aqi": latest["aqi"],
+        "aqi_category": latest["aqi_category"],
+        "pm25_nowcast": latest["pm25_nowcast"],
+        "voc_nowcast": latest["voc_nowcast"],
+        "voc_category": latest["voc_category"],
+        "timestamp": latest["timestamp"],
+        "sensor_connected": device.connected
     }
 
-@app.get("/api/history")
-async def get_history_data(limit: int = 20):
-    """Get historical sensor data"""
-    recent_history = latest_data["history"][-limit:]
+async def history_data(device, limit, start, end, points=None, bucket=None, field="H", raw=False):
+    try:
+        start_ts = parse_time_param(start)
+        end_ts = parse_time_param(end)
+    except ValueError:
+        return {"error": "from/to must be epoch seconds or ISO-8601 timestamps", "success": False}
+    if points is not None or bucket is not None:
+        return await downsampled_history(device, start_ts, end_ts, points, bucket, field)
+    if limit is None and start_ts is None and end_ts is None:
+        limit = 20
+    
+    oldest_in_memory = device.history.first_timestamp() if HUB_MODE != "worker" else None
+    if raw:
+        # Unfiltered values only live in the store (committed every few seconds)
+        resolution, recent_history = await asyncio.to_thread(
+            history_store.query, device.id, start_ts, end_ts, limit, "raw", True
+        )
+    elif oldest_in_memory is not None and (start_ts is None or start_ts >= oldest_in_memory):
+        resolution = "raw"
+        recent_history = device.history.query(start_ts, end_ts, limit)
+    else:
+        # Without a range the newest samples are wanted, not the tier for a span back to the epoch
+        resolution = "raw" if start_ts is None and end_ts is None else None
+        resolution, recent_history = await asyncio.to_thread(
+            history_store.query, device.id, start_ts, end_ts, limit, resolution
+        )
     return {
+        "device": device.id,
         "history": recent_history,
-        "count": len(recent_history)
+        "count": len(recent_history),
+        "resolution": resolution
     }
 
+async def downsampled_history(device, start_ts, end_ts, points, bucket, field):
+    """History reduced to about points samples (LTTB on field) or to bucket-second min/mean/max"""
+    if field not in HISTORY_FIELDS:
+        return {"error": f"field must be one of {', '.join(HISTORY_FIELDS)}", "success": False}
+    if bucket is not None and bucket <= 0:
+        return {"error": "bucket must be a positive number of seconds", "success": False}
+    if bucket is None and points < 3:
+        return {"error": "points must be at least 3", "success": False}
+    
+    oldest_in_memory = device.history.first_timestamp() if HUB_MODE != "worker" else None
+    live = end_ts is None
+    end_ts = time.time() if live else end_ts
+    if start_ts is None:
+        start_ts = oldest_in_memory if oldest_in_memory is not None else end_ts - HISTORY_CAPACITY
+    in_memory = oldest_in_memory is not None and start_ts >= oldest_in_memory
+    
+    # Snap the range to the output resolution so repeated requests for the same view
+    # hit the cache; a live range stops at the last complete interval (bucket mode
+    # covers [start, end), so nothing of the interval in progress is included)
+    quantum = bucket or max(1.0, (end_ts - start_ts) / points)
+    start_ts = math.floor(start_ts / quantum) * quantum
+    if live:
+        end_ts = math.floor(end_ts / quantum) * quantum
+    key = (device.id, start_ts, end_ts, points, bucket, field)
+    cached = history_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    if bucket is not None:
+        mode = "bucket"
+        if in_memory:
+            resolution, entries = "raw", device.history.aggregate(start_ts, end_ts, bucket)
+        else:
+            resolution, entries = await asyncio.to_thread(
+                history_store.aggregate, device.id, start_ts, end_ts, bucket
+            )
+    else:
+        mode = "lttb"
+        if in_memory:
+            resolution, entries = "raw", device.history.downsample(start_ts, end_ts, points, field)
+        else:
+            # Coarsest stored tier that still leaves LTTB a few candidates per output point
+            span = end_ts - start_ts
+            if span / 3600 >= 2 * points:
+                tier = "1h"
+            elif span / 60 >= 2 * points:
+                tier = "1m"
+            else:
+                tier = "raw"
+            resolution, timestamps, columns = await asyncio.to_thread(
+                history_store.columns, device.id, start_ts, end_ts, tier
+            )
+            entries = entries_at(timestamps, columns, lttb_indices(timestamps, columns[field], points))
+    
+    response = {
+        "device": device.id,
+        "history": entries,
+        "count": len(entries),
+        "resolution": resolution,
+        "downsampled": mode,
+        "from": start_ts,
+        "to": end_ts
+    }
+    # The store only has samples up to its last commit, and LTTB over a rollup tier also
+    # reads the (still open) rollup bucket at end_ts; cache a range only once nothing
+    # more can land in it, so a recent or future "to" is recomputed on every request
+    settled = time.time()
+    if not in_memory:
+        settled -= history_store.flush_interval
+        if mode == "lttb":
+            settled -= dict(ROLLUP_TIERS).get(resolution, 0)
+    if end_ts <= settled:
+        history_cache.put(key, response)
+    return response
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of hub counters and histograms"""
+    if HUB_MODE == "worker":
+        result = await run_control("metrics", exclude=WORKER_METRICS)
+        if "error" in result:
+            return JSONResponse(result, status_code=503)
+        content = result["text"] + registry.render(names=WORKER_METRICS)
+    else:
+        content = registry.render()
+    return Response(content=content, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/devices")
+async def list_devices():
+    """List configured sensors and their connection state"""
+    if HUB_MODE == "worker":
+        return {"devices": [shared_device_info.get(device.id) or device.info() for device in sensors]}
+    return {"devices": [device.info() for device in sensors]}
+
+@app.get("/api/ble/devices")
+async def list_ble_devices():
+    """Every device the background scan has heard, with RSSI and last-seen time"""
+    return await run_control("ble_devices")
+
+async def control_ble_devices():
+    if 'device_scanner' not in globals():
+        return {"error": "BLE functionality disabled", "success": False}
+    return {
+        "scanning": device_scanner.active,
+        "ttl": device_scanner.ttl,
+        "devices": device_scanner.devices()
+    }
+
+async def snapshot_response(request, state, build, wait_for_version, timeout):
+    """Serve a VersionedState from its per-version cached body, honouring
+    If-None-Match and long-polling until wait_for_version is reached"""
+    if wait_for_version is not None:
+        await state.wait_for_version(wait_for_version, min(max(timeout, 0.0), LONG_POLL_MAX_TIMEOUT))
+    headers = {"ETag": state.etag, "X-State-Version": str(state.version), "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == state.etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=state.body(build), media_type="application/json", headers=headers)
+
+@app.get("/api/data")
+async def get_current_data(request: Request, device: str = None,
+                           wait_for_version: int = None, timeout: float = 30.0):
+    """Get current sensor readings (the control sensor unless device is given)"""
+    sensor = sensors.get(device)
+    if sensor is None:
+        return device_not_found(device)
+    return await snapshot_response(request, sensor.latest, lambda: current_data(sensor), wait_for_version, timeout)
+
+@app.get("/api/devices/{device_id}/data")
+async def get_device_data(request: Request, device_id: str,
+                          wait_for_version: int = None, timeout: float = 30.0):
+    """Get current readings for one sensor"""
+    sensor = sensors.get(device_id)
+    if sensor is None:
+        return device_not_found(device_id)
+    return await snapshot_response(request, sensor.latest, lambda: current_data(sensor), wait_for_version, timeout)
+
+@app.get("/api/history")
+async def get_history_data(
+    limit: int = None,
+    start: str = Query(None, alias="from"),
+    end: str = Query(None, alias="to"),
+    device: str = None,
+    points: int = None,
+    bucket: float = None,
+    field: str = "H",
+    raw: bool = False
+):
+    """Get historical sensor data, optionally limited to a from/to time range and
+    downsampled to about `points` samples (LTTB on `field`) or `bucket`-second min/mean/max.
+    Values are filtered; raw=true adds the unfiltered <field>_raw readings."""
+    sensor = sensors.get(device)
+    if sensor is None:
+        return device_not_found(device)
+    return await history_data(sensor, limit, start, end, points, bucket, field, raw)
+
+@app.get("/api/devices/{device_id}/history")
+async def get_device_history(
+    device_id: str,
+    limit: int = None,
+    start: str = Query(None, alias="from"),
+    end: str = Query(None, alias="to"),
+    points: int = None,
+    bucket: float = None,
+    field: str = "H",
+    raw: bool = False
+):
+    """Get historical data for one sensor"""
+    sensor = sensors.get(device_id)
+    if sensor is None:
+        return device_not_found(device_id)
+    return await history_data(sensor, limit, start, end, points, bucket, field, raw)
+
+@app.get("/api/export")
+async def export_history(
+    start: str = Query(None, alias="from"),
+    end: str = Query(None, alias="to"),
+    format: str = "csv",
+    gzip: bool = False,
+    device: str = None,
+    cursor: str = None
+):
+    """Stream every stored sample in a from/to range as CSV or NDJSON, optionally gzipped.
+    Raw samples are kept for HUB_RAW_RETENTION_DAYS (30 by default); older parts of the
+    range come as 1-minute means, marked by the resolution column. Rows carry a cursor
+    column; pass the last one received as ?cursor= to resume."""
+    sensor = sensors.get(device)
+    if sensor is None:
+        return device_not_found(device)
+    if format not in EXPORT_FORMATS:
+        return {"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}", "success": False}
+    try:
+        start_ts = parse_time_param(start)
+        end_ts = parse_time_param(end)
+    except ValueError:
+        return {"error": "from/to must be epoch seconds or ISO-8601 timestamps", "success": False}
+    try:
+        after = parse_cursor(cursor) if cursor else None
+    except ValueError:
+        return {"error": "cursor must be a value from the cursor column of an earlier export", "success": False}
+
+    # Pin an open-ended range so a long export ends even while samples keep arriving
+    end_ts = time.time() if end_ts is None else end_ts
+    chunks = history_store.export(sensor.id, start_ts, end_ts, after)
+    # Synchronous generator: Starlette iterates it in a worker thread, off the event loop
+    body = export_stream(chunks, sensor.id, history_store.sample_fields, format, gzip, header=after is None)
+    filename = f"{sensor.id}-history.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/api/control/status")
-async def get_control_status():
+async def get_control_status(request: Request, wait_for_version: int = None, timeout: float = 30.0):
     """Get dehumidifier control status"""
-    return control_status
+    return await snapshot_response(request, control_status, None, wait_for_version, timeout)
 
-@app.post("/api/control/toggle")
-async def toggle_dehumidifier():
-    """Toggle dehumidifier on/off (manual override)"""
+def job_accepted(job):
+    """Control status plus the queued actuator job; served as 202 Accepted"""
+    return {**control_status, "job": job.info()}
+
+async def control_toggle():
     if control_status["auto_mode"]:
         return {"error": "Cannot manually control while in auto mode", "success": False}
     
-    command = "off" if control_status["dehumidifier_enabled"] else "on"
-    
-    success = await send_command_to_actuator(command)
-        
-    if success:
-        control_status["dehumidifier_enabled"] = not control_status["dehumidifier_enabled"]
-        control_status["last_command"] = command.upper()
-        control_status["success"] = True
-        control_status["auto_control_active"] = False
-    else:
-        control_status["success"] = False
-    
-    return control_status
+    # Toggle relative to where already queued clicks will leave the actuator
+    current = "on" if control_status["dehumidifier_enabled"] else "off"
+    command = "off" if actuator_jobs.desired(current) == "on" else "on"
+    return job_accepted(actuator_jobs.submit(command, "manual"))
 
-@app.post("/api/control/auto")
-async def toggle_auto_mode():
-    """Toggle automatic humidity control"""
-    control_status["auto_mode"] = not control_status["auto_mode"]
+async def control_auto(mode=None):
+    if mode is not None:
+        if mode not in CONTROL_MODES:
+            return {"error": f"Mode must be one of {', '.join(CONTROL_MODES)}", "success": False}
+        control_status["control_mode"] = mode
+        if mode != "predictive":
+            control_status["prediction"] = None
+        control_status["auto_mode"] = True
+    else:
+        control_status["auto_mode"] = not control_status["auto_mode"]
     
     if control_status["auto_mode"]:
-        await handle_auto_control()
-    else:
-        success = await send_command_to_actuator("off")
-        if success:
-            control_status["dehumidifier_enabled"] = False
-            control_status["last_command"] = "OFF"
-            control_status["auto_control_active"] = False
-        
-    return control_status
+        humidity_controller.poke()
+        return control_status
+    return job_accepted(actuator_jobs.submit("off", "manual"))
 
-@app.post("/api/control/target")
-async def set_target_humidity(data: HumidityTarget):
-    """Set target humidity and optional hysteresis"""
+async def control_target(**fields):
+    data = HumidityTarget(**fields)
     if not 20 <= data.target <= 80:
         return {"error": "Target humidity must be between 20% and 80%", "success": False}
     
@@ -362,72 +819,528 @@ async def set_target_humidity(data: HumidityTarget):
         if not 1 <= data.hysteresis <= 10:
             return {"error": "Hysteresis must be between 1% and 10%", "success": False}
         control_status["hysteresis"] = data.hysteresis
+    for field in ("min_on_time", "min_off_time"):
+        value = getattr(data, field)
+        if value is not None:
+            if not 0 <= value <= 3600:
+                return {"error": "Minimum on/off times must be between 0 and 3600 seconds", "success": False}
+            control_status[field] = value
+    if data.predict_horizon is not None:
+        if not 0 <= data.predict_horizon <= 1800:
+            return {"error": "Prediction horizon must be between 0 and 1800 seconds", "success": False}
+        control_status["predict_horizon"] = data.predict_horizon
     
     if control_status["auto_mode"]:
-        await handle_auto_control()
+        humidity_controller.poke()
     
     return control_status
 
+async def control_job(job_id):
+    job = actuator_jobs.get(job_id)
+    if job is None:
+        return {"error": f"Unknown job '{job_id}'", "success": False}
+    return job.info()
+
+class AlertRules(BaseModel):
+    rules: str
+
+def alert_rules_file_signature():
+    try:
+        stat = os.stat(ALERT_RULES_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def load_alert_rules():
+    """(Re)load the rules file if it changed since the last load"""
+    global alert_rules_signature
+    signature = alert_rules_file_signature()
+    if signature == alert_rules_signature:
+        return
+    alert_rules_signature = signature
+    text = ""
+    if signature is not None:
+        with open(ALERT_RULES_PATH) as f:
+            text = f.read()
+    try:
+        alert_engine.load(text)
+        print(f"Loaded {len(alert_engine.rules)} alert rules from {ALERT_RULES_PATH}")
+    except ValueError as e:
+        print(f"Ignoring invalid alert rules in {ALERT_RULES_PATH}: {e}")
+
+async def alert_loop():
+    while True:
+        await asyncio.sleep(ALERT_CHECK_INTERVAL)
+        try:
+            load_alert_rules()
+            alert_engine.check_silence()
+        except Exception as e:
+            print(f"Alert check failed: {e}")
+
+async def control_alerts():
+    return {
+        "active": alert_engine.active(),
+        "rules": [rule.describe() for rule in alert_engine.rules],
+        "fired_total": alert_engine.fired
+    }
+
+async def control_metrics(exclude=()):
+    return {"text": registry.render(exclude=exclude)}
+
+async def control_alert_rules(rules):
+    """Validate, apply and persist a new rule set"""
+    global alert_rules_signature
+    try:
+        alert_engine.load(rules)
+    except ValueError as e:
+        return {"error": f"Invalid alert rules: {e}", "success": False}
+    temp_path = f"{ALERT_RULES_PATH}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(rules)
+    os.replace(temp_path, ALERT_RULES_PATH)
+    alert_rules_signature = alert_rules_file_signature()
+    return {**await control_alerts(), "success": True}
+
+CONTROL_ACTIONS = {
+    "toggle": control_toggle,
+    "auto": control_auto,
+    "target": control_target,
+    "job": control_job,
+    "alerts": control_alerts,
+    "alert_rules": control_alert_rules,
+    "ble_devices": control_ble_devices,
+    "metrics": control_metrics
+}
+
+async def run_control(action, **args):
+    """Carry out a control action here, or in the ingest process when this is an API worker"""
+    if HUB_MODE == "worker":
+        result = await control_client.request(action, args)
+        applied = result.pop("control_state", None)
+        if applied is not None:
+            # Read-your-writes: adopt the state the ingest process just applied instead of
+            # waiting up to SHARED_STATE_INTERVAL for it to come through shared memory
+            status, version = applied
+            if version > control_status.version:
+                control_status.replace(status, version, shared_state.boot_id)
+        return result
+    return await CONTROL_ACTIONS[action](**args)
+
+async def handle_control_request(action, args):
+    """ControlServer handler in the ingest process; the reply carries the control state
+    as of the action so the asking worker can apply it right away"""
+    result = await CONTROL_ACTIONS[action](**args)
+    return {**result, "control_state": [control_status, control_status.version]}
+
+def control_response(result):
+    if "job" in result:
+        return JSONResponse(dict(result), status_code=202)
+    return result
+
+@app.post("/api/control/toggle")
+async def toggle_dehumidifier():
+    """Queue a dehumidifier on/off toggle (manual override); answers 202 with the job"""
+    return control_response(await run_control("toggle"))
+
+@app.post("/api/control/auto")
+async def toggle_auto_mode(mode: str = None):
+    """Toggle automatic humidity control, or with ?mode=hysteresis|predictive
+    switch auto control on in that mode. Switching it off queues an OFF job (202)."""
+    return control_response(await run_control("auto", mode=mode))
+
+@app.get("/api/alerts")
+async def get_alerts():
+    """Alerts currently firing and the rules in force"""
+    return await run_control("alerts")
+
+@app.put("/api/alerts/rules")
+async def set_alert_rules(data: AlertRules):
+    """Replace the alert rules (same text format as the rules file); they take effect immediately"""
+    return await run_control("alert_rules", rules=data.rules)
+
+@app.get("/api/control/jobs/{job_id}")
+async def get_control_job(job_id: str):
+    """Status of a queued actuator command: queued, running, succeeded, failed or superseded"""
+    return await run_control("job", job_id=job_id)
+
+@app.post("/api/control/target")
+async def set_target_humidity(data: HumidityTarget):
+    """Set target humidity and optional hysteresis"""
+    fields = {name: value for name, value in dict(data).items() if value is not None}
+    return await run_control("target", **fields)
+
+# Keys a subscription may select from a device's latest readings
+SUBSCRIBABLE_FIELDS = tuple(sensors.primary.latest)
+
+def handle_client_message(websocket, text):
+    """Apply a client message; {"type": "subscribe", "devices": [...], "fields": [...],
+    "max_rate": n} limits which sensor updates the client gets and how often"""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return
+    if not isinstance(message, dict) or message.get("type") != "subscribe":
+        return
+    try:
+        subscription = Subscription.parse(message, sensors.devices, SUBSCRIBABLE_FIELDS)
+    except ValueError as e:
+        manager.send(websocket, json.dumps({"type": "error", "error": str(e)}))
+        return
+    manager.subscribe(websocket, subscription)
+    manager.send(websocket, json.dumps({"type": "subscribed", **subscription.describe()}))
+    for device in sensors:
+        manager.send_sensor(websocket, device.id, device.latest)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
-        await websocket.send_text(json.dumps({
+        manager.send(websocket, json.dumps({
             "type": "initial_data",
-            "sensor_data": latest_data,
+            "sensor_data": await sensor_snapshot(),
+            "devices": {device.id: current_data(device) for device in sensors},
             "control_status": control_status
         }))
         
         while True:
             try:
-                await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
+                text = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
             except asyncio.TimeoutError:
-                await websocket.send_text(json.dumps({"type": "keepalive"}))
+                manager.send(websocket, json.dumps({"type": "keepalive"}))
+                continue
             except:
                 break
+            handle_client_message(websocket, text)
                 
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
+        pass
     except Exception as e:
         print(f"WebSocket error: {e}")
+    finally:
         manager.disconnect(websocket)
 
 @app.get("/", response_class=HTMLResponse)
-async def serve_react_app():
-    if os.path.exists('build/index.html'):
-        return FileResponse('build/index.html')
+async def serve_react_app(request: Request):
+    await frontend.refresh()
+    if frontend.has_index:
+        return frontend.response(request, frontend.get("index.html"))
     else:
         return HTMLResponse("<h1>IoT Hub Dashboard API</h1><p>Backend running successfully. Frontend files not found.</p>")
 
 @app.get("/{path:path}")
-async def serve_react_routes(path: str):
+async def serve_react_routes(request: Request, path: str):
     if path.startswith("api/"):
         return {"error": "API endpoint not found"}
     
-    if os.path.exists('build/index.html'):
-        return FileResponse('build/index.html')
+    await frontend.refresh()
+    asset = frontend.get(path)
+    if asset is not None:
+        return frontend.response(request, asset)
+    if path.startswith("static/"):
+        return Response(status_code=404)
+    if frontend.has_index:
+        # Client-side routes all render the app
+        return frontend.response(request, frontend.get("index.html"))
     else:
         return {"error": "Frontend not built"}
 
+def control_state():
+    state = {key: control_status[key] for key in PERSISTED_CONTROL_FIELDS}
+    if 'humidity_controller' in globals() and humidity_controller.last_change is not None:
+        # Dwell timers are monotonic; persist the wall-clock time of the last switch
+        state["last_change_at"] = round(time.time() - (time.monotonic() - humidity_controller.last_change), 3)
+    return state
+
+def history_exports():
+    exports = []
+    for device in sensors:
+        timestamps, columns = device.history.export(HISTORY_SNAPSHOT_TAIL)
+        exports.append((device.id, dict(device.latest), timestamps, columns))
+    return exports
+
+def restore_state():
+    """Warm start: reload control settings, latest readings and the history tail from the
+    last snapshots, and the rest of the in-memory history from the SQLite store"""
+    started = time.perf_counter()
+    body = control_snapshot.read()
+    if body:
+        state = json.loads(body)
+        last_change_at = state.pop("last_change_at", None)
+        control_status.update({key: value for key, value in state.items() if key in PERSISTED_CONTROL_FIELDS})
+        if last_change_at is not None and 'humidity_controller' in globals():
+            humidity_controller.last_change = time.monotonic() - max(0.0, time.time() - last_change_at)
+
+    body = history_snapshot.read()
+    snapshots = decode_history(body) if body else {}
+    restored = loaded = backfilled = 0
+    for device in sensors:
+        start = time.time() - HISTORY_CAPACITY
+        tail = snapshots.get(device.id)
+        if tail is not None:
+            device.latest.update(tail[0])
+        # Store rows before the snapshot tail, then the tail, then anything committed after it
+        tail_start = tail[1][0] if tail is not None and len(tail[1]) else None
+        _, timestamps, columns = history_store.columns(
+            device.id, start, None if tail_start is None else tail_start - 1e-6, "raw"
+        )
+        device.history.load(array('d', timestamps), {field: array('d', values) for field, values in columns.items()})
+        loaded += len(timestamps)
+        if tail_start is not None:
+            _, timestamps, columns = tail
+            for i, timestamp in enumerate(timestamps):
+                device.history.append(timestamp, {field: values[i] for field, values in columns.items()})
+            restored += len(timestamps)
+        after = device.history.last_timestamp() or start
+        _, timestamps, columns = history_store.columns(device.id, after + 1e-6, None, "raw")
+        for i, timestamp in enumerate(timestamps):
+            device.history.append(timestamp, {field: values[i] for field, values in columns.items()})
+        backfilled += len(timestamps)
+        # The NowCast needs the last 12 hours, which the hourly rollups already hold
+        for hour_start, totals in history_store.hourly_totals(device.id, ("P", "V"), time.time() - NOWCAST_HOURS * HOUR):
+            device.air_quality.seed(hour_start, totals["P"], totals["V"])
+
+    if 'humidity_controller' in globals():
+        # Warm the slope estimate so predictive control does not start blind
+        history = sensors.primary.history
+        lo, hi = history.index_range(time.time() - PREDICT_WINDOW)
+        timestamps, humidity = history.column_slice("timestamp", lo, hi), history.column_slice("H", lo, hi)
+        for timestamp, value in zip(timestamps, humidity):
+            if not math.isnan(value):
+                humidity_controller.offer(value, timestamp)
+
+    print(f"Restored state: {loaded + backfilled} history samples from the store, {restored} from the snapshot "
+          f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+def save_state(control=True, history=True):
+    if control:
+        control_snapshot.write(json.dumps(control_state()).encode())
+    if history:
+        history_snapshot.write(encode_history(history_exports()))
+
+async def snapshot_loop():
+    """Snapshot control state when it changes and the latest readings and history tail periodically"""
+    saved_control = control_state()
+    last_history = time.monotonic()
+    while True:
+        await asyncio.sleep(CONTROL_SNAPSHOT_INTERVAL)
+        try:
+            state = control_state()
+            if state != saved_control:
+                await asyncio.to_thread(control_snapshot.write, json.dumps(state).encode())
+                saved_control = state
+            if time.monotonic() - last_history >= HISTORY_SNAPSHOT_INTERVAL:
+                last_history = time.monotonic()
+                # Copy on the loop so ingest never races the encoder
+                exports = history_exports()
+                await asyncio.to_thread(lambda: history_snapshot.write(encode_history(exports)))
+        except (OSError, ValueError) as e:
+            print(f"State snapshot failed: {e}")
+
+def shared_device_record(device):
+    return json.dumps({"latest": device.latest, "connected": device.connected, "info": device.info()}).encode()
+
+def shared_control_record():
+    return json.dumps({"status": control_status, **control_events}).encode()
+
+async def publish_shared_state():
+    """Ingest process: copy changed sensor and control state into shared memory"""
+    published = {}
+    failing = set()
+
+    def publish(index, key, version, build):
+        if published.get(index) == key:
+            return
+        # A failed record is not retried until its state changes again, and only its
+        # first failure in a row is logged
+        published[index] = key
+        try:
+            shared_state.write(index, version, build())
+        except ValueError as e:
+            if index not in failing:
+                failing.add(index)
+                print(f"Shared state publish failed: {e}")
+            return
+        if index in failing:
+            failing.discard(index)
+            print(f"Shared state record {index} published again")
+
+    while True:
+        key = (control_status.version, control_events["sequence"], control_events["job_sequence"],
+               control_events["alert_sequence"])
+        publish(CONTROL_RECORD, key, control_status.version, shared_control_record)
+        for index, device in enumerate(sensors, start=1):
+            publish(index, device.latest.version, device.latest.version,
+                    lambda device=device: shared_device_record(device))
+        await asyncio.sleep(SHARED_STATE_INTERVAL)
+
+async def follow_shared_state():
+    """API worker: mirror shared memory into local state and fan changes out to /ws"""
+    seen = {}
+    while True:
+        try:
+            sequence = shared_state.version(CONTROL_RECORD)
+            if sequence and seen.get(CONTROL_RECORD) != sequence:
+                seen[CONTROL_RECORD] = sequence
+                _, version, record = shared_state.read_json(CONTROL_RECORD)
+                # Never step back behind a state already adopted from a control reply
+                if version >= control_status.version:
+                    control_status.replace(record["status"], version, shared_state.boot_id)
+                for job_sequence, info in record["jobs"]:
+                    if job_sequence > control_events["job_sequence"]:
+                        manager.publish(json.dumps({"type": "control_job", "job": info}))
+                control_events["job_sequence"] = record["job_sequence"]
+                for alert_sequence, event in record["alerts"]:
+                    if alert_sequence > control_events["alert_sequence"]:
+                        manager.publish(json.dumps({"type": "alert", "alert": event}), event["device"])
+                control_events["alert_sequence"] = record["alert_sequence"]
+                if record["sequence"] != control_events["sequence"]:
+                    control_events.update(sequence=record["sequence"], reason=record["reason"])
+                    manager.publish(json.dumps({
+                        "type": "control_update",
+                        "data": control_status,
+                        "reason": record["reason"]
+                    }))
+            for index, device in enumerate(sensors, start=1):
+                sequence = shared_state.version(index)
+                if not sequence or seen.get(index) == sequence:
+                    continue
+                seen[index] = sequence
+                _, version, record = shared_state.read_json(index)
+                device.latest.replace(record["latest"], version, shared_state.boot_id)
+                shared_device_info[device.id] = record["info"]
+                if record["connected"] != device.connected:
+                    device.connected = record["connected"]
+                    manager.publish(json.dumps({
+                        "type": "connection_status",
+                        "device": device.id,
+                        "sensor_connected": device.connected
+                    }), device.id)
+                manager.publish_sensor(device.id, device.latest)
+        except (TimeoutError, ValueError) as e:
+            print(f"Shared state read failed: {e}")
+        await asyncio.sleep(SHARED_STATE_INTERVAL)
+
+async def start_worker():
+    global shared_state
+    print(f"API worker {os.getpid()} attaching to shared state {SHARED_STATE_NAME}")
+    frontend.load()
+    metrics_tasks.append(asyncio.create_task(monitor_loop_lag()))
+    shared_state = await asyncio.to_thread(SharedState.attach, SHARED_STATE_NAME)
+    metrics_tasks.append(asyncio.create_task(follow_shared_state()))
+
 @app.on_event("startup")
 async def startup_event():
+    if HUB_MODE == "worker":
+        await start_worker()
+        return
     print("Starting IoT Hub Dashboard...")
+    frontend.load()
+    history_store.start()
+    ingest_bridge.bind(asyncio.get_running_loop())
+    metrics_tasks.append(asyncio.create_task(monitor_loop_lag()))
+    try:
+        restore_state()
+    except Exception as e:
+        print(f"Could not restore saved state, starting fresh: {e}")
+    metrics_tasks.append(asyncio.create_task(snapshot_loop()))
+    for device in sensors:
+        alert_engine.track(device.id)
+    load_alert_rules()
+    metrics_tasks.append(asyncio.create_task(alert_loop()))
+    
+    if 'actuator_session' in globals():
+        device_scanner.start()
+        actuator_session.start()
+        actuator_jobs.start()
+        humidity_controller.start()
+        metrics_tasks.append(asyncio.create_task(reconcile_actuator()))
     
     try:
-        if 'start_ble_thread' in globals():
+        if 'run_sensor_loops' not in globals():
+            print("No BLE ingest started")
+        elif BLE_RUNTIME == "thread":
             ble_thread = threading.Thread(target=start_ble_thread)
             ble_thread.daemon = True
             ble_thread.start()
             print("BLE sensor thread started")
+        else:
+            ble_tasks.append(asyncio.create_task(run_sensor_loops()))
+            print("BLE sensor tasks started on the server loop")
     except:
-        print("No BLE thread started")
+        print("No BLE ingest started")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in ble_tasks + metrics_tasks:
+        task.cancel()
+    if HUB_MODE == "worker":
+        if shared_state is not None:
+            shared_state.close()
+        return
+    if 'actuator_session' in globals():
+        humidity_controller.stop()
+        actuator_jobs.stop()
+        await actuator_session.stop()
+        await device_scanner.stop()
+    try:
+        save_state()
+    except (OSError, ValueError) as e:
+        print(f"Final state snapshot failed: {e}")
+    control_snapshot.close()
+    history_snapshot.close()
+    history_store.close()
+
+def run_ingest():
+    """Entry point of the ingest process: BLE, control and storage without HTTP"""
+    global HUB_MODE
+    # The launcher forks this process after the module was imported as "single"
+    HUB_MODE = "ingest"
+    history_store.flush_interval = INGEST_FLUSH_INTERVAL
+
+    async def main():
+        global shared_state, control_server
+        shared_state = SharedState.create(SHARED_STATE_NAME, 1 + len(sensors), BOOT_ID)
+        control_server = ControlServer(CONTROL_SOCKET_PATH, handle_control_request)
+        await startup_event()
+        metrics_tasks.append(asyncio.create_task(publish_shared_state()))
+        await control_server.start()
+        print(f"Ingest process {os.getpid()} publishing to shared state {SHARED_STATE_NAME}")
+
+        stopping = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(sig, stopping.set)
+        await stopping.wait()
+        await control_server.stop()
+        await shutdown_event()
+        shared_state.close()
+
+    asyncio.run(main())
 
 if __name__ == "__main__":
     print("IoT Hub Dashboard Server")
     print("Access dashboard at: http://localhost:8000")
-    uvicorn.run(
-        app, 
-        host='0.0.0.0', 
-        port=8000,
-        reload=False
-    )
\ No newline at end of file
+    if WORKERS > 1:
+        # uvicorn's workers re-import this module and pick their role from HUB_MODE;
+        # the forked ingest process sets its own in run_ingest
+        os.environ["HUB_MODE"] = "ingest"
+        ingest = Process(target=run_ingest, name="hub-ingest")
+        ingest.start()
+        os.environ["HUB_MODE"] = "worker"
+        try:
+            uvicorn.run(
+                "hub_bluetooth:app",
+                app_dir=os.path.dirname(os.path.abspath(__file__)),
+                host='0.0.0.0',
+                port=8000,
+                workers=WORKERS
+            )
+        finally:
+            ingest.terminate()
+            ingest.join(timeout=30.0)
+    else:
+        uvicorn.run(
+            app, 
+            host='0.0.0.0', 
+            port=8000,
+            reload=False
+        )
\ No newline at end of file
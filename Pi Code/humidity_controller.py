@@ -0,0 +1,267 @@
+import asyncio
+import time
+from collections import deque
+
+CONTROL_MODES = ("hysteresis", "predictive")
+MAX_TIME_TO_THRESHOLD = 24 * 60 * 60
+# How far a published prediction may drift before it is republished, and how often at
+# most; each republish bumps the control_status version, waking long-pollers and
+# invalidating ETags. time_to_threshold uses the larger of 30 s and 10% of its value.
+PREDICTION_DEADBANDS = {"slope_per_min": 0.05, "predicted_humidity": 0.2, "time_to_threshold": 30.0}
+PREDICTION_RELATIVE_DEADBAND = 0.1
+PREDICTION_MIN_INTERVAL = 5.0
+
+class SlopeEstimator:
+    """Least-squares humidity slope over a sliding time window, updated in O(1)
+    per sample from running sums. The time origin is moved up to the oldest sample
+    every rebase_after seconds and the sums recomputed, so t stays small and the
+    add/subtract rounding error of the running sums cannot build up."""
+
+    def __init__(self, window, rebase_after=None):
+        self.window = window
+        self.rebase_after = rebase_after or max(10 * window, 3600.0)
+        self.samples = deque()
+        self.origin = None
+        self.n = 0
+        self.sum_t = self.sum_h = self.sum_tt = self.sum_th = 0.0
+
+    def add(self, timestamp, humidity):
+        if self.origin is None:
+            self.origin = timestamp
+        t = timestamp - self.origin
+        self.samples.append((t, humidity))
+        self._accumulate(t, humidity, 1)
+        while self.samples and t - self.samples[0][0] > self.window:
+            old_t, old_h = self.samples.popleft()
+            self._accumulate(old_t, old_h, -1)
+        if t >= self.rebase_after:
+            self._rebase()
+
+    def _rebase(self):
+        shift = self.samples[0][0]
+        self.origin += shift
+        self.samples = deque((t - shift, h) for t, h in self.samples)
+        self.n = 0
+        self.sum_t = self.sum_h = self.sum_tt = self.sum_th = 0.0
+        for t, h in self.samples:
+            self._accumulate(t, h, 1)
+
+    def _accumulate(self, t, h, sign):
+        self.n += sign
+        self.sum_t += sign * t
+        self.sum_h += sign * h
+        self.sum_tt += sign * t * t
+        self.sum_th += sign * t * h
+
+    def slope(self):
+        """Humidity change in %/s, or None until the window holds enough spread"""
+        if self.n < 3:
+            return None
+        denominator = self.n * self.sum_tt - self.sum_t * self.sum_t
+        if denominator <= 1e-9:
+            return None
+        return (self.n * self.sum_th - self.sum_t * self.sum_h) / denominator
+
+def decide_hysteresis(humidity, running, target, hysteresis):
+    """Classic two-threshold decision: (should_run, reason)"""
+    if humidity > target + hysteresis:
+        return True, f"Humidity {humidity:.1f}% > {target + hysteresis:.1f}%"
+    if humidity <= target - hysteresis:
+        return False, f"Humidity {humidity:.1f}% <= {target - hysteresis:.1f}%"
+    return running, f"In hysteresis zone ({target - hysteresis:.1f}% - {target + hysteresis:.1f}%)"
+
+def decide_predictive(humidity, running, target, hysteresis, slope, horizon):
+    """Trend-aware decision: extrapolate humidity horizon seconds ahead (roughly the
+    Peltier's thermal lag) and switch early when a threshold will be crossed anyway,
+    or late when the trend is already taking humidity back into the band"""
+    if slope is None:
+        return decide_hysteresis(humidity, running, target, hysteresis)
+    upper, lower = target + hysteresis, target - hysteresis
+    predicted = humidity + slope * horizon
+
+    if running:
+        if humidity <= lower:
+            return False, f"Humidity {humidity:.1f}% <= {lower:.1f}%"
+        if humidity < target and predicted <= lower:
+            return False, f"Predicted {predicted:.1f}% <= {lower:.1f}% in {horizon:.0f}s, stopping early"
+        return True, f"Running, predicted {predicted:.1f}% in {horizon:.0f}s"
+
+    if humidity > upper + hysteresis:
+        return True, f"Humidity {humidity:.1f}% far above {upper:.1f}%"
+    if humidity > upper and predicted > upper:
+        return True, f"Humidity {humidity:.1f}% > {upper:.1f}% and not falling"
+    if humidity > target and predicted > upper:
+        return True, f"Predicted {predicted:.1f}% > {upper:.1f}% in {horizon:.0f}s, starting early"
+    if humidity > upper:
+        return False, f"Humidity {humidity:.1f}% > {upper:.1f}% but falling to {predicted:.1f}%, waiting"
+    return False, f"Idle, predicted {predicted:.1f}% in {horizon:.0f}s"
+
+def prediction_changed(old, new):
+    """Whether new differs from the published prediction by more than PREDICTION_DEADBANDS"""
+    if old is None or new is None:
+        return old is not new
+    if old["horizon"] != new["horizon"]:
+        return True
+    for key, deadband in PREDICTION_DEADBANDS.items():
+        if (old[key] is None) != (new[key] is None):
+            return True
+        if old[key] is not None:
+            if key == "time_to_threshold":
+                deadband = max(deadband, PREDICTION_RELATIVE_DEADBAND * abs(old[key]))
+            if abs(old[key] - new[key]) > deadband:
+                return True
+    return False
+
+def predict(humidity, slope, target, hysteresis, horizon, steps=6):
+    """Predicted trajectory and time to the next threshold, for status reporting"""
+    if slope is None:
+        return None
+    upper, lower = target + hysteresis, target - hysteresis
+    time_to_threshold = None
+    if slope > 0 and humidity < upper:
+        time_to_threshold = (upper - humidity) / slope
+    elif slope < 0 and humidity > lower:
+        time_to_threshold = (lower - humidity) / slope
+    if time_to_threshold is not None and time_to_threshold > MAX_TIME_TO_THRESHOLD:
+        time_to_threshold = None
+    return {
+        "slope_per_min": round(slope * 60, 3),
+        "horizon": horizon,
+        "predicted_humidity": round(humidity + slope * horizon, 2),
+        "time_to_threshold": None if time_to_threshold is None else round(time_to_threshold, 1),
+        "trajectory": [
+            [round(horizon * i / steps, 1), round(humidity + slope * horizon * i / steps, 2)]
+            for i in range(steps + 1)
+        ]
+    }
+
+class HumidityController:
+    """Single long-lived auto-control loop.
+
+    Samples are offered into a conflating slot (only the newest humidity is kept),
+    decisions honour minimum ON/OFF dwell times from control_status, and actuator
+    writes are rate-limited. A decision that has to wait is not queued: the loop
+    re-evaluates with the latest humidity once the hold-off expires, so stacked
+    decisions collapse into the final desired state. control_status["control_mode"]
+    selects plain hysteresis or the trend-aware predictive decision."""
+
+    def __init__(self, control_status, send_command, on_update, min_command_interval=10.0, slope_window=300.0):
+        self.control_status = control_status
+        self.send_command = send_command
+        self.on_update = on_update
+        self.min_command_interval = min_command_interval
+
+        self.humidity = None
+        self.slope = SlopeEstimator(slope_window)
+        self.wake = asyncio.Event()
+        self.last_change = None
+        self.last_command_time = None
+        self.commands_sent = 0
+        self.prediction_time = None
+        self.task = None
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def offer(self, humidity, timestamp=None):
+        """Hand the controller the newest humidity reading; never blocks"""
+        self.humidity = humidity
+        self.slope.add(time.time() if timestamp is None else timestamp, humidity)
+        self.wake.set()
+
+    def poke(self):
+        """Re-evaluate now, e.g. after settings or mode changed"""
+        self.wake.set()
+
+    def state_changed(self):
+        """Record an actuator state change made outside the controller (manual control)"""
+        self.last_change = time.monotonic()
+
+    def decide(self, humidity):
+        """Decision for the configured control mode: (should_run, reason)"""
+        status = self.control_status
+        running = status["dehumidifier_enabled"]
+        if status["control_mode"] == "predictive":
+            return decide_predictive(humidity, running, status["target_humidity"], status["hysteresis"],
+                                     self.slope.slope(), status["predict_horizon"])
+        return decide_hysteresis(humidity, running, status["target_humidity"], status["hysteresis"])
+
+    def hold_off(self, running):
+        """Seconds before the actuator may be switched away from its current state"""
+        now = time.monotonic()
+        hold = 0.0
+        if self.last_change is not None:
+            dwell = self.control_status["min_on_time"] if running else self.control_status["min_off_time"]
+            hold = self.last_change + dwell - now
+        if self.last_command_time is not None:
+            hold = max(hold, self.last_command_time + self.min_command_interval - now)
+        return max(0.0, hold)
+
+    async def run(self):
+        recheck_after = None
+        while True:
+            try:
+                if recheck_after is None:
+                    await self.wake.wait()
+                else:
+                    await asyncio.wait_for(self.wake.wait(), timeout=recheck_after)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            try:
+                recheck_after = await self.step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Humidity controller error: {e}")
+                recheck_after = self.min_command_interval
+
+    async def step(self):
+        """Evaluate once; returns seconds until a deferred decision should be re-checked"""
+        status = self.control_status
+        if not status["auto_mode"] or not status["sensor_connected"] or self.humidity is None:
+            return None
+
+        if status["control_mode"] == "predictive":
+            prediction = predict(self.humidity, self.slope.slope(), status["target_humidity"],
+                                 status["hysteresis"], status["predict_horizon"])
+            published = status["prediction"]
+            due = (published is None or prediction is None or self.prediction_time is None
+                   or time.monotonic() - self.prediction_time >= PREDICTION_MIN_INTERVAL)
+            if due and prediction_changed(published, prediction):
+                status["prediction"] = prediction
+                self.prediction_time = time.monotonic()
+        should_run, reason = self.decide(self.humidity)
+        if should_run == status["dehumidifier_enabled"]:
+            return None
+
+        hold = self.hold_off(status["dehumidifier_enabled"])
+        if hold > 0:
+            return hold
+
+        command = "on" if should_run else "off"
+        print(f"Auto control: {command} - {reason}")
+        self.last_command_time = time.monotonic()
+        self.commands_sent += 1
+        success = await self.send_command(command)
+        if success is None:
+            # Superseded by a manual command before it reached the actuator
+            return None
+        if success:
+            status["dehumidifier_enabled"] = should_run
+            status["last_command"] = command.upper()
+            status["auto_control_active"] = True
+            status["success"] = True
+            self.last_change = time.monotonic()
+            self.on_update(reason)
+            return None
+
+        status["success"] = False
+        self.on_update("Failed to send command to actuator")
+        return self.min_command_interval
@@ -0,0 +1,49 @@
+import threading
+from collections import deque
+
+class IngestBridge:
+    """Hands work from BLE callbacks to the server's event loop.
+
+    Calls made on the server loop's own thread run immediately. Calls from any
+    other thread go into a bounded queue (oldest dropped when full) that the
+    server loop drains in one scheduled callback per burst."""
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.pending = deque()
+        self.lock = threading.Lock()
+        self.loop = None
+        self.loop_thread = None
+        self.scheduled = False
+        self.dropped = 0
+
+    def bind(self, loop):
+        """Attach to the server loop; must be called from that loop's thread"""
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+
+    def submit(self, func, *args):
+        if self.loop is None or threading.get_ident() == self.loop_thread:
+            func(*args)
+            return
+
+        with self.lock:
+            if len(self.pending) >= self.maxsize:
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append((func, args))
+            schedule = not self.scheduled
+            self.scheduled = True
+        if schedule:
+            self.loop.call_soon_threadsafe(self._drain)
+
+    def _drain(self):
+        with self.lock:
+            items = list(self.pending)
+            self.pending.clear()
+            self.scheduled = False
+        for func, args in items:
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Ingest bridge handler error: {e}")
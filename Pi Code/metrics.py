@@ -0,0 +1,240 @@
+"""Minimal Prometheus-style instrumentation: counters, gauges and histograms with
+labels, rendered in the text exposition format on /metrics.
+
+Updates are a dict lookup plus an add (histograms add a bisect over the bucket
+bounds), so they are cheap enough to leave on in every hot path."""
+import asyncio
+import bisect
+import math
+import time
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def labels(self, *values):
+        key = tuple(str(value) for value in values)
+        child = self.children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self.children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        self.children.pop(tuple(str(value) for value in values), None)
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            yield self.name, _format_labels(self.labelnames, key), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount=1.0):
+        self.value += amount
+
+    def dec(self, amount=1.0):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount=1.0):
+        self._default.dec(amount)
+
+    def set(self, value):
+        self._default.set(value)
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+class _Timer:
+    __slots__ = ("target", "start")
+
+    def __init__(self, target):
+        self.target = target
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.target.observe(time.perf_counter() - self.start)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, ("le", _format_value(bound))), cumulative
+            labels = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, child.count
+
+class Callback(_Metric):
+    """Metric read from application state at scrape time instead of updated inline.
+    func returns a number, or {label_values_tuple: number} when labelnames are given."""
+
+    def __init__(self, name, help_text, func, kind="gauge", labelnames=()):
+        self.func = func
+        self.kind = kind
+        super().__init__(name, help_text, labelnames)
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        try:
+            result = self.func()
+        except Exception as e:
+            print(f"Metric {self.name} callback failed: {e}")
+            return
+        if not self.labelnames:
+            yield self.name, "", result
+            return
+        for key, value in result.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name, help_text, func, kind="gauge", labelnames=()):
+        return self._register(Callback(name, help_text, func, kind, labelnames))
+
+    def render(self, names=None, exclude=()):
+        """Exposition text for every metric, or only those in names, minus those in exclude"""
+        lines = []
+        for metric in self.metrics.values():
+            if (names is None or metric.name in names) and metric.name not in exclude:
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# Shared by the hub and the actuator session
+BLE_SCAN_SECONDS = registry.histogram(
+    "hub_ble_scan_seconds", "Time spent scanning for a BLE device", ("role", "found"),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0)
+)
+BLE_CONNECT_SECONDS = registry.histogram(
+    "hub_ble_connect_seconds", "Time to establish a BLE connection", ("device", "result"),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0)
+)
+BLE_RECONNECTS = registry.counter("hub_ble_reconnects_total", "BLE reconnect attempts", ("device",))
+ACTUATOR_RTT_SECONDS = registry.histogram(
+    "hub_actuator_command_seconds", "Round-trip time of actuator commands, including waiting for the link",
+    ("result",), buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+)
+ACTUATOR_RETRIES = registry.counter("hub_actuator_retries_total", "Actuator writes retried after a failure")
+EVENT_LOOP_LAG_SECONDS = registry.histogram(
+    "hub_event_loop_lag_seconds", "How late the event loop ran a timer scheduled every interval",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+async def monitor_loop_lag(interval=0.5):
+    """Measure event-loop lag as the overshoot of a periodic sleep"""
+    while True:
+        start = time.monotonic()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, time.monotonic() - start - interval))
@@ -0,0 +1,128 @@
+"""Adaptive sensor reporting: how often each node reports, and how far a value has to
+move before it is worth a notification.
+
+Nodes with the config characteristic (see sensor_frame.encode_config) keep sampling
+every second but only notify when a field moves past its deadband, at most once per
+interval, plus a heartbeat. The hub keeps a node on the "fast" profile while any
+watched field is near, or heading toward, a threshold the hub acts on (alert rules,
+the humidity controller's switching points) and drops it to "slow" once everything
+has stayed clear for STABLE_TIME. It goes back to fast as soon as anything moves."""
+import math
+
+from history_buffer import SENSOR_FIELDS
+
+PROFILES = {
+    # Every reading, as nodes without the config characteristic report
+    "fast": {"interval": 0.0, "heartbeat": 0.0, "deadbands": {}},
+    # Changes of at least the deadband, no more than one per 10 s, and a heartbeat
+    "slow": {
+        "interval": 10.0,
+        "heartbeat": 60.0,
+        "deadbands": {"T": 0.2, "H": 0.5, "P": 1.0, "P1": 1.0, "P4": 1.0, "P10": 1.0, "V": 5.0, "N": 5.0}
+    }
+}
+
+# How close a value (or where its trend is heading) may come to a threshold before
+# the node is switched to fast reporting
+NEAR_MARGINS = {"T": 1.0, "H": 3.0, "P": 5.0, "P1": 5.0, "P4": 5.0, "P10": 5.0, "V": 25.0, "N": 25.0}
+TREND_WINDOW = 300.0    # seconds of history the trend is fitted to
+TREND_HORIZON = 300.0   # how far ahead the trend is extrapolated
+STABLE_TIME = 120.0     # how long everything must stay clear before slowing down
+MIN_HEARTBEAT = 5.0
+
+def trend(history, field, start):
+    """(latest value, least-squares slope per second) of a history field since start;
+    (None, None) without data, slope None with fewer than three samples"""
+    lo, hi = history.index_range(start)
+    points = [
+        (t, value)
+        for t, value in zip(history.column_slice("timestamp", lo, hi), history.column_slice(field, lo, hi))
+        if not math.isnan(value)
+    ]
+    if not points:
+        return None, None
+    latest = points[-1][1]
+    if len(points) < 3:
+        return latest, None
+    origin = points[0][0]
+    n = len(points)
+    mean_t = sum(t - origin for t, _ in points) / n
+    mean_v = sum(value for _, value in points) / n
+    spread = sum((t - origin - mean_t) ** 2 for t, _ in points)
+    if spread <= 1e-9:
+        return latest, None
+    return latest, sum((t - origin - mean_t) * (value - mean_v) for t, value in points) / spread
+
+def report_config(profile, silent_after=None):
+    """The config to write for a profile; the heartbeat stays well inside any silence alert"""
+    config = {**PROFILES[profile]}
+    if config["heartbeat"] and silent_after:
+        config["heartbeat"] = max(MIN_HEARTBEAT, min(config["heartbeat"], silent_after / 2))
+    return config
+
+class ReportPolicy:
+    """One node's reporting profile: what the hub wants and what the node last accepted.
+    update() picks the profile; the caller writes config() when it differs from applied."""
+
+    def __init__(self, stable_time=STABLE_TIME):
+        self.stable_time = stable_time
+        self.profile = "fast"
+        self.reason = "starting up"
+        self.clear_since = None
+        self.applied = None
+        self.supported = None
+        self.writes = 0
+
+    def attention(self, history, now, levels, rates):
+        """Why the node needs fast reporting, or None. levels are (field, threshold) pairs;
+        rates are rate alert rules. Rules on the hourly NowCast fields are left out, since a
+        deadband of a few units barely moves an hourly average."""
+        start = now - TREND_WINDOW
+        trends = {}
+        for field, threshold in levels:
+            if field not in SENSOR_FIELDS:
+                continue
+            if field not in trends:
+                trends[field] = trend(history, field, start)
+            value, slope = trends[field]
+            if value is None:
+                continue
+            projected = value + (slope or 0.0) * TREND_HORIZON
+            margin = NEAR_MARGINS.get(field, 0.0)
+            if min(value, projected) - margin <= threshold <= max(value, projected) + margin:
+                heading = "near" if abs(value - threshold) <= margin else "trending toward"
+                return f"{field} {value:.1f} {heading} {threshold:g}"
+        for rule in rates:
+            if rule.field not in SENSOR_FIELDS:
+                continue
+            if rule.field not in trends:
+                trends[rule.field] = trend(history, rule.field, start)
+            _, slope = trends[rule.field]
+            # Fast once the slope is halfway to the rule's threshold
+            if slope is not None and rule.compare(2 * slope, rule.threshold):
+                return f"{rule.field} changing {slope * 60:+.2f}/min ({rule.name})"
+        return None
+
+    def update(self, history, now, levels, rates):
+        """Re-evaluate the profile; returns it"""
+        reason = self.attention(history, now, levels, rates)
+        if reason is not None:
+            self.clear_since = None
+            self.profile, self.reason = "fast", reason
+        elif self.clear_since is None:
+            self.clear_since = now
+        elif self.profile != "slow" and now - self.clear_since >= self.stable_time:
+            self.profile, self.reason = "slow", f"stable for {self.stable_time:g}s"
+        return self.profile
+
+    def config(self, silent_after=None):
+        return report_config(self.profile, silent_after)
+
+    def info(self):
+        return {
+            "profile": self.profile,
+            "reason": self.reason,
+            "applied": self.applied,
+            "supported": self.supported,
+            "config_writes": self.writes
+        }
@@ -0,0 +1,124 @@
+import json
+import math
+import struct
+
+# Binary sensor frame, little-endian:
+#   header  <BBBB   magic 0xA5, version, reading count, flags (reserved)
+#   reading <I4H4h  node millis, PM1/PM2.5/PM4/PM10 (x10, uint16),
+#                   RH (x100), T (x200), VOC index (x10), NOx index (x10) (int16)
+# Unavailable values are sent as 0xFFFF (uint16) / 0x7FFF (int16).
+# JSON notifications start with "{" and are still accepted from older nodes.
+FRAME_MAGIC = 0xA5
+FRAME_VERSION = 1
+HEADER = struct.Struct("<BBBB")
+READING_V1 = struct.Struct("<I4H4h")
+
+PM_FIELDS = ("P1", "P", "P4", "P10")
+SIGNED_FIELDS = (("H", 100.0), ("T", 200.0), ("V", 10.0), ("N", 10.0))
+UINT16_MISSING = 0xFFFF
+INT16_MISSING = 0x7FFF
+
+class FrameError(ValueError):
+    pass
+
+def _decode_reading_v1(values):
+    millis = values[0]
+    reading = {}
+    for field, raw in zip(PM_FIELDS, values[1:5]):
+        if raw != UINT16_MISSING:
+            reading[field] = raw / 10.0
+    for (field, scale), raw in zip(SIGNED_FIELDS, values[5:9]):
+        if raw != INT16_MISSING:
+            reading[field] = raw / scale
+    return millis, reading
+
+def decode_frame(data):
+    """Decode a binary frame into [(age_seconds, reading)], newest reading at age 0"""
+    if len(data) < HEADER.size:
+        raise FrameError(f"frame too short ({len(data)} bytes)")
+    magic, version, count, _flags = HEADER.unpack_from(data, 0)
+    if magic != FRAME_MAGIC:
+        raise FrameError(f"bad frame magic 0x{magic:02x}")
+    if version != FRAME_VERSION:
+        raise FrameError(f"unsupported frame version {version}")
+    expected = HEADER.size + count * READING_V1.size
+    if len(data) < expected:
+        raise FrameError(f"frame holds {len(data)} bytes, expected {expected}")
+
+    readings = [
+        _decode_reading_v1(values)
+        for values in READING_V1.iter_unpack(bytes(data[HEADER.size:expected]))
+    ]
+    if not readings:
+        return []
+    newest = readings[-1][0]
+    # millis is a uint32 on the node and wraps after ~49 days
+    return [(((newest - millis) & 0xFFFFFFFF) / 1000.0, reading) for millis, reading in readings]
+
+def decode_payload(data):
+    """Decode a sensor notification, binary or legacy JSON, into [(age_seconds, reading)]"""
+    if data and data[0] == FRAME_MAGIC:
+        return decode_frame(data)
+    return [(0.0, json.loads(bytes(data).decode()))]
+
+def reading_units(reading):
+    """A reading's PM1/PM2.5/PM4/PM10/RH/T/VOC/NOx as the node encodes them (missing -> sentinel)"""
+    values = []
+    for field in PM_FIELDS:
+        value = reading.get(field)
+        values.append(UINT16_MISSING if value is None or math.isnan(value)
+                      else max(0, min(UINT16_MISSING - 1, round(value * 10))))
+    for field, scale in SIGNED_FIELDS:
+        value = reading.get(field)
+        values.append(INT16_MISSING if value is None or math.isnan(value)
+                      else max(-INT16_MISSING, min(INT16_MISSING - 1, round(value * scale))))
+    return values
+
+def encode_frame(readings):
+    """Build a v1 frame from [(millis, reading)]; used by simulators and tests"""
+    body = bytearray(HEADER.pack(FRAME_MAGIC, FRAME_VERSION, len(readings), 0))
+    for millis, reading in readings:
+        body += READING_V1.pack(millis & 0xFFFFFFFF, *reading_units(reading))
+    return bytes(body)
+
+# Reporting config written to the node's config characteristic, little-endian:
+#   <BBHH8B  magic 0xC5, version, interval (ms), heartbeat (s),
+#            deadbands per field in reading units (PM x10, RH x100, T x200, VOC/NOx x10),
+#            in the order of CONFIG_FIELDS
+# The node samples every second and notifies a reading once at least interval has passed
+# since the last one it sent and some field moved by its deadband or more, or once
+# heartbeat has passed regardless. Interval 0 and deadband 0 report every reading
+# (the node's default, the same as nodes without the characteristic); heartbeat 0 is off.
+CONFIG_MAGIC = 0xC5
+CONFIG_VERSION = 1
+CONFIG = struct.Struct("<BBHH8B")
+CONFIG_FIELDS = PM_FIELDS + tuple(field for field, _ in SIGNED_FIELDS)
+FIELD_SCALES = {**{field: 10.0 for field in PM_FIELDS}, **dict(SIGNED_FIELDS)}
+DEFAULT_REPORT_CONFIG = {"interval": 0.0, "heartbeat": 0.0, "deadbands": {}}
+
+def encode_config(config):
+    """Pack {"interval": s, "heartbeat": s, "deadbands": {field: units}} for the config characteristic"""
+    deadbands = config.get("deadbands", {})
+    return CONFIG.pack(
+        CONFIG_MAGIC, CONFIG_VERSION,
+        max(0, min(0xFFFF, round(config.get("interval", 0.0) * 1000))),
+        max(0, min(0xFFFF, round(config.get("heartbeat", 0.0)))),
+        *(max(0, min(0xFF, round(deadbands.get(field, 0.0) * FIELD_SCALES[field]))) for field in CONFIG_FIELDS)
+    )
+
+def decode_config(data):
+    """Inverse of encode_config, with deadbands as quantized on the node"""
+    if len(data) != CONFIG.size:
+        raise FrameError(f"config holds {len(data)} bytes, expected {CONFIG.size}")
+    magic, version, interval, heartbeat, *deadbands = CONFIG.unpack(bytes(data))
+    if magic != CONFIG_MAGIC:
+        raise FrameError(f"bad config magic 0x{magic:02x}")
+    if version != CONFIG_VERSION:
+        raise FrameError(f"unsupported config version {version}")
+    return {
+        "interval": interval / 1000.0,
+        "heartbeat": float(heartbeat),
+        "deadbands": {
+            field: raw / FIELD_SCALES[field] for field, raw in zip(CONFIG_FIELDS, deadbands) if raw
+        }
+    }
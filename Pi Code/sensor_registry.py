@@ -0,0 +1,84 @@
+from datetime import datetime
+
+from air_quality import AirQualityIndex
+from history_buffer import HistoryBuffer
+from report_policy import ReportPolicy
+from signal_filters import FilterPipeline
+from versioned_state import VersionedState
+
+def parse_sensor_config(value):
+    """Parse "room=BLEName,room2=BLEName2" (or bare BLE names) into {device_id: ble_name}"""
+    sensors = {}
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        device_id, _, ble_name = item.partition("=")
+        device_id = device_id.strip()
+        sensors[device_id] = ble_name.strip() or device_id
+    return sensors
+
+class SensorDevice:
+    """Per-sensor state: latest readings, history buffer, filters, AQI engine, reporting
+    policy and connection status"""
+
+    def __init__(self, device_id, ble_name, history_capacity, filter_config=None):
+        self.id = device_id
+        self.ble_name = ble_name
+        self.address = None
+        self.connected = False
+        self.reconnects = 0
+        self.latest = VersionedState({
+            "temperature": 0,
+            "humidity": 0,
+            "pm_levels": 0,
+            "voc_levels": 0,
+            "pm1_levels": 0,
+            "pm4_levels": 0,
+            "pm10_levels": 0,
+            "nox_levels": 0,
+            "aqi": None,
+            "aqi_category": None,
+            "pm25_nowcast": None,
+            "voc_nowcast": None,
+            "voc_category": None,
+            "timestamp": datetime.now().isoformat()
+        })
+        self.history = HistoryBuffer(history_capacity)
+        self.filters = FilterPipeline(filter_config or {})
+        self.air_quality = AirQualityIndex()
+        self.reporting = ReportPolicy()
+
+    def info(self):
+        return {
+            "id": self.id,
+            "name": self.ble_name,
+            "address": self.address,
+            "connected": self.connected,
+            "reconnects": self.reconnects,
+            "last_update": self.latest["timestamp"],
+            "samples": len(self.history),
+            "outliers_rejected": self.filters.stats(),
+            "reporting": self.reporting.info()
+        }
+
+class SensorRegistry:
+    """All configured sensors, keyed by device id; the first one drives humidity control"""
+
+    def __init__(self, sensors, history_capacity, filter_config=None):
+        self.devices = {
+            device_id: SensorDevice(device_id, ble_name, history_capacity, filter_config)
+            for device_id, ble_name in sensors.items()
+        }
+        self.primary = next(iter(self.devices.values()))
+
+    def __iter__(self):
+        return iter(self.devices.values())
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, device_id=None):
+        if device_id is None:
+            return self.primary
+        return self.devices.get(device_id)
@@ -0,0 +1,111 @@
+"""Sensor and control state shared between the BLE ingest process and API workers.
+
+The segment holds fixed-size records, one for control status and one per sensor.
+The ingest process is the only writer. Each record is guarded by a seqlock
+sequence number: it goes odd while a write is in progress and even when the
+write completes. Readers copy the payload and retry if the sequence moved, so
+they never block the writer and never see a torn record.
+
+    record: seq u64 | version u64 | length u32 | reserved u32 | JSON payload
+"""
+import json
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+SEGMENT_HEADER = struct.Struct("<4sIII16s")  # magic, layout version, records, record size, boot id
+RECORD_HEADER = struct.Struct("<QQII")
+SEQ = struct.Struct("<Q")
+MAGIC = b"HUBS"
+LAYOUT_VERSION = 1
+CONTROL_RECORD = 0
+
+class SharedState:
+    def __init__(self, shm, records, record_size, boot_id, owner):
+        self.shm = shm
+        self.buf = shm.buf
+        self.records = records
+        self.record_size = record_size
+        self.boot_id = boot_id
+        self.owner = owner
+        self.sequences = [0] * records
+
+    @classmethod
+    def create(cls, name, records, boot_id, record_size=8192):
+        """Create (replacing any stale segment of the same name) as the single writer"""
+        try:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+        except FileNotFoundError:
+            pass
+        size = SEGMENT_HEADER.size + records * record_size
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        SEGMENT_HEADER.pack_into(shm.buf, 0, MAGIC, LAYOUT_VERSION, records, record_size,
+                                 boot_id.encode()[:16].ljust(16, b"\0"))
+        return cls(shm, records, record_size, boot_id, owner=True)
+
+    @classmethod
+    def attach(cls, name, timeout=30.0):
+        """Attach to the segment created by the ingest process, waiting for it to appear"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                shm = shared_memory.SharedMemory(name=name)
+                break
+            except FileNotFoundError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        # Readers must not unlink the segment when they exit (Python < 3.13 tracks attaches too)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        magic, layout, records, record_size, boot_id = SEGMENT_HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or layout != LAYOUT_VERSION:
+            shm.close()
+            raise ValueError(f"shared memory segment {name} has an unexpected layout")
+        return cls(shm, records, record_size, boot_id.rstrip(b"\0").decode(), owner=False)
+
+    def _offset(self, index):
+        return SEGMENT_HEADER.size + index * self.record_size
+
+    def write(self, index, version, payload):
+        """Publish payload (bytes) as record index at version; writer only"""
+        capacity = self.record_size - RECORD_HEADER.size
+        if len(payload) > capacity:
+            raise ValueError(f"record {index} payload of {len(payload)} bytes exceeds {capacity}")
+        offset = self._offset(index)
+        sequence = self.sequences[index] + 1
+        SEQ.pack_into(self.buf, offset, sequence)
+        body = offset + RECORD_HEADER.size
+        self.buf[body:body + len(payload)] = payload
+        RECORD_HEADER.pack_into(self.buf, offset, sequence, version, len(payload), 0)
+        self.sequences[index] = sequence + 1
+        SEQ.pack_into(self.buf, offset, sequence + 1)
+
+    def version(self, index):
+        """Cheap change check: the record's sequence number"""
+        return SEQ.unpack_from(self.buf, self._offset(index))[0]
+
+    def read(self, index, retries=100):
+        """(sequence, version, payload bytes) of a consistent copy of record index"""
+        offset = self._offset(index)
+        for _ in range(retries):
+            sequence, version, length, _ = RECORD_HEADER.unpack_from(self.buf, offset)
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            body = offset + RECORD_HEADER.size
+            payload = bytes(self.buf[body:body + length])
+            if SEQ.unpack_from(self.buf, offset)[0] == sequence:
+                return sequence, version, payload
+        raise TimeoutError(f"record {index} kept changing while being read")
+
+    def read_json(self, index):
+        sequence, version, payload = self.read(index)
+        return sequence, version, json.loads(payload) if payload else None
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,141 @@
+import bisect
+import math
+from collections import deque
+
+class EMA:
+    """Exponential moving average, O(1)"""
+
+    def __init__(self, alpha=0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, x, timestamp):
+        self.value = x if self.value is None else self.value + self.alpha * (x - self.value)
+        return self.value
+
+class RollingMedian:
+    """Median of the last window samples, kept as a sorted copy of the window: a bisect
+    and one short list shift per update, and memory bounded by the window"""
+
+    def __init__(self, window=5):
+        self.window = window
+        self.values = deque()
+        self.sorted = []
+
+    def median(self):
+        n = len(self.sorted)
+        if n % 2:
+            return self.sorted[n // 2]
+        return (self.sorted[n // 2 - 1] + self.sorted[n // 2]) / 2
+
+    def update(self, x, timestamp):
+        self.values.append(x)
+        bisect.insort(self.sorted, x)
+        if len(self.values) > self.window:
+            del self.sorted[bisect.bisect_left(self.sorted, self.values.popleft())]
+        return self.median()
+
+class RateClamp:
+    """Limits how fast the output may change, in units per second"""
+
+    def __init__(self, max_rate=1.0):
+        self.max_rate = max_rate
+        self.value = None
+        self.timestamp = None
+
+    def update(self, x, timestamp):
+        if self.value is not None:
+            step = self.max_rate * max(timestamp - self.timestamp, 0.0)
+            x = min(max(x, self.value - step), self.value + step)
+        self.value, self.timestamp = x, timestamp
+        return x
+
+# Smallest deviation scale Hampel filters assume per field, in the field's own units:
+# about the sensor's quantization and noise floor, so flat readings do not turn every
+# small real change into an outlier
+HAMPEL_MIN_SCALES = {"T": 0.1, "H": 0.3, "P": 1.0, "P1": 1.0, "P4": 1.0, "P10": 1.0, "V": 2.0, "N": 2.0}
+DEFAULT_MIN_SCALE = 0.1
+
+class Hampel:
+    """Outlier rejection: samples further than n_sigmas robust deviations from the
+    rolling median are replaced by it. The scale is the MAD of the whole window,
+    rejected samples included, so an isolated spike is dropped while a real step or
+    ramp passes once it fills half the window. min_scale (None = the field's entry in
+    HAMPEL_MIN_SCALES, set by FilterPipeline) keeps flat readings from rejecting every
+    small change."""
+
+    def __init__(self, window=15, n_sigmas=3.0, min_scale=None):
+        self.median = RollingMedian(window)
+        self.n_sigmas = n_sigmas
+        self.min_scale = min_scale
+        self.rejected = 0
+
+    def update(self, x, timestamp):
+        warm = len(self.median.values) >= self.median.window
+        median = self.median.update(x, timestamp)
+        deviations = sorted(abs(value - median) for value in self.median.values)
+        n = len(deviations)
+        mad = deviations[n // 2] if n % 2 else (deviations[n // 2 - 1] + deviations[n // 2]) / 2
+        # sigma ~ 1.4826 * MAD for Gaussian noise
+        scale = max(1.4826 * mad, self.min_scale or DEFAULT_MIN_SCALE)
+        if warm and abs(x - median) > self.n_sigmas * scale:
+            self.rejected += 1
+            return median
+        return x
+
+FILTER_TYPES = {
+    "ema": EMA,
+    "median": RollingMedian,
+    "clamp": RateClamp,
+    "hampel": Hampel,
+}
+
+def parse_filter_spec(spec):
+    """Parse "H=hampel:15,ema:0.3;P=hampel:15,median:5" into
+    {field: [(filter_name, args), ...]}; arguments are positional numbers"""
+    config = {}
+    for part in spec.split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        field, _, chain = part.partition("=")
+        stages = []
+        for stage in chain.split(","):
+            name, *args = stage.strip().split(":")
+            if name not in FILTER_TYPES:
+                raise ValueError(f"unknown filter '{name}'")
+            stages.append((name, [float(a) if "." in a else int(a) for a in args]))
+        config[field.strip()] = stages
+    return config
+
+class FilterPipeline:
+    """Per-device chain of streaming filters for each configured field"""
+
+    def __init__(self, config):
+        self.config = config
+        self.stages = {
+            field: [FILTER_TYPES[name](*args) for name, args in stages]
+            for field, stages in config.items()
+        }
+        for field, stages in self.stages.items():
+            for stage in stages:
+                if isinstance(stage, Hampel) and stage.min_scale is None:
+                    stage.min_scale = HAMPEL_MIN_SCALES.get(field, DEFAULT_MIN_SCALE)
+
+    def apply(self, payload, timestamp):
+        """Filtered copy of payload; fields without filters pass through unchanged"""
+        filtered = dict(payload)
+        for field, stages in self.stages.items():
+            value = payload.get(field)
+            if value is None or (isinstance(value, float) and math.isnan(value)):
+                continue
+            for stage in stages:
+                value = stage.update(value, timestamp)
+            filtered[field] = value
+        return filtered
+
+    def stats(self):
+        return {
+            field: sum(getattr(stage, "rejected", 0) for stage in stages)
+            for field, stages in self.stages.items()
+        }
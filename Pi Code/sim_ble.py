@@ -0,0 +1,424 @@
+"""Simulated stand-in for the parts of bleak the hubs use.
+
+Select it with HUB_BLE_BACKEND=sim. Simulated devices are configured from the
+environment when this module is imported:
+
+    SIM_SENSORS            number of sensors, named SimSensor0..N-1 (default: one
+                           sensor named SensorDevice, like the real node)
+    SIM_SENSOR_NAMES       explicit comma-separated sensor names instead
+    SIM_RATE               readings per second per sensor (default 1.0); each one is
+                           notified unless the hub's reporting config holds it back
+    SIM_SENSOR_CONFIG      "0" simulates nodes without the reporting config characteristic
+    SIM_FORMAT             "json" (firmware JSON) or "binary" (sensor_frame v1)
+    SIM_BATCH              readings per binary notification (default 1)
+    SIM_ACTUATOR           actuator name (default "Dehumidify"; empty disables it)
+    SIM_ACTUATOR_LATENCY   seconds per actuator write/read (default 0.02)
+    SIM_ACTUATOR_FAILURES  probability that an actuator write fails (default 0.0)
+    SIM_ACTUATOR_STATE     "ON" or "OFF" to start the actuator as if it had already
+                           been commanded, e.g. to exercise hub restarts
+    SIM_CONNECT_LATENCY    seconds to connect (default 0.05)
+    SIM_SCAN_LATENCY       seconds before a scan reports a device (default 0.1)
+    SIM_ADV_INTERVAL       seconds between advertisements of unconnected devices
+                           seen by a running BleakScanner (default 0.5)
+    SIM_REPLAY             NDJSON recording replayed by every sensor instead of
+                           generated values; lines are {"t": secs, "payload": {...}}
+                           or /api/history entries ({"T": ..., "timestamp": ...})
+    SIM_REPLAY_SPEED       replay speed-up factor (default 1.0)
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import time
+from datetime import datetime
+
+from sensor_frame import (CONFIG_FIELDS, DEFAULT_REPORT_CONFIG, FIELD_SCALES, decode_config, encode_config,
+                          encode_frame, reading_units)
+
+SENSOR_CHAR_UUID = "beb5483e-36e1-4688-b7f5-ea07361b26a8"
+SENSOR_CONFIG_UUID = "beb5483f-36e1-4688-b7f5-ea07361b26a8"
+ACTUATOR_CHAR_UUID = "a16beeb4-bf06-4c17-9cec-fbc82db1a016"
+
+class BleakError(Exception):
+    pass
+
+class SimDevice:
+    """Advertised device, shaped like bleak's BLEDevice"""
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.rssi = -60 - random.randint(0, 30)
+        self.connected_client = None
+        self.characteristics = ()
+
+    def __repr__(self):
+        return f"SimDevice({self.name}, {self.address})"
+
+    async def on_connect(self, client):
+        pass
+
+    async def on_disconnect(self, client):
+        pass
+
+class SimSensor(SimDevice):
+    """Sensor node sampling at a fixed rate and notifying the firmware's payload as its
+    reporting config (interval, heartbeat, deadbands) allows"""
+
+    def __init__(self, name, address, rate=1.0, payload_format="json", batch=1, replay=None, replay_speed=1.0,
+                 configurable=True):
+        super().__init__(name, address)
+        self.characteristics = (SENSOR_CHAR_UUID, SENSOR_CONFIG_UUID) if configurable else (SENSOR_CHAR_UUID,)
+        self.rate = rate
+        self.payload_format = payload_format
+        self.batch = max(1, batch)
+        self.replay = replay
+        self.replay_speed = replay_speed
+        self.emitted = 0
+        self.sampled = 0
+        self.config_writes = []
+        self.reset_config()
+        self.phase = random.random() * 2 * math.pi
+        self.task = None
+
+    def reading(self, now):
+        t = now / 600.0 + self.phase
+        return {
+            "T": round(22.0 + 2.0 * math.sin(t), 1),
+            "H": round(45.0 + 10.0 * math.sin(t / 3.0), 1),
+            "P": round(max(0.0, 8.0 + 6.0 * math.sin(t * 2.0) + random.gauss(0, 0.5)), 1),
+            "V": round(100.0 + 20.0 * math.sin(t / 2.0), 2),
+            "P1": round(max(0.0, 5.0 + 3.0 * math.sin(t * 2.0)), 1),
+            "P4": round(max(0.0, 9.0 + 6.0 * math.sin(t * 2.0)), 1),
+            "P10": round(max(0.0, 10.0 + 7.0 * math.sin(t * 2.0)), 1),
+            "N": 1.0
+        }
+
+    def encode(self, readings):
+        if self.payload_format == "binary":
+            return encode_frame(readings)
+        _, reading = readings[-1]
+        return json.dumps({key: reading[key] for key in ("T", "H", "P", "V") if key in reading}).encode()
+
+    def reset_config(self):
+        """Back to reporting every reading, as the firmware does on disconnect"""
+        self.config = DEFAULT_REPORT_CONFIG
+        self.deadband_units = [0] * len(CONFIG_FIELDS)
+        self.last_units = None
+        self.last_sent = None
+
+    def write_config(self, data):
+        self.config = decode_config(data)
+        self.deadband_units = [round(self.config["deadbands"].get(field, 0.0) * FIELD_SCALES[field])
+                               for field in CONFIG_FIELDS]
+        self.config_writes.append((time.time(), self.config))
+
+    def should_report(self, units, now):
+        """The firmware's decision for one reading: heartbeat due, or interval passed and a
+        field moved by at least its deadband (a deadband of 0 takes any reading)"""
+        if self.last_units is None:
+            return True
+        since = now - self.last_sent
+        heartbeat = self.config["heartbeat"]
+        if heartbeat and since >= heartbeat:
+            return True
+        # Half a sample of slack so an interval that is a multiple of the sample period is kept
+        if since + 0.5 / self.rate < self.config["interval"]:
+            return False
+        return any(abs(value - last) >= deadband
+                   for value, last, deadband in zip(units, self.last_units, self.deadband_units))
+
+    async def on_connect(self, client):
+        self.task = asyncio.create_task(self._emit(client))
+
+    async def on_disconnect(self, client):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.reset_config()
+
+    async def _emit(self, client):
+        interval = 1.0 / self.rate
+        pending = []
+        readings = self._replay_readings() if self.replay else None
+        next_time = time.monotonic()
+        while True:
+            if readings is not None:
+                delay, reading = next(readings)
+                next_time += delay
+            else:
+                next_time += interval
+                reading = self.reading(time.time())
+            await asyncio.sleep(max(0.0, next_time - time.monotonic()))
+            self.sampled += 1
+            units = reading_units(reading)
+            now = time.monotonic()
+            if not self.should_report(units, now):
+                continue
+            self.last_units, self.last_sent = units, now
+            if self.payload_format != "binary":
+                pending = []
+            pending.append((int(time.monotonic() * 1000), reading))
+            if self.payload_format == "binary" and len(pending) < self.batch:
+                continue
+            callback = client.notify_callbacks.get(SENSOR_CHAR_UUID)
+            if callback is not None:
+                callback(SENSOR_CHAR_UUID, bytearray(self.encode(pending)))
+                self.emitted += 1
+            pending = []
+
+    def _replay_readings(self):
+        """Yield (delay, reading) from the recording, looping forever"""
+        while True:
+            previous = None
+            for offset, reading in self.replay:
+                delay = 0.0 if previous is None else max(0.0, offset - previous) / self.replay_speed
+                previous = offset
+                yield delay, reading
+
+class SimActuator(SimDevice):
+    """Dehumidifier node accepting ON/OFF writes with configurable latency and failures"""
+
+    def __init__(self, name, address, latency=0.02, failure_rate=0.0, state=None):
+        super().__init__(name, address)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.state = state or "OFF"
+        self.value = f"System {state}".encode() if state else b"Ready"
+        self.writes = []
+        self.characteristics = (ACTUATOR_CHAR_UUID,)
+
+    async def write(self, data):
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise BleakError("simulated write failure")
+        command = bytes(data).decode().strip().upper()
+        self.writes.append((time.time(), command))
+        if command in ("ON", "OFF"):
+            self.state = command
+            self.value = f"System {command}".encode()
+        else:
+            self.value = b"Unknown command"
+
+    async def read(self):
+        await asyncio.sleep(self.latency)
+        return bytearray(self.value)
+
+class AdvertisementData:
+    """The fields of bleak's AdvertisementData the hub reads"""
+
+    def __init__(self, local_name, rssi):
+        self.local_name = local_name
+        self.rssi = rssi
+
+class SimWorld:
+    """Every simulated device in range of the hub"""
+
+    def __init__(self):
+        self.devices = {}
+        self.scan_latency = 0.1
+        self.connect_latency = 0.05
+        self.advertising_interval = 0.5
+
+    def add(self, device):
+        self.devices[device.address] = device
+        return device
+
+    def remove(self, address):
+        device = self.devices.pop(address, None)
+        if device is not None and device.connected_client is not None:
+            asyncio.create_task(device.connected_client._lost())
+
+    def find(self, name_or_address):
+        device = self.devices.get(name_or_address)
+        if device is None:
+            for candidate in self.devices.values():
+                if candidate.name == name_or_address:
+                    return candidate
+        return device
+
+world = SimWorld()
+
+def _address(index):
+    return "SI:M0:%02X:%02X:%02X:%02X" % ((index >> 24) & 0xFF, (index >> 16) & 0xFF, (index >> 8) & 0xFF, index & 0xFF)
+
+def load_recording(path):
+    """Read an NDJSON recording into [(offset_seconds, reading)]"""
+    readings = []
+    start = None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "payload" in entry:
+                offset, reading = float(entry.get("t", 0.0)), entry["payload"]
+            else:
+                stamp = datetime.fromisoformat(entry.pop("timestamp")).timestamp()
+                start = stamp if start is None else start
+                offset, reading = stamp - start, entry
+            readings.append((offset, reading))
+    return readings
+
+def configure_from_env(environ=os.environ):
+    world.devices.clear()
+    world.scan_latency = float(environ.get("SIM_SCAN_LATENCY", 0.1))
+    world.connect_latency = float(environ.get("SIM_CONNECT_LATENCY", 0.05))
+    world.advertising_interval = float(environ.get("SIM_ADV_INTERVAL", 0.5))
+
+    names = [name.strip() for name in environ.get("SIM_SENSOR_NAMES", "").split(",") if name.strip()]
+    if not names and "SIM_SENSORS" in environ:
+        names = [f"SimSensor{i}" for i in range(int(environ["SIM_SENSORS"]))]
+    elif not names:
+        names = ["SensorDevice"]
+    replay = load_recording(environ["SIM_REPLAY"]) if environ.get("SIM_REPLAY") else None
+    for i, name in enumerate(names):
+        world.add(SimSensor(
+            name, _address(i + 1),
+            rate=float(environ.get("SIM_RATE", 1.0)),
+            payload_format=environ.get("SIM_FORMAT", "json"),
+            batch=int(environ.get("SIM_BATCH", 1)),
+            replay=replay,
+            replay_speed=float(environ.get("SIM_REPLAY_SPEED", 1.0)),
+            configurable=environ.get("SIM_SENSOR_CONFIG", "1") != "0"
+        ))
+
+    actuator = environ.get("SIM_ACTUATOR", "Dehumidify")
+    if actuator:
+        world.add(SimActuator(
+            actuator, _address(0),
+            latency=float(environ.get("SIM_ACTUATOR_LATENCY", 0.02)),
+            failure_rate=float(environ.get("SIM_ACTUATOR_FAILURES", 0.0)),
+            state=environ.get("SIM_ACTUATOR_STATE", "").upper() or None
+        ))
+
+class BleakScanner:
+    def __init__(self, detection_callback=None, **kwargs):
+        self.detection_callback = detection_callback
+        self.task = None
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self._advertise())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _advertise(self):
+        """Report every unconnected device once per advertising interval, like a
+        peripheral that stops advertising while it holds a connection"""
+        await asyncio.sleep(world.scan_latency)
+        while True:
+            for device in list(world.devices.values()):
+                if device.connected_client is None and self.detection_callback is not None:
+                    rssi = device.rssi + round(random.gauss(0, 2))
+                    self.detection_callback(device, AdvertisementData(device.name, rssi))
+            await asyncio.sleep(world.advertising_interval)
+
+    @staticmethod
+    async def find_device_by_filter(filterfunc, timeout=10.0, **kwargs):
+        await asyncio.sleep(min(world.scan_latency, timeout))
+        for device in list(world.devices.values()):
+            if filterfunc(device, None):
+                return device
+        return None
+
+    @staticmethod
+    async def discover(timeout=5.0, **kwargs):
+        await asyncio.sleep(min(world.scan_latency, timeout))
+        return list(world.devices.values())
+
+class GattServices:
+    """The lookup half of bleak's BleakGATTServiceCollection"""
+
+    def __init__(self, device):
+        self.device = device
+
+    def get_characteristic(self, char_uuid):
+        return char_uuid if char_uuid in self.device.characteristics else None
+
+class BleakClient:
+    def __init__(self, address_or_device, timeout=10.0, disconnected_callback=None, **kwargs):
+        self.target = getattr(address_or_device, "address", address_or_device)
+        self.timeout = timeout
+        self.disconnected_callback = disconnected_callback
+        self.device = None
+        self.notify_callbacks = {}
+
+    @property
+    def is_connected(self):
+        return self.device is not None
+
+    @property
+    def address(self):
+        return self.target
+
+    @property
+    def services(self):
+        return GattServices(self._require())
+
+    async def connect(self, **kwargs):
+        await asyncio.sleep(world.connect_latency)
+        device = world.find(self.target)
+        if device is None:
+            raise BleakError(f"Device with address {self.target} was not found")
+        if device.connected_client is not None:
+            raise BleakError(f"Device {self.target} is already connected")
+        self.device = device
+        device.connected_client = self
+        await device.on_connect(self)
+        return True
+
+    async def disconnect(self):
+        device, self.device = self.device, None
+        if device is not None:
+            device.connected_client = None
+            await device.on_disconnect(self)
+        return True
+
+    async def _lost(self):
+        await self.disconnect()
+        if self.disconnected_callback is not None:
+            self.disconnected_callback(self)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.disconnect()
+
+    def _require(self):
+        if self.device is None:
+            raise BleakError("Not connected")
+        return self.device
+
+    async def start_notify(self, char_uuid, callback, **kwargs):
+        self._require()
+        self.notify_callbacks[char_uuid] = callback
+
+    async def stop_notify(self, char_uuid):
+        self.notify_callbacks.pop(char_uuid, None)
+
+    async def write_gatt_char(self, char_uuid, data, response=None):
+        device = self._require()
+        if isinstance(device, SimActuator):
+            await device.write(data)
+        elif char_uuid == SENSOR_CONFIG_UUID and char_uuid in device.characteristics:
+            device.write_config(data)
+        else:
+            raise BleakError(f"Characteristic {char_uuid} is not writable")
+
+    async def read_gatt_char(self, char_uuid, **kwargs):
+        device = self._require()
+        if isinstance(device, SimActuator):
+            return await device.read()
+        if char_uuid == SENSOR_CONFIG_UUID and char_uuid in device.characteristics:
+            return bytearray(encode_config(device.config))
+        return bytearray(b"Waiting...")
+
+configure_from_env()
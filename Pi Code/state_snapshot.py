@@ -0,0 +1,158 @@
+"""Crash-safe snapshots of hub state in memory-mapped files.
+
+A SnapshotFile holds two slots. Each write goes to the slot not holding the
+newest snapshot: body first, then a header with a higher sequence number and a
+CRC. A crash mid-write leaves that slot failing its CRC, so read() falls back to
+the other one. Nothing is ever half-replaced."""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+
+HEADER = struct.Struct("<4sQQI")  # magic, sequence, body length, crc32
+MAGIC = b"HSNP"
+
+class SnapshotFile:
+    def __init__(self, path, slot_size=mmap.PAGESIZE):
+        self.path = path
+        self.slot_size = self._round(slot_size)
+        self.file = None
+        self.map = None
+        self.sequence = 0
+        self.slot = 1
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _round(size):
+        return -(-size // mmap.PAGESIZE) * mmap.PAGESIZE
+
+    def _map(self):
+        self.file = open(self.path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        self.slot_size = len(self.map) // 2
+
+    def _unmap(self):
+        if self.map is not None:
+            self.map.close()
+            self.file.close()
+            self.map = self.file = None
+
+    def _slot_payload(self, slot):
+        offset = slot * self.slot_size
+        magic, sequence, length, crc = HEADER.unpack_from(self.map, offset)
+        if magic != MAGIC or length > self.slot_size - HEADER.size:
+            return None, None
+        body = self.map[offset + HEADER.size: offset + HEADER.size + length]
+        if zlib.crc32(body) != crc:
+            return None, None
+        return sequence, body
+
+    def read(self):
+        """Newest intact snapshot body, or None if there is none"""
+        with self.lock:
+            return self._read()
+
+    def _read(self):
+        if self.map is None:
+            if not os.path.exists(self.path):
+                return None
+            size = os.path.getsize(self.path)
+            if size < 2 * HEADER.size or size % (2 * mmap.PAGESIZE):
+                print(f"Ignoring malformed snapshot file {self.path}")
+                return None
+            self._map()
+        newest = None
+        for slot in (0, 1):
+            sequence, body = self._slot_payload(slot)
+            if sequence is not None and (newest is None or sequence > newest[0]):
+                newest = (sequence, slot, body)
+        if newest is None:
+            return None
+        self.sequence, self.slot, body = newest
+        return body
+
+    def write(self, body):
+        """Store body as the new newest snapshot and flush it to disk"""
+        with self.lock:
+            self._write(body)
+
+    def _write(self, body):
+        if self.map is None and os.path.exists(self.path):
+            self._read()
+        needed = HEADER.size + len(body)
+        if self.map is None or needed > self.slot_size:
+            self._recreate(body, max(self._round(needed + needed // 2), self.slot_size))
+            return
+
+        slot = 1 - self.slot
+        offset = slot * self.slot_size
+        self.map[offset + HEADER.size: offset + HEADER.size + len(body)] = body
+        self.map.flush(offset, self.slot_size)
+        HEADER.pack_into(self.map, offset, MAGIC, self.sequence + 1, len(body), zlib.crc32(body))
+        self.map.flush(offset, mmap.PAGESIZE)
+        self.sequence += 1
+        self.slot = slot
+
+    def _recreate(self, body, slot_size):
+        """Grow the file: write a fresh one holding body in slot 0 and swap it in atomically"""
+        self._unmap()
+        self.sequence += 1
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.sequence, len(body), zlib.crc32(body)))
+            f.write(body)
+            f.truncate(2 * slot_size)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self._map()
+        self.slot = 0
+
+    def close(self):
+        with self.lock:
+            self._unmap()
+
+def encode_history(devices):
+    """Pack each device's latest readings and history columns (as returned by
+    HistoryBuffer.export) into one snapshot body"""
+    meta = {"byteorder": sys.byteorder, "devices": []}
+    blobs = []
+    for device_id, latest, timestamps, columns in devices:
+        meta["devices"].append({
+            "id": device_id,
+            "latest": latest,
+            "count": len(timestamps),
+            "fields": list(columns)
+        })
+        blobs.append(timestamps.tobytes())
+        blobs.extend(column.tobytes() for column in columns.values())
+    header = json.dumps(meta).encode()
+    return struct.pack("<I", len(header)) + header + b"".join(blobs)
+
+def decode_history(body):
+    """{device_id: (latest, timestamps, {field: values})} from encode_history output"""
+    view = memoryview(body)
+    (header_length,) = struct.unpack_from("<I", view)
+    meta = json.loads(bytes(view[4:4 + header_length]))
+    if meta["byteorder"] != sys.byteorder:
+        return {}
+    offset = 4 + header_length
+    devices = {}
+    for entry in meta["devices"]:
+        size = entry["count"] * 8
+
+        def take():
+            nonlocal offset
+            values = array('d')
+            values.frombytes(view[offset:offset + size])
+            offset += size
+            return values
+
+        timestamps = take()
+        columns = {field: take() for field in entry["fields"]}
+        devices[entry["id"]] = (entry["latest"], timestamps, columns)
+    return devices
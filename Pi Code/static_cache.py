@@ -0,0 +1,122 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import time
+
+from fastapi.responses import Response
+
+# Create React App fingerprints everything under static/ (main.94c66378.js)
+HASHED_ASSET = re.compile(r"^static/.*\.[0-9a-f]{8,}\.")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/manifest+json")
+
+def accepts_gzip(header):
+    """True if an Accept-Encoding header allows gzip (q=0 opts out; an unreadable q counts as 1)"""
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        if coding.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            if not q.startswith("q="):
+                return True
+            try:
+                return float(q[2:] or 0) != 0
+            except ValueError:
+                return True
+    return False
+
+class StaticAsset:
+    __slots__ = ("body", "gzipped", "content_type", "etag", "cache_control")
+
+    def __init__(self, path, body):
+        self.body = body
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            self.content_type += "; charset=utf-8"
+        self.etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+        self.cache_control = IMMUTABLE if HASHED_ASSET.match(path) else REVALIDATE
+        self.gzipped = None
+        if len(body) >= 512 and self.content_type.startswith(COMPRESSIBLE):
+            compressed = gzip.compress(body, compresslevel=9, mtime=0)
+            if len(compressed) < len(body) * 0.9:
+                self.gzipped = compressed
+
+class StaticBundle:
+    """The React build held in memory with gzip variants built once at load.
+
+    Responses negotiate Accept-Encoding, carry ETags and answer If-None-Match with
+    304. Fingerprinted assets are immutable; everything else must revalidate. The
+    build is reloaded when index.html changes on disk, checked at most every
+    check_interval seconds."""
+
+    def __init__(self, root, check_interval=2.0):
+        self.root = root
+        self.check_interval = check_interval
+        self.assets = {}
+        self.signature = None
+        self.last_check = 0.0
+        self.reloading = None
+
+    def _signature(self):
+        try:
+            stat = os.stat(os.path.join(self.root, "index.html"))
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        signature = self._signature()
+        assets = {}
+        if signature is not None:
+            started = time.perf_counter()
+            for directory, _, files in os.walk(self.root):
+                for name in files:
+                    full_path = os.path.join(directory, name)
+                    path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                    with open(full_path, "rb") as f:
+                        assets[path] = StaticAsset(path, f.read())
+            raw = sum(len(a.body) for a in assets.values())
+            sent = sum(len(a.gzipped or a.body) for a in assets.values())
+            print(f"Loaded frontend build: {len(assets)} files, {raw // 1024} KiB ({sent // 1024} KiB gzipped) "
+                  f"in {(time.perf_counter() - started) * 1000:.0f} ms")
+        self.assets = assets
+        self.signature = signature
+        self.last_check = time.monotonic()
+
+    async def refresh(self):
+        """Reload in a worker thread if the build changed since it was loaded"""
+        now = time.monotonic()
+        if now - self.last_check < self.check_interval:
+            return
+        self.last_check = now
+        if self._signature() == self.signature:
+            return
+        if self.reloading is None:
+            self.reloading = asyncio.ensure_future(asyncio.to_thread(self.load))
+        try:
+            await asyncio.shield(self.reloading)
+        finally:
+            self.reloading = None
+
+    @property
+    def has_index(self):
+        return "index.html" in self.assets
+
+    def get(self, path):
+        return self.assets.get(path)
+
+    def response(self, request, asset):
+        gzipped = asset.gzipped is not None and accepts_gzip(request.headers.get("accept-encoding"))
+        etag = asset.etag[:-1] + '-gz"' if gzipped else asset.etag
+        headers = {"ETag": etag, "Cache-Control": asset.cache_control}
+        if asset.gzipped is not None:
+            headers["Vary"] = "Accept-Encoding"
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+        return Response(content=asset.gzipped if gzipped else asset.body, media_type=asset.content_type, headers=headers)
@@ -0,0 +1,75 @@
+import asyncio
+import json
+import time
+
+# Distinguishes versions (and ETags) across hub restarts
+BOOT_ID = format(int(time.time() * 1000), "x")
+
+class VersionedState(dict):
+    """A dict that bumps a monotonic version whenever a value changes, caches its
+    serialized response per version and lets callers wait for a newer version.
+    Must only be mutated from the server's event loop."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+        self.boot_id = BOOT_ID
+        self._body = None
+        self._body_version = -1
+        self._waiter = None
+
+    def __setitem__(self, key, value):
+        if key in self and dict.__getitem__(self, key) == value:
+            return
+        super().__setitem__(key, value)
+        self.touch()
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def touch(self):
+        """Mark the state changed, e.g. when something it is rendered with changed"""
+        self.version += 1
+        self._wake()
+
+    def replace(self, values, version, boot_id=None):
+        """Adopt state published by another process at that process's version, so
+        versions and ETags agree across API workers"""
+        dict.clear(self)
+        dict.update(self, values)
+        self.version = version
+        if boot_id is not None:
+            self.boot_id = boot_id
+        self._wake()
+
+    def _wake(self):
+        if self._waiter is not None:
+            self._waiter.set()
+            self._waiter = None
+
+    @property
+    def etag(self):
+        return f'"{self.boot_id}-{self.version}"'
+
+    def body(self, build=None):
+        """Serialized JSON for the current version, built at most once per version"""
+        if self._body_version != self.version:
+            self._body = json.dumps(build() if build else dict(self)).encode()
+            self._body_version = self.version
+        return self._body
+
+    async def wait_for_version(self, version, timeout):
+        """Wait until the state reaches version; returns False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self.version < version:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._waiter is None:
+                self._waiter = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._waiter.wait(), remaining)
+            except asyncio.TimeoutError:
+                return False
+        return True